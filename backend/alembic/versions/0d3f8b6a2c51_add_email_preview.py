@@ -0,0 +1,37 @@
+"""add_email_preview
+
+Revision ID: 0d3f8b6a2c51
+Revises: e2b97d15c830
+Create Date: 2026-10-18 15:41:36.207719
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0d3f8b6a2c51'
+down_revision: Union[str, None] = 'e2b97d15c830'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('preview', sa.String(length=200), nullable=True))
+    # Close to app.services.ingest.make_preview: drop "> " lines, collapse
+    # whitespace. New mail gets the full treatment at ingest.
+    op.execute(r"""
+        UPDATE emails SET preview = left(
+            btrim(regexp_replace(
+                regexp_replace(coalesce(body_text, ''), '^\s*>.*$', '', 'gn'),
+                '\s+', ' ', 'g'
+            )),
+            200
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('emails', 'preview')
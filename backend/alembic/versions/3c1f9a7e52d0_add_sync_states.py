@@ -0,0 +1,41 @@
+"""add_sync_states
+
+Revision ID: 3c1f9a7e52d0
+Revises: 74fe1ff71c46
+Create Date: 2026-10-18 09:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f9a7e52d0'
+down_revision: Union[str, None] = '74fe1ff71c46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'sync_states',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=True),
+        sa.Column('folder', sa.String(), nullable=False),
+        sa.Column('uidvalidity', sa.BigInteger(), nullable=True),
+        sa.Column('last_uid', sa.BigInteger(), nullable=False),
+        sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['account_id'], ['email_accounts.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('account_id', 'folder', name='uq_sync_states_account_folder'),
+    )
+    op.create_index(op.f('ix_sync_states_id'), 'sync_states', ['id'], unique=False)
+    op.create_index(op.f('ix_sync_states_account_id'), 'sync_states', ['account_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_sync_states_account_id'), table_name='sync_states')
+    op.drop_index(op.f('ix_sync_states_id'), table_name='sync_states')
+    op.drop_table('sync_states')
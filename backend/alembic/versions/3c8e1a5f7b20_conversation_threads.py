@@ -0,0 +1,91 @@
+"""conversation_threads
+
+Revision ID: 3c8e1a5f7b20
+Revises: f18c2a7e9d04
+Create Date: 2026-10-18 19:12:05.447310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c8e1a5f7b20'
+down_revision: Union[str, None] = 'f18c2a7e9d04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'threads',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('subject', sa.Text(), nullable=True),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('latest_at', sa.DateTime(), nullable=True),
+        sa.Column('latest_email_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_threads_id'), 'threads', ['id'], unique=False)
+    op.create_table(
+        'thread_refs',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.String(), nullable=False),
+        sa.Column('thread_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['thread_id'], ['threads.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'message_id'),
+    )
+    op.add_column('emails', sa.Column('thread_id', sa.Integer(), nullable=True))
+    op.create_foreign_key(
+        'emails_thread_id_fkey', 'emails', 'threads', ['thread_id'], ['id'], ondelete='SET NULL'
+    )
+
+    # References were never stored, so existing mail starts as one thread
+    # per message; replies synced from now on join them by Message-ID
+    op.execute(r"""
+        INSERT INTO threads (user_id, subject, message_count, latest_at, latest_email_id, created_at)
+        SELECT user_id,
+               btrim(regexp_replace(coalesce(subject, ''), '^\s*((re|fwd?|aw|sv)\s*(\[\d+\])?\s*:\s*)+', '', 'i')),
+               1, received_at, id, now()
+        FROM emails
+        WHERE user_id IS NOT NULL
+    """)
+    op.execute("""
+        UPDATE emails SET thread_id = threads.id
+        FROM threads
+        WHERE threads.latest_email_id = emails.id
+    """)
+    op.execute(r"""
+        INSERT INTO thread_refs (user_id, message_id, thread_id)
+        SELECT user_id, coalesce(substring(message_id from '<[^<>\s]+>'), btrim(message_id)), thread_id
+        FROM emails
+        WHERE thread_id IS NOT NULL AND message_id IS NOT NULL
+        ON CONFLICT DO NOTHING
+    """)
+
+    op.create_index(op.f('ix_thread_refs_thread_id'), 'thread_refs', ['thread_id'], unique=False)
+    op.create_index(
+        'ix_threads_user_latest', 'threads',
+        ['user_id', sa.text('latest_at DESC'), sa.text('id DESC')], unique=False,
+    )
+    op.create_index(
+        'ix_emails_thread_received', 'emails',
+        ['thread_id', sa.text('received_at DESC'), sa.text('id DESC')], unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_thread_received', table_name='emails')
+    op.drop_constraint('emails_thread_id_fkey', 'emails', type_='foreignkey')
+    op.drop_column('emails', 'thread_id')
+    op.drop_index(op.f('ix_thread_refs_thread_id'), table_name='thread_refs')
+    op.drop_table('thread_refs')
+    op.drop_index('ix_threads_user_latest', table_name='threads')
+    op.drop_index(op.f('ix_threads_id'), table_name='threads')
+    op.drop_table('threads')
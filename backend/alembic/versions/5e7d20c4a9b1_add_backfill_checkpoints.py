@@ -0,0 +1,44 @@
+"""add_backfill_checkpoints
+
+Revision ID: 5e7d20c4a9b1
+Revises: b84e2d6a0f13
+Create Date: 2026-10-18 13:05:27.114820
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e7d20c4a9b1'
+down_revision: Union[str, None] = 'b84e2d6a0f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('sync_states', sa.Column('backfill_status', sa.String(), nullable=True))
+    op.add_column('sync_states', sa.Column('backfill_uidvalidity', sa.BigInteger(), nullable=True))
+    op.add_column('sync_states', sa.Column('backfill_start_uid', sa.BigInteger(), nullable=True))
+    op.add_column('sync_states', sa.Column('backfill_cursor', sa.BigInteger(), nullable=True))
+    op.add_column('sync_states', sa.Column('backfill_done', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('sync_states', sa.Column('backfill_total', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('sync_states', sa.Column('backfill_bytes', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('sync_states', sa.Column('backfill_error', sa.Text(), nullable=True))
+    op.add_column('sync_states', sa.Column('backfill_started_at', sa.DateTime(), nullable=True))
+    op.add_column('sync_states', sa.Column('backfill_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('sync_states', 'backfill_updated_at')
+    op.drop_column('sync_states', 'backfill_started_at')
+    op.drop_column('sync_states', 'backfill_error')
+    op.drop_column('sync_states', 'backfill_bytes')
+    op.drop_column('sync_states', 'backfill_total')
+    op.drop_column('sync_states', 'backfill_done')
+    op.drop_column('sync_states', 'backfill_cursor')
+    op.drop_column('sync_states', 'backfill_start_uid')
+    op.drop_column('sync_states', 'backfill_uidvalidity')
+    op.drop_column('sync_states', 'backfill_status')
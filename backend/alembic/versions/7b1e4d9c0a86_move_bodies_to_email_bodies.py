@@ -0,0 +1,106 @@
+"""move_bodies_to_email_bodies
+
+Revision ID: 7b1e4d9c0a86
+Revises: 0d3f8b6a2c51
+Create Date: 2026-10-18 16:27:52.661043
+
+"""
+import hashlib
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b1e4d9c0a86'
+down_revision: Union[str, None] = '0d3f8b6a2c51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH = 1000
+
+
+def _hash(text, html):
+    # Same as app.services.bodies.body_hash
+    digest = hashlib.sha256()
+    digest.update((text or '').encode())
+    digest.update(b'\0')
+    digest.update((html or '').encode())
+    return digest.hexdigest()
+
+
+def upgrade() -> None:
+    op.create_table('email_bodies',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('text_z', sa.LargeBinary(), nullable=False),
+    sa.Column('html_z', sa.LargeBinary(), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    # Already zlib-compressed; TOAST compressing it again only burns CPU
+    op.execute('ALTER TABLE email_bodies ALTER COLUMN text_z SET STORAGE EXTERNAL')
+    op.execute('ALTER TABLE email_bodies ALTER COLUMN html_z SET STORAGE EXTERNAL')
+    op.add_column('emails', sa.Column('body_hash', sa.String(length=64), nullable=True))
+
+    # Compress in Python (Postgres has no zlib), a batch at a time
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text(
+            'SELECT id, body_text, body_html FROM emails WHERE id > :last_id ORDER BY id LIMIT :batch'
+        ), {'last_id': last_id, 'batch': BATCH}).all()
+        if not rows:
+            break
+        bodies = {}
+        updates = []
+        for email_id, text, html in rows:
+            key = _hash(text, html)
+            bodies[key] = {
+                'hash': key,
+                'text_z': zlib.compress((text or '').encode(), 6),
+                'html_z': zlib.compress(html.encode(), 6) if html else None,
+                'size': len((text or '').encode()) + len((html or '').encode()),
+            }
+            updates.append({'id': email_id, 'body_hash': key})
+        conn.execute(sa.text(
+            'INSERT INTO email_bodies (hash, text_z, html_z, size, created_at) '
+            'VALUES (:hash, :text_z, :html_z, :size, now()) ON CONFLICT (hash) DO NOTHING'
+        ), list(bodies.values()))
+        conn.execute(sa.text('UPDATE emails SET body_hash = :body_hash WHERE id = :id'), updates)
+        last_id = rows[-1][0]
+
+    op.create_foreign_key('fk_emails_body_hash', 'emails', 'email_bodies', ['body_hash'], ['hash'])
+    op.drop_column('emails', 'body_html')
+    op.drop_column('emails', 'body_text')
+
+
+def downgrade() -> None:
+    op.add_column('emails', sa.Column('body_text', sa.Text(), nullable=True))
+    op.add_column('emails', sa.Column('body_html', sa.Text(), nullable=True))
+
+    conn = op.get_bind()
+    last_hash = ''
+    while True:
+        rows = conn.execute(sa.text(
+            'SELECT hash, text_z, html_z FROM email_bodies WHERE hash > :last_hash ORDER BY hash LIMIT :batch'
+        ), {'last_hash': last_hash, 'batch': BATCH}).all()
+        if not rows:
+            break
+        conn.execute(sa.text(
+            'UPDATE emails SET body_text = :body_text, body_html = :body_html WHERE body_hash = :hash'
+        ), [
+            {
+                'hash': key,
+                'body_text': zlib.decompress(text_z).decode(),
+                'body_html': zlib.decompress(html_z).decode() if html_z else None,
+            }
+            for key, text_z, html_z in rows
+        ])
+        last_hash = rows[-1][0]
+
+    op.drop_constraint('fk_emails_body_hash', 'emails', type_='foreignkey')
+    op.drop_column('emails', 'body_hash')
+    op.drop_table('email_bodies')
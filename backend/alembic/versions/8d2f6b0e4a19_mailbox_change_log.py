@@ -0,0 +1,53 @@
+"""mailbox_change_log
+
+Revision ID: 8d2f6b0e4a19
+Revises: 3c8e1a5f7b20
+Create Date: 2026-10-18 19:47:31.902614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f6b0e4a19'
+down_revision: Union[str, None] = '3c8e1a5f7b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'mailbox_seqs',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.BigInteger(), nullable=False),
+        sa.Column('trimmed_to', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+    op.create_table(
+        'mailbox_changes',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('seq', sa.BigInteger(), nullable=False),
+        sa.Column('email_id', sa.Integer(), nullable=False),
+        sa.Column('op', sa.String(length=8), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'seq'),
+    )
+    op.create_index(op.f('ix_mailbox_changes_created_at'), 'mailbox_changes', ['created_at'], unique=False)
+
+    # Mail from before the log has no entries: start those users past a
+    # "trimmed" seq 1, so a since=0 client is told to do a full fetch
+    op.execute("""
+        INSERT INTO mailbox_seqs (user_id, seq, trimmed_to)
+        SELECT DISTINCT user_id, 1, 1 FROM emails WHERE user_id IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_mailbox_changes_created_at'), table_name='mailbox_changes')
+    op.drop_table('mailbox_changes')
+    op.drop_table('mailbox_seqs')
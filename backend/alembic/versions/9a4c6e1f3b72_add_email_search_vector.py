@@ -0,0 +1,37 @@
+"""add_email_search_vector
+
+Revision ID: 9a4c6e1f3b72
+Revises: 5e7d20c4a9b1
+Create Date: 2026-10-18 14:22:48.390164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4c6e1f3b72'
+down_revision: Union[str, None] = '5e7d20c4a9b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+    op.add_column('emails', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    # Same expression as app.services.search.search_vector
+    op.execute("""
+        UPDATE emails SET search_vector =
+            setweight(to_tsvector('english'::regconfig, coalesce(subject, '')), 'A') ||
+            setweight(to_tsvector('english'::regconfig, coalesce(regexp_replace(from_address, '[@.<>"]+', ' ', 'g'), '')), 'B') ||
+            setweight(to_tsvector('english'::regconfig, coalesce(body_text, '')), 'C')
+    """)
+    op.create_index('ix_emails_user_search', 'emails', ['user_id', 'search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_user_search', table_name='emails', postgresql_using='gin')
+    op.drop_column('emails', 'search_vector')
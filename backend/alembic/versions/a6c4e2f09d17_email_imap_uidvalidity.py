@@ -0,0 +1,36 @@
+"""email_imap_uidvalidity
+
+Revision ID: a6c4e2f09d17
+Revises: 8d2f6b0e4a19
+Create Date: 2026-10-19 09:12:05.448310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c4e2f09d17'
+down_revision: Union[str, None] = '8d2f6b0e4a19'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('emails', sa.Column('imap_uidvalidity', sa.BigInteger(), nullable=True))
+    # Rows with a UID were synced under the folder's current high-water
+    # state, the closest record there is; rows left NULL are not written back
+    op.execute("""
+        UPDATE emails e
+        SET imap_uidvalidity = s.uidvalidity
+        FROM sync_states s
+        WHERE s.account_id = e.account_id
+          AND s.folder = COALESCE(e.imap_folder, 'INBOX')
+          AND e.imap_uid IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('emails', 'imap_uidvalidity')
@@ -0,0 +1,31 @@
+"""per_user_message_id_unique
+
+Revision ID: b84e2d6a0f13
+Revises: 3c1f9a7e52d0
+Create Date: 2026-10-18 11:40:03.552917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b84e2d6a0f13'
+down_revision: Union[str, None] = '3c1f9a7e52d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # message_id was globally unique; make it unique per user instead
+    op.drop_index('ix_emails_message_id', table_name='emails')
+    op.create_index(op.f('ix_emails_message_id'), 'emails', ['message_id'], unique=False)
+    op.create_unique_constraint('uq_emails_user_message_id', 'emails', ['user_id', 'message_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_emails_user_message_id', 'emails', type_='unique')
+    op.drop_index(op.f('ix_emails_message_id'), table_name='emails')
+    op.create_index('ix_emails_message_id', 'emails', ['message_id'], unique=True)
@@ -0,0 +1,49 @@
+"""add_mailbox_counters
+
+Revision ID: c5a0e3b8d417
+Revises: 7b1e4d9c0a86
+Create Date: 2026-10-18 17:48:05.530219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5a0e3b8d417'
+down_revision: Union[str, None] = '7b1e4d9c0a86'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('mailbox_counters',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('unread', sa.Integer(), nullable=False),
+    sa.Column('starred', sa.Integer(), nullable=False),
+    sa.Column('archived', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'category')
+    )
+    # Same counting rules as app.services.counters.reconcile_user
+    op.execute("""
+        INSERT INTO mailbox_counters (user_id, category, total, unread, starred, archived, updated_at)
+        SELECT user_id, coalesce(ai_category, 'uncategorized'),
+               count(*),
+               count(*) FILTER (WHERE is_read IS NOT TRUE),
+               count(*) FILTER (WHERE is_starred IS TRUE),
+               count(*) FILTER (WHERE is_archived IS TRUE),
+               now()
+        FROM emails
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id, coalesce(ai_category, 'uncategorized')
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('mailbox_counters')
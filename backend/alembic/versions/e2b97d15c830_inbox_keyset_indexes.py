@@ -0,0 +1,36 @@
+"""inbox_keyset_indexes
+
+Revision ID: e2b97d15c830
+Revises: 9a4c6e1f3b72
+Create Date: 2026-10-18 15:03:11.825406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b97d15c830'
+down_revision: Union[str, None] = '9a4c6e1f3b72'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Cursors compare (received_at, id); a NULL would drop rows out of every page
+    op.execute("UPDATE emails SET received_at = coalesce(created_at, now()) WHERE received_at IS NULL")
+    op.create_index(
+        'ix_emails_user_received', 'emails',
+        ['user_id', sa.text('received_at DESC'), sa.text('id DESC')], unique=False
+    )
+    op.create_index(
+        'ix_emails_user_category_received', 'emails',
+        ['user_id', 'ai_category', sa.text('received_at DESC'), sa.text('id DESC')], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_emails_user_category_received', table_name='emails')
+    op.drop_index('ix_emails_user_received', table_name='emails')
@@ -0,0 +1,36 @@
+"""email_imap_source
+
+Revision ID: f18c2a7e9d04
+Revises: c5a0e3b8d417
+Create Date: 2026-10-18 18:36:40.118392
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f18c2a7e9d04'
+down_revision: Union[str, None] = 'c5a0e3b8d417'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing rows keep NULLs: their UIDs were never recorded, so they
+    # are simply not written back
+    op.add_column('emails', sa.Column('account_id', sa.Integer(), nullable=True))
+    op.add_column('emails', sa.Column('imap_uid', sa.BigInteger(), nullable=True))
+    op.add_column('emails', sa.Column('imap_folder', sa.String(), nullable=True))
+    op.create_foreign_key(
+        'emails_account_id_fkey', 'emails', 'email_accounts', ['account_id'], ['id'], ondelete='SET NULL'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint('emails_account_id_fkey', 'emails', type_='foreignkey')
+    op.drop_column('emails', 'imap_folder')
+    op.drop_column('emails', 'imap_uid')
+    op.drop_column('emails', 'account_id')
@@ -18,6 +18,22 @@ class Settings(BaseSettings):
     ENCRYPTION_KEY: str = "X6JMmHYnh_iGl8nO9J_jCsEAHRqL_SC8YkQ0vFHkd-4="
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 10080
+    PRINCIPAL_CACHE_TTL: int = 60
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_REDIS: bool = False
+    PRINCIPAL_CACHE_REDIS_TTL: int = 600
+    # GET /emails page cache (utils/inbox_cache.py)
+    INBOX_CACHE_ENABLED: bool = True
+    INBOX_CACHE_TTL: int = 60
+    INBOX_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    INBOX_CACHE_MAX_ENTRY_BYTES: int = 512 * 1024
+    # /ws push (services/events.py): per-socket queue, and the most
+    # per-message events one write sends before it sends a summary instead
+    WS_QUEUE_SIZE: int = 100
+    EVENTS_MAX_ITEMS: int = 50
+    # bcrypt thread pool (utils/auth.py)
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_QUEUE: int = 100
     
     # AI Services
     OLLAMA_BASE_URL: str = "http://host.docker.internal:11434"
@@ -34,6 +50,45 @@ class Settings(BaseSettings):
     # Email Sync
     EMAIL_SYNC_INTERVAL: int = 30
     EMAIL_BATCH_SIZE: int = 50
+    # "structure": BODYSTRUCTURE + partial fetch of the text part only
+    # "full": download the whole RFC822 message
+    IMAP_FETCH_MODE: str = "structure"
+    IMAP_MAX_WORKERS: int = 8
+    SYNC_MAX_CONCURRENT: int = 8
+    SYNC_MAX_PER_USER: int = 3
+    SYNC_MAX_PER_HOST: int = 4
+    # Batches this large are staged with COPY; at most BACKFILL_CHUNK so a
+    # full backfill window (and a large sync catch-up) takes that path
+    INGEST_COPY_THRESHOLD: int = 500
+    COUNTERS_RECONCILE_INTERVAL: int = 3600
+    # Delta-sync change log (services/changes.py)
+    CHANGES_RETENTION_DAYS: int = 30
+    CHANGES_TRIM_INTERVAL: int = 3600
+    # Rows per server-side cursor fetch in GET /emails/export
+    EXPORT_CHUNK: int = 500
+    
+    # IMAP session pool
+    IMAP_POOL_MAX_PER_HOST: int = 10
+    IMAP_POOL_IDLE_TIMEOUT: int = 600
+    IMAP_POOL_KEEPALIVE: int = 120
+    IMAP_POOL_ACQUIRE_TIMEOUT: int = 30
+    
+    # IMAP IDLE listener (idle_worker.py)
+    IMAP_IDLE_REISSUE: int = 1500
+    IMAP_IDLE_ACCOUNT_REFRESH: int = 300
+    SYNC_JOB_HISTORY: int = 1000
+    SYNC_JOB_TTL: int = 86400  # seconds a job's status stays readable in Redis
+    
+    # Full-history backfill
+    BACKFILL_CHUNK: int = 500
+    BACKFILL_MAX_MESSAGES_PER_SEC: float = 50
+    BACKFILL_MAX_CONCURRENT: int = 2
+    BACKFILL_BODY_LIMIT: int = 5000
+    
+    # Full-text search
+    SEARCH_TS_CONFIG: str = "english"
+    SEARCH_RECENCY_DAYS: int = 30
+    SEARCH_HEADLINE_CHARS: int = 5000
     
     # Celery
     CELERY_BROKER_URL: str = "redis://redis:6379/0"
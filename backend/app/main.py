@@ -1,17 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import Integer, any_, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
 from contextlib import asynccontextmanager
+import asyncio
 import logging
+from datetime import date
+from typing import List
+
+from pydantic import TypeAdapter
 
 from .config import get_settings
 from .database import engine, Base, get_db
-from .models import User, Email
-from .schemas import UserRegister, EmailSend, AIPrompt, EmailStar
-from .utils.auth import create_access_token, verify_password, get_password_hash, get_current_user
-from .services.email_service import IMAPWorker, encrypt_password, decrypt_password
+from .models import User, Email, Thread
+from .schemas import (
+    UserRegister, EmailSend, AIPrompt, EmailStar, EmailRead, EmailArchive, EmailBulkUpdate,
+    TokenOut, EmailListItem, EmailSearchItem, EmailDetail, EmailChangesPage, ThreadListItem, ThreadDetail,
+    EmailAccountOut,
+)
+from .utils.auth import create_access_token, get_current_user, get_current_user_ws, password_hasher, PasswordHasherBusy
+from .utils.pagination import encode_cursor, keyset_page
+from .utils.principal_cache import Principal, principal_cache
+from .utils.inbox_cache import inbox_cache
+from .utils.conditional import cache_headers, etag_matches, make_etag, not_modified
+from .services.email_service import IMAPWorker, encrypt_password, run_imap
+from .services.imap_pool import imap_pool
+from .services.sync_engine import sync_engine
+from .services.backfill import backfill_runner
+from .services.search import apply_search, search_snippets
+from .services.bodies import load_body
+from .services.counters import get_counters, run_reconciler, set_flag
+from .services.mutations import bulk_update, schedule_write_back, shutdown_write_backs
+from .services.events import event_hub
+from .services.changes import ChangesExpired, changes_since, current_seq, run_trimmer
+from .services.export import FORMATS, export_mailbox
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,14 +49,28 @@ async def lifespan(app: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     
+    imap_pool.start()
+    await event_hub.start()
+    await backfill_runner.resume_pending()
+    reconciler = asyncio.create_task(run_reconciler(settings.COUNTERS_RECONCILE_INTERVAL))
+    trimmer = asyncio.create_task(run_trimmer(settings.CHANGES_TRIM_INTERVAL, settings.CHANGES_RETENTION_DAYS))
     logger.info("🚀 Ohhh1Mail AI started")
     
     yield
     
     # Shutdown
+    reconciler.cancel()
+    trimmer.cancel()
+    # Let them release their leader locks
+    await asyncio.gather(reconciler, trimmer, return_exceptions=True)
+    await sync_engine.shutdown()
+    await backfill_runner.shutdown()
+    await event_hub.shutdown()
+    await shutdown_write_backs()
+    await run_imap(imap_pool.close)
     logger.info("👋 Ohhh1Mail AI shutting down")
 
-app = FastAPI(title="Ohhh1Mail AI", lifespan=lifespan)
+app = FastAPI(title="Ohhh1Mail AI", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # CORS
 app.add_middleware(
@@ -40,11 +79,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 )
 
 # ============= AUTH ENDPOINTS =============
 
-@app.post("/auth/register")
+@app.post("/auth/register", response_model=TokenOut)
 async def register(
     user_data: UserRegister,
     db: AsyncSession = Depends(get_db)
@@ -58,9 +98,11 @@ async def register(
         raise HTTPException(status_code=400, detail="Email already registered")
     
     try:
-        hashed_pw = get_password_hash(user_data.password)
+        hashed_pw = await password_hasher.hash(user_data.password)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid password")
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
 
     # Create user
     user = User(
@@ -71,6 +113,8 @@ async def register(
     db.add(user)
     await db.flush()
     await db.commit()
+    # Drop anything cached for a previous account with this email
+    await principal_cache.invalidate(user.email)
     
     # Create access token
     access_token = create_access_token(data={"sub": user.email})
@@ -85,7 +129,7 @@ async def register(
         }
     }
 
-@app.post("/auth/login")
+@app.post("/auth/login", response_model=TokenOut)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: AsyncSession = Depends(get_db)
@@ -94,13 +138,20 @@ async def login(
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalar_one_or_none()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    try:
+        valid = bool(user) and await password_hasher.verify(form_data.password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+    
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
     access_token = create_access_token(data={"sub": user.email})
+    # The user row is in hand; save the first authenticated request a lookup
+    await principal_cache.set(user.email, Principal.from_user(user))
     
     return {
         "access_token": access_token,
@@ -114,56 +165,186 @@ async def login(
 
 # ============= EMAIL ENDPOINTS =============
 
-@app.get("/emails")
+# The list only needs these; bodies stay in email_bodies
+EMAIL_LIST_COLUMNS = (
+    Email.id, Email.message_id, Email.from_address, Email.from_name, Email.subject,
+    Email.ai_summary, Email.ai_category, Email.is_read, Email.is_starred,
+    Email.received_at, Email.preview, Email.body_hash,
+)
+
+# Pages are serialized once, in pydantic-core, and the bytes are both
+# cached and sent
+EMAIL_PAGE = TypeAdapter(List[EmailListItem])
+SEARCH_PAGE = TypeAdapter(List[EmailSearchItem])
+
+@app.get("/emails", response_model=List[EmailListItem])
 async def get_emails(
+    request: Request,
     category: str = None,
     search: str = None,
-    current_user: User = Depends(get_current_user),
+    before: str = None,
+    after: str = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get emails with filters"""
-    query = select(Email).where(Email.user_id == current_user.id)
+    """
+    Get emails with filters, newest first. Page with the cursors from the
+    X-Next-Cursor (older) and X-Prev-Cursor (newer) headers via
+    ?before= / ?after=. Search results are ranked and not paged.
+    Pages are served from the inbox cache until the mailbox changes, and
+    an If-None-Match matching the mailbox's change seq gets a 304.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    if search and (before or after):
+        raise HTTPException(status_code=400, detail="Search results cannot be paged with cursors")
+    
+    cache_params = {"category": category, "search": search, "before": before, "after": after, "limit": limit}
+    # Read before the page, so the tag can only be older than the content
+    etag = make_etag("emails", current_user.id, await current_seq(db, current_user.id), sorted(cache_params.items()))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    version = await inbox_cache.version(current_user.id)
+    if version is not None:
+        cached = await inbox_cache.get(current_user.id, version, cache_params)
+        if cached:
+            return Response(
+                content=cached["body"], media_type="application/json",
+                headers={**cached["headers"], **cache_headers(etag)},
+            )
+    
+    query = select(*EMAIL_LIST_COLUMNS).where(Email.user_id == current_user.id)
     
     if category:
         query = query.where(Email.ai_category == category)
     
     if search:
-        search_pattern = f"%{search}%"
-        query = query.where(
-            (Email.subject.ilike(search_pattern)) |
-            (Email.from_address.ilike(search_pattern)) |
-            (Email.body_text.ilike(search_pattern))
-        )
+        query = apply_search(query, search)
+    else:
+        try:
+            query = keyset_page(query, before=before, after=after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # One extra row tells us whether another page exists
+    result = await db.execute(query.limit(limit + 1))
+    emails = result.all()
+    has_more = len(emails) > limit
+    emails = emails[:limit]
+    if after:
+        emails.reverse()
+    snippets = await search_snippets(db, {e.id: e.body_hash for e in emails}, search) if search else {}
+    
+    headers = {}
+    if emails and not search:
+        if has_more or after:
+            headers["X-Next-Cursor"] = encode_cursor(emails[-1].received_at, emails[-1].id)
+        headers["X-Prev-Cursor"] = encode_cursor(emails[0].received_at, emails[0].id)
     
-    query = query.order_by(Email.received_at.desc()).limit(50)
-    
-    result = await db.execute(query)
-    emails = result.scalars().all()
+    if search:
+        rows = [{**e._mapping, "snippet": snippets.get(e.id, "")} for e in emails]
+        body = SEARCH_PAGE.dump_json(SEARCH_PAGE.validate_python(rows))
+    else:
+        body = EMAIL_PAGE.dump_json(EMAIL_PAGE.validate_python(emails, from_attributes=True))
+    if version is not None:
+        await inbox_cache.set(current_user.id, version, cache_params, body.decode(), headers)
+    return Response(content=body, media_type="application/json", headers={**headers, **cache_headers(etag)})
+
+@app.get("/emails/counters")
+async def get_email_counters(
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Total/unread/starred/archived per category, from mailbox_counters"""
+    return await get_counters(db, current_user.id)
+
+@app.get("/emails/changes", response_model=EmailChangesPage)
+async def get_email_changes(
+    since: int = Query(None, ge=0),
+    limit: int = Query(500, ge=1, le=5000),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Delta sync: emails inserted, updated or deleted after ``since`` (a
+    sync_token from an earlier call), with their current list fields.
+    Without ``since`` only the current sync_token is returned; take it
+    before the first full fetch. Repeat while has_more. 410 means the
+    token is older than the retained log and the client must refetch.
+    """
+    if since is None:
+        return {"sync_token": await current_seq(db, current_user.id), "has_more": False,
+                "inserted": [], "updated": [], "deleted": []}
+    try:
+        page = await changes_since(db, current_user.id, since, limit)
+    except ChangesExpired:
+        raise HTTPException(status_code=410, detail="Sync token expired, refetch the mailbox")
+    
+    ops = page["ops"]
+    live = [email_id for email_id, op in ops.items() if op != "delete"]
+    rows = {}
+    if live:
+        result = await db.execute(
+            select(*EMAIL_LIST_COLUMNS).where(
+                (Email.user_id == current_user.id) & (Email.id == any_(literal(live, ARRAY(Integer))))
+            )
+        )
+        rows = {e.id: e for e in result.all()}
     
-    return [
-        {
-            "id": e.id,
-            "message_id": e.message_id,
-            "from_address": e.from_address,
-            "from_name": e.from_name,
-            "subject": e.subject,
-            "ai_summary": e.ai_summary,
-            "ai_category": e.ai_category,
-            "is_read": e.is_read,
-            "is_starred": e.is_starred,
-            "received_at": e.received_at.isoformat() if e.received_at else None,
-            "preview": e.body_text[:200] if e.body_text else ""
-        }
-        for e in emails
-    ]
+    return {
+        "sync_token": page["sync_token"],
+        "has_more": page["has_more"],
+        "inserted": [rows[i] for i, op in ops.items() if op == "insert" and i in rows],
+        "updated": [rows[i] for i, op in ops.items() if op == "update" and i in rows],
+        # Logged but no longer readable counts as deleted too
+        "deleted": [i for i, op in ops.items() if op == "delete" or i not in rows],
+    }
+
+@app.get("/emails/export")
+async def export_emails(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|mbox)$"),
+    gzip: bool = False,
+    after_id: int = Query(0, ge=0),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Download the whole mailbox as NDJSON or mbox, oldest id first, in
+    constant memory. To resume a cut-off download, pass the last email id
+    received (the NDJSON "id" or mbox X-Ohhh1Mail-Id) as ``after_id``.
+    """
+    media_type, extension = FORMATS[fmt]
+    filename = f"mailbox-{date.today().isoformat()}.{extension}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_mailbox(current_user.id, fmt, after_id=after_id, gzip=gzip, chunk=settings.EXPORT_CHUNK),
+        media_type="application/gzip" if gzip else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
 
-@app.get("/emails/{email_id}")
+@app.get("/emails/{email_id}", response_model=EmailDetail)
 async def get_email(
     email_id: int,
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get single email"""
+    """Get single email; ETag follows updated_at, checked before the row and body load"""
+    result = await db.execute(
+        select(Email.updated_at).where(
+            (Email.id == email_id) &
+            (Email.user_id == current_user.id)
+        )
+    )
+    found = result.first()
+    if found is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    etag = make_etag("email", email_id, found.updated_at.isoformat() if found.updated_at else None)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    
     result = await db.execute(
         select(Email).where(
             (Email.id == email_id) &
@@ -175,160 +356,201 @@ async def get_email(
     if not email:
         raise HTTPException(status_code=404, detail="Email not found")
     
+    body = await load_body(db, email.body_hash)
+    
     return {
         "id": email.id,
         "from_address": email.from_address,
         "from_name": email.from_name,
         "subject": email.subject,
-        "body_text": email.body_text,
+        "body_text": body["text"],
         "ai_summary": email.ai_summary,
         "ai_category": email.ai_category,
         "is_read": email.is_read,
         "is_starred": email.is_starred,
-        "received_at": email.received_at.isoformat() if email.received_at else None
+        "received_at": email.received_at
     }
 
-@app.post("/emails/sync")
-async def sync_emails(
-    current_user: User = Depends(get_current_user),
+@app.get("/threads", response_model=List[ThreadListItem])
+async def get_threads(
+    request: Request,
+    response: Response,
+    before: str = None,
+    after: str = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Trigger email sync"""
-    from .models import EmailAccount, Email
-    
-    try:
-        # Get all user accounts
-        result = await db.execute(
-            select(EmailAccount).where(EmailAccount.user_id == current_user.id)
+    """
+    Conversations, most recently active first: one row each with its
+    latest message and message count. Paged like GET /emails,
+    conditional on the change seq like GET /emails.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    
+    etag = make_etag("threads", current_user.id, await current_seq(db, current_user.id), before, after, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    
+    query = (
+        select(
+            Thread.id, Thread.subject, Thread.latest_at, Thread.message_count,
+            Email.id.label("latest_email_id"), Email.from_address, Email.from_name,
+            Email.preview, Email.is_read,
         )
-        accounts = result.scalars().all()
-        
-        synced_count = 0
-        
-        for account in accounts:
-            if account.account_type == 'imap':
-                try:
-                    # Decrypt password
-                    password = decrypt_password(account.imap_password_encrypted)
-                    
-                    # Connect and fetch
-                    worker = IMAPWorker(
-                        server=account.imap_server,
-                        port=account.imap_port,
-                        username=account.imap_username,
-                        password=password
-                    )
-                    worker.connect()
-                    
-                    # Fetch last 20 emails
-                    emails = worker.fetch_emails(limit=20)
-                    
-                    for email_data in emails:
-                        # Apply domain filtering if configured
-                        if account.domain_filter:
-                            from_email = email_data['from']
-                            # Extract domain from email address
-                            if '<' in from_email:
-                                from_email = from_email.split('<')[1].split('>')[0]
-                            email_domain = from_email.split('@')[-1] if '@' in from_email else ''
-                            
-                            # Check if domain is in the allowed list
-                            allowed_domains = [d.strip().lower() for d in account.domain_filter.split(',')]
-                            if email_domain.lower() not in allowed_domains:
-                                continue  # Skip this email
-                        
-                        # Parse the date from IMAP format
-                        from email.utils import parsedate_to_datetime
-                        from datetime import datetime, timezone
-                        try:
-                            received_date = parsedate_to_datetime(email_data['date'])
-                            if received_date.tzinfo is None:
-                                received_date = received_date.replace(tzinfo=timezone.utc)
-                        except Exception as e:
-                            # Fallback to current time with UTC timezone
-                            received_date = datetime.now(timezone.utc)
-                        
-                        # Check if email already exists by message-id
-                        existing = await db.execute(
-                            select(Email).where(
-                                (Email.user_id == current_user.id) &
-                                (Email.message_id == email_data['message_id'])
-                            )
-                        )
-                        if not existing.scalar_one_or_none():
-                            new_email = Email(
-                                user_id=current_user.id,
-                                message_id=email_data['message_id'],
-                                from_address=email_data['from'],
-                                from_name=email_data['from'].split('<')[0].strip() if '<' in email_data['from'] else email_data['from'],
-                                to_address="",
-                                subject=email_data['subject'],
-                                body_text=email_data['body'],
-                                body_html="",
-                                received_at=received_date,
-                                is_read=False,
-                                ai_category="primary"
-                            )
-                            db.add(new_email)
-                            synced_count += 1
-                            
-                except Exception as e:
-                    print(f"Sync failed for account {account.email_address}: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    await db.rollback()
-                    continue
-        
-        # Commit all at once
-        await db.commit()
-        return {"message": f"Sync complete. Imported {synced_count} new emails."}
-    except Exception as e:
-        await db.rollback()
-        logger.error(f"Global sync error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Sync failed: {str(e)}")
+        .outerjoin(Email, Email.id == Thread.latest_email_id)
+        .where((Thread.user_id == current_user.id) & (Thread.message_count > 0))
+    )
+    try:
+        query = keyset_page(query, before=before, after=after, columns=(Thread.latest_at, Thread.id))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    result = await db.execute(query.limit(limit + 1))
+    threads = result.all()
+    has_more = len(threads) > limit
+    threads = threads[:limit]
+    if after:
+        threads.reverse()
+    
+    if threads:
+        if has_more or after:
+            response.headers["X-Next-Cursor"] = encode_cursor(threads[-1].latest_at, threads[-1].id)
+        response.headers["X-Prev-Cursor"] = encode_cursor(threads[0].latest_at, threads[0].id)
+    
+    return threads
+
+@app.get("/threads/{thread_id}", response_model=ThreadDetail)
+async def get_thread(
+    thread_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Messages of one conversation, oldest first"""
+    result = await db.execute(
+        select(Thread).where((Thread.id == thread_id) & (Thread.user_id == current_user.id))
+    )
+    thread = result.scalar_one_or_none()
+    if not thread:
+        raise HTTPException(status_code=404, detail="Thread not found")
+    
+    result = await db.execute(
+        select(*EMAIL_LIST_COLUMNS)
+        .where((Email.thread_id == thread_id) & (Email.user_id == current_user.id))
+        .order_by(Email.received_at.asc(), Email.id.asc())
+    )
+    return {
+        "id": thread.id,
+        "subject": thread.subject,
+        "message_count": thread.message_count,
+        "latest_at": thread.latest_at,
+        "emails": result.all(),
+    }
+
+@app.post("/emails/sync", status_code=status.HTTP_202_ACCEPTED)
+async def sync_emails(
+    current_user: Principal = Depends(get_current_user)
+):
+    """Trigger email sync; returns a job id to poll"""
+    job = sync_engine.submit(current_user.id, limit=20)
+    # Readable from every worker before the client's first poll
+    await sync_engine.save(job)
+    return {"message": "Sync started", **job.to_dict()}
+
+@app.get("/emails/sync/{job_id}")
+async def get_sync_status(
+    job_id: str,
+    current_user: Principal = Depends(get_current_user)
+):
+    """Get progress of a sync job"""
+    job = await sync_engine.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job.to_dict()
 
 @app.post("/emails/send")
 async def send_email(
     email_data: EmailSend,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Send email"""
     return {"message": "Email send not implemented yet"}
 
+async def update_flag(db: AsyncSession, user_id: int, email_id: int, flag: str, value: bool):
+    changed = await set_flag(db, user_id, email_id, flag, value)
+    if changed is None:
+        raise HTTPException(status_code=404, detail="Email not found")
+    await db.commit()
+    if changed:
+        await inbox_cache.bump(user_id)
+    return {"message": "Email updated"}
+
 @app.patch("/emails/{email_id}/star")
 async def star_email(
     email_id: int,
     star_data: EmailStar,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Star/unstar email"""
-    result = await db.execute(
-        select(Email).where(
-            (Email.id == email_id) &
-            (Email.user_id == current_user.id)
-        )
+    return await update_flag(db, current_user.id, email_id, "is_starred", star_data.is_starred)
+
+@app.patch("/emails/{email_id}/read")
+async def mark_email_read(
+    email_id: int,
+    read_data: EmailRead,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Mark email read/unread"""
+    return await update_flag(db, current_user.id, email_id, "is_read", read_data.is_read)
+
+@app.patch("/emails/{email_id}/archive")
+async def archive_email(
+    email_id: int,
+    archive_data: EmailArchive,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Archive/unarchive email"""
+    return await update_flag(db, current_user.id, email_id, "is_archived", archive_data.is_archived)
+
+@app.post("/emails/bulk")
+async def bulk_update_emails(
+    update_data: EmailBulkUpdate,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Read/star/archive/move many emails, by id list or filter, in one statement"""
+    if update_data.ids is None and update_data.filter is None:
+        raise HTTPException(status_code=400, detail="Give ids or a filter")
+    
+    changes = update_data.changes.model_dump(exclude_none=True)
+    rows = await bulk_update(
+        db, current_user.id, changes,
+        ids=update_data.ids,
+        filters=update_data.filter.model_dump(exclude_none=True) if update_data.filter else None,
     )
-    email = result.scalar_one_or_none()
-    
-    if not email:
-        raise HTTPException(status_code=404, detail="Email not found")
-    
-    email.is_starred = star_data.is_starred
     await db.commit()
+    if rows:
+        await inbox_cache.bump(current_user.id)
     
-    return {"message": "Email updated"}
-
-    return {"message": "Email updated"}
+    write_back = update_data.write_back and schedule_write_back(current_user.id, rows, changes)
+    return {
+        "updated": len(rows),
+        "ids": [row.id for row in rows],
+        "write_back": "scheduled" if write_back else "skipped",
+    }
 
 @app.post("/settings/accounts/test")
 async def test_imap_connection(
     config: dict,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Test IMAP connection"""
+    worker = None
     try:
         worker = IMAPWorker(
             server=config['imapServer'],
@@ -336,14 +558,17 @@ async def test_imap_connection(
             username=config['email'],
             password=config['password']
         )
-        worker.connect()
+        await run_imap(worker.connect)
         return {"status": "success", "message": "Connection successful"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if worker:
+            await run_imap(worker.logout)
 
-@app.get("/settings/accounts")
+@app.get("/settings/accounts", response_model=List[EmailAccountOut])
 async def get_email_accounts(
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Get all connected email accounts"""
@@ -368,7 +593,7 @@ async def get_email_accounts(
 @app.post("/settings/accounts")
 async def add_email_account(
     account_data: dict,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Add new email account"""
@@ -407,7 +632,7 @@ async def add_email_account(
 @app.delete("/settings/accounts/{account_id}")
 async def delete_email_account(
     account_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Delete an email account"""
@@ -426,15 +651,75 @@ async def delete_email_account(
     
     await db.delete(account)
     await db.commit()
+    await run_imap(imap_pool.discard_key, account_id)
     
     return {"status": "success", "message": "Account deleted"}
 
+async def get_user_account(db: AsyncSession, user_id: int, account_id: int):
+    from .models import EmailAccount
+
+    result = await db.execute(
+        select(EmailAccount).where(
+            (EmailAccount.id == account_id) &
+            (EmailAccount.user_id == user_id)
+        )
+    )
+    account = result.scalar_one_or_none()
+    if not account:
+        raise HTTPException(status_code=404, detail="Account not found")
+    return account
+
+@app.post("/settings/accounts/{account_id}/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def start_backfill(
+    account_id: int,
+    folder: str = "INBOX",
+    restart: bool = False,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start (or resume) importing the account's full history"""
+    account = await get_user_account(db, current_user.id, account_id)
+    return await backfill_runner.start(db, account, folder, restart=restart)
+
+@app.get("/settings/accounts/{account_id}/backfill")
+async def get_backfill_progress(
+    account_id: int,
+    folder: str = "INBOX",
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Backfill progress: done/total, throughput and ETA"""
+    from .models import SyncState
+
+    await get_user_account(db, current_user.id, account_id)
+    result = await db.execute(
+        select(SyncState).where(
+            (SyncState.account_id == account_id) &
+            (SyncState.folder == folder)
+        )
+    )
+    state = result.scalar_one_or_none()
+    if state is None:
+        state = SyncState(account_id=account_id, folder=folder)
+    return backfill_runner.progress(state)
+
+@app.delete("/settings/accounts/{account_id}/backfill")
+async def pause_backfill(
+    account_id: int,
+    folder: str = "INBOX",
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Pause a backfill; POST resumes it from the last checkpoint"""
+    await get_user_account(db, current_user.id, account_id)
+    return await backfill_runner.pause(db, account_id, folder)
+
 # ============= AI ENDPOINTS =============
 
 @app.post("/ai/quick-replies/{email_id}")
 async def generate_quick_replies(
     email_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Generate AI quick replies"""
@@ -460,7 +745,7 @@ async def generate_quick_replies(
 @app.post("/ai/compose")
 async def compose_with_ai(
     prompt_data: AIPrompt,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """Generate email from prompt"""
     # Mock response for now
@@ -468,10 +753,33 @@ async def compose_with_ai(
         "email_text": f"[AI Generated based on: {prompt_data.prompt}]\n\nHello,\n\nThank you for your message.\n\nBest regards,\nJohn"
     }
 
+# ============= PUSH ENDPOINTS =============
+
+@app.websocket("/ws")
+async def websocket_events(websocket: WebSocket, token: str = None):
+    """Mailbox events for the token's user: new_email, flags, counters, mailbox_changed, resync"""
+    principal = await get_current_user_ws(token)
+    if principal is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    await event_hub.serve(websocket, principal.id)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics(current_user: Principal = Depends(get_current_user)):
+    """Process-local cache and pool counters; internals, so not for anonymous callers"""
+    return {
+        "principal_cache": principal_cache.snapshot(),
+        "inbox_cache": inbox_cache.snapshot(),
+        "event_hub": event_hub.snapshot(),
+        "password_hasher": password_hasher.snapshot(),
+        "imap_pool": imap_pool.snapshot(),
+    }
+
 @app.get("/")
 async def root():
     return {"message": "Ohhh1Mail AI API"}
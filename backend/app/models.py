@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, DateTime, ForeignKey, JSON, LargeBinary, UniqueConstraint, Index, DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from .database import Base
 
@@ -22,29 +23,59 @@ class User(Base):
     
     emails = relationship("Email", back_populates="user")
 
+class EmailBody(Base):
+    """zlib-compressed message content, shared by every email with the same hash"""
+    __tablename__ = "email_bodies"
+    
+    hash = Column(String(64), primary_key=True)  # sha256 of text + html
+    text_z = Column(LargeBinary, nullable=False)
+    html_z = Column(LargeBinary, nullable=True)
+    size = Column(Integer, nullable=False)  # uncompressed bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Email(Base):
     __tablename__ = "emails"
+    __table_args__ = (
+        # Message-IDs are only unique within one user's mailbox
+        UniqueConstraint("user_id", "message_id", name="uq_emails_user_message_id"),
+        # Full-text search scoped to one user (needs btree_gin for user_id)
+        Index("ix_emails_user_search", "user_id", "search_vector", postgresql_using="gin"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     
-    message_id = Column(String, unique=True, index=True)
+    message_id = Column(String, index=True)
     from_address = Column(String, index=True)
     from_name = Column(String, nullable=True)
     to_address = Column(String, nullable=True)
     subject = Column(Text)
-    body_text = Column(Text, nullable=True)
-    body_html = Column(Text, nullable=True)
+    # Body content lives in email_bodies (services/bodies.py); lists use preview
+    body_hash = Column(String(64), ForeignKey("email_bodies.hash", name="fk_emails_body_hash"), nullable=True)
+    preview = Column(String(200), nullable=True)
     
     # AI generated
     ai_summary = Column(Text, nullable=True)
     ai_category = Column(String, index=True, nullable=True)
     
+    # Weighted subject/sender/body, set at ingest (services/search.py)
+    search_vector = deferred(Column(TSVECTOR, nullable=True))
+    
     # Status
     is_read = Column(Boolean, default=False)
     is_starred = Column(Boolean, default=False)
     is_archived = Column(Boolean, default=False)
     
+    # Source mailbox, so flag changes can be written back with UID STORE
+    account_id = Column(Integer, ForeignKey("email_accounts.id", ondelete="SET NULL"), nullable=True)
+    imap_uid = Column(BigInteger, nullable=True)
+    imap_folder = Column(String, nullable=True)
+    # UIDVALIDITY the UID belongs to; a UID means nothing under another one
+    imap_uidvalidity = Column(BigInteger, nullable=True)
+    
+    # Conversation, assigned at ingest from References/In-Reply-To (services/threads.py)
+    thread_id = Column(Integer, ForeignKey("threads.id", ondelete="SET NULL"), nullable=True)
+    
     # Timestamps
     received_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -52,6 +83,76 @@ class Email(Base):
     
     user = relationship("User", back_populates="emails")
 
+# Keyset pagination of the inbox, newest first (utils/pagination.py)
+Index("ix_emails_user_received", Email.user_id, Email.received_at.desc(), Email.id.desc())
+Index(
+    "ix_emails_user_category_received",
+    Email.user_id, Email.ai_category, Email.received_at.desc(), Email.id.desc(),
+)
+
+# Messages of one conversation, in order
+Index("ix_emails_thread_received", Email.thread_id, Email.received_at.desc(), Email.id.desc())
+
+event.listen(
+    Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS btree_gin")
+)
+
+class Thread(Base):
+    """One conversation; counts and latest message kept in step at ingest"""
+    __tablename__ = "threads"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    subject = Column(Text, nullable=True)
+    message_count = Column(Integer, default=0, nullable=False)
+    latest_at = Column(DateTime, nullable=True)
+    latest_email_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Thread list, most recently active first
+Index("ix_threads_user_latest", Thread.user_id, Thread.latest_at.desc(), Thread.id.desc())
+
+class ThreadRef(Base):
+    """
+    Message-ID -> thread, for every message seen or referenced, so a reply
+    that arrives before its parent still joins the parent's thread later
+    """
+    __tablename__ = "thread_refs"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    message_id = Column(String, primary_key=True)
+    thread_id = Column(Integer, ForeignKey("threads.id", ondelete="CASCADE"), nullable=False, index=True)
+
+class MailboxCounter(Base):
+    """Per-user, per-category counts kept in step with emails (services/counters.py)"""
+    __tablename__ = "mailbox_counters"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    category = Column(String, primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+    unread = Column(Integer, default=0, nullable=False)
+    starred = Column(Integer, default=0, nullable=False)
+    archived = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class MailboxSeq(Base):
+    """Per-user change sequence; trimmed_to is the highest seq already dropped from the log"""
+    __tablename__ = "mailbox_seqs"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(BigInteger, default=0, nullable=False)
+    trimmed_to = Column(BigInteger, default=0, nullable=False)
+
+class MailboxChange(Base):
+    """One insert/update/delete of an email, in per-user seq order (services/changes.py)"""
+    __tablename__ = "mailbox_changes"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(BigInteger, primary_key=True)
+    email_id = Column(Integer, nullable=False)  # no FK: deletes are logged too
+    op = Column(String(8), nullable=False)  # insert, update, delete
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
 class EmailAccount(Base):
     __tablename__ = "email_accounts"
     
@@ -80,5 +181,39 @@ class EmailAccount(Base):
     
     user = relationship("User", back_populates="accounts")
 
+class SyncState(Base):
+    """IMAP high-water mark per account/folder for incremental sync"""
+    __tablename__ = "sync_states"
+    __table_args__ = (
+        UniqueConstraint("account_id", "folder", name="uq_sync_states_account_folder"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, ForeignKey("email_accounts.id", ondelete="CASCADE"), index=True)
+    folder = Column(String, default="INBOX", nullable=False)
+    
+    # A UIDVALIDITY change invalidates every stored UID -> full resync
+    uidvalidity = Column(BigInteger, nullable=True)
+    last_uid = Column(BigInteger, default=0, nullable=False)
+    last_synced_at = Column(DateTime, nullable=True)
+    
+    # Full-history backfill, walked newest first. backfill_cursor is the
+    # lowest UID already processed; the next window ends just below it.
+    backfill_status = Column(String, nullable=True)  # running, paused, completed, failed
+    backfill_uidvalidity = Column(BigInteger, nullable=True)
+    backfill_start_uid = Column(BigInteger, nullable=True)
+    backfill_cursor = Column(BigInteger, nullable=True)
+    backfill_done = Column(Integer, default=0, nullable=False)
+    backfill_total = Column(Integer, default=0, nullable=False)
+    backfill_bytes = Column(BigInteger, default=0, nullable=False)
+    backfill_error = Column(Text, nullable=True)
+    backfill_started_at = Column(DateTime, nullable=True)
+    backfill_updated_at = Column(DateTime, nullable=True)
+    
+    account = relationship("EmailAccount", back_populates="sync_states")
+
 # Update User relationship
 User.accounts = relationship("EmailAccount", back_populates="user")
+EmailAccount.sync_states = relationship(
+    "SyncState", back_populates="account", cascade="all, delete-orphan", passive_deletes=True
+)
@@ -1,4 +1,7 @@
-from pydantic import BaseModel, EmailStr, Field
+from datetime import datetime
+from typing import Annotated, List, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, EmailStr, Field
 
 class UserRegister(BaseModel):
     email: EmailStr
@@ -19,3 +22,127 @@ class AIPrompt(BaseModel):
 
 class EmailStar(BaseModel):
     is_starred: bool
+
+class EmailRead(BaseModel):
+    is_read: bool
+
+class EmailArchive(BaseModel):
+    is_archived: bool
+
+class EmailFilter(BaseModel):
+    category: Optional[str] = None
+    is_read: Optional[bool] = None
+    is_starred: Optional[bool] = None
+    is_archived: Optional[bool] = None
+    received_before: Optional[datetime] = None
+    received_after: Optional[datetime] = None
+    search: Optional[str] = None
+
+class EmailChanges(BaseModel):
+    is_read: Optional[bool] = None
+    is_starred: Optional[bool] = None
+    is_archived: Optional[bool] = None
+    category: Optional[str] = None  # move to another category
+
+class EmailBulkUpdate(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=10000)
+    filter: Optional[EmailFilter] = None
+    changes: EmailChanges
+    write_back: bool = False  # push read/star to the IMAP server
+
+# ============= RESPONSES =============
+# Built straight from ORM rows (from_attributes); datetimes serialize natively
+
+# Rows from before previews existed have NULL
+Preview = Annotated[str, BeforeValidator(lambda value: value or "")]
+
+class UserOut(BaseModel):
+    id: int
+    email: str
+    full_name: Optional[str] = None
+
+class TokenOut(BaseModel):
+    access_token: str
+    token_type: str
+    user: UserOut
+
+class EmailListItem(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    message_id: Optional[str] = None
+    from_address: Optional[str] = None
+    from_name: Optional[str] = None
+    subject: Optional[str] = None
+    ai_summary: Optional[str] = None
+    ai_category: Optional[str] = None
+    is_read: Optional[bool] = None
+    is_starred: Optional[bool] = None
+    received_at: Optional[datetime] = None
+    preview: Preview = ""
+
+class EmailSearchItem(EmailListItem):
+    snippet: str = ""
+
+class EmailDetail(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    from_address: Optional[str] = None
+    from_name: Optional[str] = None
+    subject: Optional[str] = None
+    body_text: str = ""
+    ai_summary: Optional[str] = None
+    ai_category: Optional[str] = None
+    is_read: Optional[bool] = None
+    is_starred: Optional[bool] = None
+    received_at: Optional[datetime] = None
+
+class EmailChangesPage(BaseModel):
+    sync_token: int
+    has_more: bool
+    inserted: List[EmailListItem]
+    updated: List[EmailListItem]
+    deleted: List[int]
+
+class ThreadListItem(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    subject: Optional[str] = None
+    message_count: int
+    latest_at: Optional[datetime] = None
+    latest_email_id: Optional[int] = None
+    from_address: Optional[str] = None
+    from_name: Optional[str] = None
+    preview: Preview = ""
+    is_read: Optional[bool] = None
+
+class ThreadEmail(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    message_id: Optional[str] = None
+    from_address: Optional[str] = None
+    from_name: Optional[str] = None
+    subject: Optional[str] = None
+    is_read: Optional[bool] = None
+    is_starred: Optional[bool] = None
+    received_at: Optional[datetime] = None
+    preview: Preview = ""
+
+class ThreadDetail(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: int
+    subject: Optional[str] = None
+    message_count: int
+    latest_at: Optional[datetime] = None
+    emails: List[ThreadEmail]
+
+class EmailAccountOut(BaseModel):
+    id: str
+    email: Optional[str] = None
+    type: Optional[str] = None
+    status: str
+    lastSync: str
@@ -0,0 +1,301 @@
+"""
+Full-history mailbox backfill.
+
+Walks a folder newest first in UID windows of at most BACKFILL_CHUNK
+messages, storing each window through the same header-first/bulk-insert
+path as the incremental sync. The cursor (lowest UID done) is committed
+together with each window's rows, so a crash or deploy resumes at the
+last finished window, and at most one window of UIDs is held in memory
+whatever the mailbox size. Throughput is capped at
+BACKFILL_MAX_MESSAGES_PER_SEC per folder.
+
+Every API worker resumes pending backfills at startup; a session advisory
+lock per sync_states row lets exactly one of them walk each folder, and
+the walker re-reads backfill_status before each window so a pause issued
+through any worker stops it.
+
+New mail above the starting UID is left to the incremental sync.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import EmailAccount, SyncState
+from ..utils.inbox_cache import inbox_cache
+from .email_service import IMAPWorker, domain_search_criteria, run_imap
+from .locks import advisory_lock
+from .sync_service import fetch_and_store, get_sync_state, pooled_worker, select_with_reconnect
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Sparse UID ranges (deleted mail) widen the search window up to this
+# many chunks; the UIDs of one window are all we ever hold
+MAX_SPAN_CHUNKS = 64
+
+# First key of pg_try_advisory_lock(int, int); the second is the sync_states id
+_LOCK_NAMESPACE = 0x6266  # "bf"
+
+
+def claim(state_id: int):
+    """Try to become the one process walking this folder (see services/locks.py)"""
+    return advisory_lock(_LOCK_NAMESPACE, state_id)
+
+
+def plan_window(worker: IMAPWorker, folder: str, cursor: Optional[int], span: int, chunk: int, criteria=()):
+    """
+    Select ``folder`` and list the next window below ``cursor``. Blocking;
+    run it through run_imap.
+
+    Returns (mailbox, walked, wanted, low): ``walked`` is how many messages
+    the window covers, ``wanted`` the UIDs in it matching ``criteria`` and
+    ``low`` the new cursor. ``cursor`` None starts from the top (UIDNEXT).
+    """
+    mailbox = select_with_reconnect(worker, folder)
+    high = (cursor if cursor is not None else mailbox['uidnext'] or 1) - 1
+    if high < 1:
+        return mailbox, 0, [], 1
+
+    low = max(1, high - span + 1)
+    uids = worker.search_uids('UID', f'{low}:{high}')
+    # ``n:m`` can still match the highest UID when it is below n
+    uids = [uid for uid in uids if low <= uid <= high]
+    if len(uids) > chunk:
+        uids = uids[-chunk:]
+        low = uids[0]
+
+    wanted = uids
+    if uids and criteria:
+        wanted = [
+            uid for uid in worker.search_uids('UID', f'{low}:{high}', *criteria)
+            if low <= uid <= high
+        ]
+    return mailbox, len(uids), wanted, low
+
+
+def progress(state: SyncState, rate: Optional[dict] = None) -> dict:
+    """Backfill progress for the API; ``rate`` is the live run's counters"""
+    messages_per_sec = bytes_per_sec = eta_seconds = None
+    if rate:
+        elapsed = time.monotonic() - rate["since"]
+        if elapsed > 0:
+            messages_per_sec = round((state.backfill_done - rate["done"]) / elapsed, 2)
+            bytes_per_sec = round((state.backfill_bytes - rate["bytes"]) / elapsed, 2)
+        if messages_per_sec:
+            eta_seconds = int(max(state.backfill_total - state.backfill_done, 0) / messages_per_sec)
+
+    return {
+        "account_id": state.account_id,
+        "folder": state.folder,
+        "status": state.backfill_status or "not_started",
+        "done": state.backfill_done or 0,
+        "total": state.backfill_total or 0,
+        "cursor_uid": state.backfill_cursor,
+        "bytes": state.backfill_bytes or 0,
+        "messages_per_sec": messages_per_sec,
+        "bytes_per_sec": bytes_per_sec,
+        "eta_seconds": eta_seconds,
+        "error": state.backfill_error,
+        "started_at": state.backfill_started_at.isoformat() if state.backfill_started_at else None,
+        "updated_at": state.backfill_updated_at.isoformat() if state.backfill_updated_at else None,
+    }
+
+
+class BackfillRunner:
+    """
+    Runs backfills as asyncio tasks in this process, at most
+    ``max_concurrent`` folders at a time. Progress lives in sync_states;
+    a folder another process has claimed is left to it.
+    """
+
+    def __init__(self, chunk: int = 500, max_rate: float = 50, max_concurrent: int = 2, body_limit: int = 5000):
+        self.chunk = chunk
+        self.max_rate = max_rate
+        self.body_limit = body_limit
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+        # (account_id, folder) -> counters at the start of the live run
+        self._rates: Dict[Tuple[int, str], dict] = {}
+
+    async def start(self, db: AsyncSession, account: EmailAccount, folder: str = 'INBOX', restart: bool = False) -> dict:
+        """
+        Start or resume the backfill of ``folder``. A finished backfill (or
+        any, with ``restart``) begins again from the newest message.
+        """
+        state = await get_sync_state(db, account.id, folder)
+        if restart or state.backfill_status in (None, "completed"):
+            state.backfill_uidvalidity = None
+            state.backfill_start_uid = None
+            state.backfill_cursor = None
+            state.backfill_done = 0
+            state.backfill_total = 0
+            state.backfill_bytes = 0
+            state.backfill_started_at = datetime.utcnow()
+        state.backfill_status = "running"
+        state.backfill_error = None
+        state.backfill_updated_at = datetime.utcnow()
+        await db.commit()
+
+        self._spawn(account.id, folder)
+        return self.progress(state)
+
+    async def pause(self, db: AsyncSession, account_id: int, folder: str = 'INBOX') -> dict:
+        """Stop after the current window is abandoned; resume picks up at the cursor"""
+        task = self._tasks.pop((account_id, folder), None)
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        state = await get_sync_state(db, account_id, folder)
+        if state.backfill_status == "running":
+            state.backfill_status = "paused"
+            state.backfill_updated_at = datetime.utcnow()
+        await db.commit()
+        return self.progress(state)
+
+    def progress(self, state: SyncState) -> dict:
+        return progress(state, self._rates.get((state.account_id, state.folder)))
+
+    async def resume_pending(self):
+        """Restart backfills that were running when the process stopped"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(SyncState.account_id, SyncState.folder).where(SyncState.backfill_status == "running")
+            )
+            pending = result.all()
+        for account_id, folder in pending:
+            logger.info(f"Resuming backfill of account {account_id}/{folder}")
+            self._spawn(account_id, folder)
+
+    def _spawn(self, account_id: int, folder: str):
+        key = (account_id, folder)
+        if key in self._tasks and not self._tasks[key].done():
+            return
+        task = asyncio.create_task(self._run(account_id, folder))
+        self._tasks[key] = task
+        task.add_done_callback(lambda t: self._tasks.pop(key, None) if self._tasks.get(key) is t else None)
+
+    async def _run(self, account_id: int, folder: str):
+        key = (account_id, folder)
+        async with self._slots:
+            async with AsyncSessionLocal() as db:
+                account = await db.get(EmailAccount, account_id)
+                state = await get_sync_state(db, account_id, folder)
+                if account is None or state.backfill_status != "running":
+                    return
+
+                async with claim(state.id) as owned:
+                    if not owned:
+                        logger.info(f"Backfill of account {account_id}/{folder} is running in another process")
+                        return
+                    # Nothing may have been walked between our read and the lock
+                    await db.refresh(state)
+                    if state.backfill_status != "running":
+                        return
+
+                    self._rates[key] = {
+                        "since": time.monotonic(),
+                        "done": state.backfill_done,
+                        "bytes": state.backfill_bytes,
+                    }
+                    try:
+                        await self._walk(db, account, state)
+                    except asyncio.CancelledError:
+                        # Pause or shutdown: keep the last committed checkpoint
+                        await db.rollback()
+                        raise
+                    except Exception as e:
+                        logger.exception(f"Backfill failed for account {account_id}/{folder}")
+                        await db.rollback()
+                        state.backfill_status = "failed"
+                        state.backfill_error = str(e)
+                        state.backfill_updated_at = datetime.utcnow()
+                        await db.commit()
+                    finally:
+                        self._rates.pop(key, None)
+
+    async def _walk(self, db: AsyncSession, account: EmailAccount, state: SyncState):
+        criteria = domain_search_criteria(account.domain_filter)
+        span = self.chunk
+
+        while True:
+            # A pause may have come through another process
+            status = await db.scalar(select(SyncState.backfill_status).where(SyncState.id == state.id))
+            if status != "running":
+                logger.info(f"Backfill {account.id}/{state.folder} is {status}, stopping")
+                return
+
+            window_started = time.monotonic()
+            async with pooled_worker(account) as worker:
+                bytes_before = worker.bytes_fetched
+                mailbox, walked, uids, low = await run_imap(
+                    plan_window, worker, state.folder, state.backfill_cursor, span, self.chunk, criteria
+                )
+
+                if state.backfill_uidvalidity != mailbox['uidvalidity']:
+                    if state.backfill_uidvalidity is not None:
+                        logger.info(f"UIDVALIDITY changed for account {account.id}/{state.folder}, restarting backfill")
+                    state.backfill_uidvalidity = mailbox['uidvalidity']
+                    state.backfill_start_uid = (mailbox['uidnext'] or 1) - 1
+                    state.backfill_cursor = state.backfill_start_uid + 1
+                    state.backfill_done = 0
+                    state.backfill_total = mailbox['exists']
+                    await db.commit()
+                    continue
+
+                stored = await fetch_and_store(
+                    db, worker, account, account.user_id, uids, self.body_limit,
+                    headers_first=True, folder=state.folder, uidvalidity=mailbox['uidvalidity'],
+                )
+                state.backfill_bytes = (state.backfill_bytes or 0) + worker.bytes_fetched - bytes_before
+
+            # The checkpoint commits with the window's rows
+            state.backfill_cursor = low
+            state.backfill_done = (state.backfill_done or 0) + walked
+            state.backfill_updated_at = datetime.utcnow()
+            finished = low <= 1
+            if finished:
+                state.backfill_status = "completed"
+                state.backfill_total = state.backfill_done
+            await db.commit()
+            if stored['inserted']:
+                await inbox_cache.bump(account.user_id)
+            logger.info(
+                f"Backfill {account.id}/{state.folder}: {state.backfill_done}/{state.backfill_total}, "
+                f"+{len(stored['inserted'])} stored, cursor {low}"
+            )
+            if finished:
+                return
+
+            # Dense windows shrink back to one chunk, sparse ones widen
+            if walked >= self.chunk:
+                span = self.chunk
+            elif walked < self.chunk // 2:
+                span = min(span * 2, self.chunk * MAX_SPAN_CHUNKS)
+
+            if self.max_rate:
+                delay = walked / self.max_rate - (time.monotonic() - window_started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    async def shutdown(self):
+        """Stop running backfills; they stay 'running' and resume on next start"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+backfill_runner = BackfillRunner(
+    chunk=settings.BACKFILL_CHUNK,
+    max_rate=settings.BACKFILL_MAX_MESSAGES_PER_SEC,
+    max_concurrent=settings.BACKFILL_MAX_CONCURRENT,
+    body_limit=settings.BACKFILL_BODY_LIMIT,
+)
@@ -0,0 +1,105 @@
+"""
+Content-addressed message bodies.
+
+Bodies live in ``email_bodies``, zlib-compressed and keyed by the SHA-256
+of their content, so the copies of a newsletter or mailing-list post that
+land in many mailboxes are stored once. ``emails`` only carries the hash,
+which keeps the hot metadata table small; bodies are read when a single
+message is opened. Bodies are written before the emails that point at
+them; ingest drops the ones it created for rows that turned out to be
+duplicates, in the same transaction (drop_unused_bodies).
+"""
+import hashlib
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+from sqlalchemy import String, any_, delete, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import EmailBody
+
+COMPRESSION_LEVEL = 6
+
+# 5 bound columns per row, under Postgres' 32767 parameter cap
+INSERT_CHUNK = 32767 // 5
+
+
+def compress(value: str) -> bytes:
+    return zlib.compress((value or "").encode(), COMPRESSION_LEVEL)
+
+
+def decompress(value: bytes) -> str:
+    return zlib.decompress(value).decode() if value else ""
+
+
+def body_hash(text: str, html: str = "") -> str:
+    digest = hashlib.sha256()
+    digest.update((text or "").encode())
+    digest.update(b"\0")
+    digest.update((html or "").encode())
+    return digest.hexdigest()
+
+
+def body_record(text: str, html: str = "") -> dict:
+    return {
+        "hash": body_hash(text, html),
+        "text_z": compress(text),
+        "html_z": compress(html) if html else None,
+        "size": len((text or "").encode()) + len((html or "").encode()),
+        "created_at": datetime.utcnow(),
+    }
+
+
+async def store_bodies(db: AsyncSession, records: Iterable[dict]) -> List[str]:
+    """
+    Insert body records, skipping content that is already stored. Returns
+    the hashes this call created. Rows go in hash order, so concurrent
+    syncs sharing bodies take the key locks in the same order and cannot
+    deadlock.
+    """
+    unique = sorted({record["hash"]: record for record in records}.values(), key=lambda r: r["hash"])
+    created = []
+    for start in range(0, len(unique), INSERT_CHUNK):
+        result = await db.execute(
+            pg_insert(EmailBody)
+            .values(unique[start:start + INSERT_CHUNK])
+            .on_conflict_do_nothing(index_elements=["hash"])
+            .returning(EmailBody.hash)
+        )
+        created.extend(result.scalars())
+    return created
+
+
+async def drop_unused_bodies(db: AsyncSession, created: Iterable[str], used: Iterable[str]):
+    """
+    Delete bodies from ``created`` (store_bodies in this transaction) that
+    no inserted email uses. Nothing else can reference them yet: they are
+    not committed.
+    """
+    unused = sorted(set(created) - set(used))
+    if unused:
+        await db.execute(delete(EmailBody).where(EmailBody.hash == any_(literal(unused, ARRAY(String)))))
+
+
+async def load_bodies(db: AsyncSession, hashes: List[str], html: bool = False) -> Dict[str, dict]:
+    """hash -> {"text", "html"} for the given hashes, in one query"""
+    hashes = [h for h in set(hashes) if h]
+    if not hashes:
+        return {}
+    columns = [EmailBody.hash, EmailBody.text_z] + ([EmailBody.html_z] if html else [])
+    result = await db.execute(select(*columns).where(EmailBody.hash.in_(hashes)))
+    return {
+        row.hash: {
+            "text": decompress(row.text_z),
+            "html": decompress(row.html_z) if html else None,
+        }
+        for row in result.all()
+    }
+
+
+async def load_body(db: AsyncSession, hash_: str, html: bool = False) -> dict:
+    bodies = await load_bodies(db, [hash_], html=html)
+    return bodies.get(hash_, {"text": "", "html": "" if html else None})
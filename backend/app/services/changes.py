@@ -0,0 +1,146 @@
+"""
+Per-user change log for delta sync (GET /emails/changes).
+
+Every insert, update and delete of an email appends (seq, email_id, op)
+to ``mailbox_changes`` in the writer's transaction. Sequence numbers come
+from the user's ``mailbox_seqs`` row; the upsert that reserves them holds
+its row lock until commit, so seqs become visible in order and a client
+that has seen seq N never misses a change <= N.
+
+A client keeps the last ``sync_token`` it received and asks for what
+changed since. The answer names ids only once per page, with their
+current list fields, so reconnecting costs kilobytes rather than whole
+inbox pages. Entries older than CHANGES_RETENTION_DAYS are trimmed; a
+token from before the trim gets 410 and the client refetches.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import AsyncSessionLocal
+from ..models import MailboxChange, MailboxSeq
+from .locks import run_as_leader
+
+logger = logging.getLogger(__name__)
+
+# pg_try_advisory_lock key electing the one process that trims
+_TRIMMER_LOCK = 0x7472  # "tr"
+
+# 5 bound columns per row, under Postgres' 32767 parameter cap
+INSERT_CHUNK = 32767 // 5
+
+
+class ChangesExpired(Exception):
+    """The token predates the retained change log"""
+
+
+async def reserve_seqs(db: AsyncSession, user_id: int, count: int) -> int:
+    """Reserve ``count`` seqs for ``user_id``; returns the first. Locks the user's row until commit."""
+    stmt = pg_insert(MailboxSeq).values(user_id=user_id, seq=count, trimmed_to=0)
+    result = await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["user_id"], set_={"seq": MailboxSeq.seq + stmt.excluded.seq}
+        ).returning(MailboxSeq.seq)
+    )
+    return result.scalar_one() - count + 1
+
+
+async def record_changes(db: AsyncSession, user_id: int, email_ids: Iterable[int], op: str):
+    """Log ``op`` for each email in seq order. Caller commits."""
+    email_ids = list(email_ids)
+    if not email_ids:
+        return
+    first = await reserve_seqs(db, user_id, len(email_ids))
+    now = datetime.utcnow()
+    rows = [
+        {"user_id": user_id, "seq": first + i, "email_id": email_id, "op": op, "created_at": now}
+        for i, email_id in enumerate(email_ids)
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK):
+        await db.execute(pg_insert(MailboxChange).values(rows[start:start + INSERT_CHUNK]))
+
+
+async def record_inserted(db: AsyncSession, inserted):
+    """'insert' for rows returned by an ingest INSERT ... RETURNING id, user_id"""
+    by_user = defaultdict(list)
+    for row in inserted:
+        by_user[row.user_id].append(row.id)
+    for user_id in sorted(by_user):
+        await record_changes(db, user_id, by_user[user_id], "insert")
+
+
+async def current_seq(db: AsyncSession, user_id: int) -> int:
+    result = await db.execute(select(MailboxSeq.seq).where(MailboxSeq.user_id == user_id))
+    return result.scalar_one_or_none() or 0
+
+
+async def changes_since(db: AsyncSession, user_id: int, since: int, limit: int) -> dict:
+    """
+    Up to ``limit`` log entries after ``since``, folded per email:
+    {"ops": {email_id: op}, "sync_token": last seq read, "has_more": bool}.
+    Raises ChangesExpired if entries after ``since`` were trimmed.
+    """
+    result = await db.execute(select(MailboxSeq.trimmed_to).where(MailboxSeq.user_id == user_id))
+    trimmed_to = result.scalar_one_or_none() or 0
+    if since < trimmed_to:
+        raise ChangesExpired()
+
+    result = await db.execute(
+        select(MailboxChange.seq, MailboxChange.email_id, MailboxChange.op)
+        .where((MailboxChange.user_id == user_id) & (MailboxChange.seq > since))
+        .order_by(MailboxChange.seq)
+        .limit(limit + 1)
+    )
+    entries = result.all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    ops = {}
+    for entry in entries:
+        # An insert followed by updates is still an insert
+        if entry.op == "update" and ops.get(entry.email_id) == "insert":
+            continue
+        ops[entry.email_id] = entry.op
+    return {
+        "ops": ops,
+        "sync_token": entries[-1].seq if entries else since,
+        "has_more": has_more,
+    }
+
+
+async def trim_changes(retention_days: int) -> int:
+    """Drop log entries older than the retention window, remembering how far each user was trimmed"""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(MailboxChange.user_id, func.max(MailboxChange.seq).label("seq"))
+            .where(MailboxChange.created_at < cutoff)
+            .group_by(MailboxChange.user_id)
+        )
+        trimmed = result.all()
+        for user_id, seq in trimmed:
+            await db.execute(
+                delete(MailboxChange).where((MailboxChange.user_id == user_id) & (MailboxChange.seq <= seq))
+            )
+            await db.execute(
+                update(MailboxSeq)
+                .where((MailboxSeq.user_id == user_id) & (MailboxSeq.trimmed_to < seq))
+                .values(trimmed_to=seq)
+            )
+        await db.commit()
+    return len(trimmed)
+
+
+async def run_trimmer(interval: int, retention_days: int):
+    """Trim every ``interval`` seconds in one API worker only"""
+    async def trim():
+        users = await trim_changes(retention_days)
+        if users:
+            logger.info(f"Trimmed change log for {users} users")
+
+    await run_as_leader(_TRIMMER_LOCK, 0, interval, trim, "Change log trim")
@@ -0,0 +1,216 @@
+"""
+Per-user, per-category mailbox counters (total/unread/starred/archived).
+
+Every write that adds emails or flips a flag applies its delta to
+``mailbox_counters`` in the same transaction, so the sidebar reads a few
+rows instead of COUNT(*) over the mailbox. A periodic reconciliation
+recomputes them from ``emails`` to repair any drift.
+
+Writers and the reconciler serialise per user on a transaction-scoped
+advisory lock, so a recount never overwrites an increment it did not see.
+Deltas also go out to connected clients as ``counters`` events.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import Email, MailboxCounter, User
+from .changes import record_changes
+from .events import queue_event
+from .locks import run_as_leader
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+COUNTER_FIELDS = ("total", "unread", "starred", "archived")
+UNCATEGORIZED = "uncategorized"
+
+# First key of pg_advisory_xact_lock(int, int); the second is the user id
+_LOCK_NAMESPACE = 0x6D63  # "mc"
+
+# pg_try_advisory_lock key electing the one process that reconciles
+_RECONCILER_LOCK = 0x7263  # "rc"
+
+# Counter columns moved by each boolean flag: True adds, False subtracts
+FLAG_COUNTERS = {
+    "is_read": ("unread", -1),
+    "is_starred": ("starred", 1),
+    "is_archived": ("archived", 1),
+}
+
+Deltas = Dict[Tuple[int, str], Dict[str, int]]
+
+
+def category_key(category: Optional[str]) -> str:
+    return category or UNCATEGORIZED
+
+
+def new_deltas() -> Deltas:
+    return defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+
+
+def add_email(deltas: Deltas, user_id: int, category, is_read, is_starred, is_archived, sign: int = 1):
+    """Count one email in (sign=1) or out (sign=-1) of ``deltas``"""
+    counts = deltas[(user_id, category_key(category))]
+    counts["total"] += sign
+    counts["unread"] += sign * (not is_read)
+    counts["starred"] += sign * bool(is_starred)
+    counts["archived"] += sign * bool(is_archived)
+
+
+def add_flag_change(deltas: Deltas, user_id: int, category, flag: str, value: bool):
+    """``flag`` went from ``not value`` to ``value`` on one email"""
+    field, direction = FLAG_COUNTERS[flag]
+    deltas[(user_id, category_key(category))][field] += direction * (1 if value else -1)
+
+
+async def lock_user(db: AsyncSession, user_id: int):
+    await db.execute(select(func.pg_advisory_xact_lock(_LOCK_NAMESPACE, user_id)))
+
+
+async def apply_deltas(db: AsyncSession, deltas: Deltas):
+    """Add ``deltas`` to the counters, creating rows as needed. Caller commits."""
+    changes = [
+        (key, counts) for key, counts in sorted(deltas.items())
+        if any(counts.values())
+    ]
+    for user_id in sorted({user_id for (user_id, _), _ in changes}):
+        await lock_user(db, user_id)
+
+    now = datetime.utcnow()
+    pushed = defaultdict(dict)
+    for (user_id, category), counts in changes:
+        pushed[user_id][category] = {field: value for field, value in counts.items() if value}
+        stmt = pg_insert(MailboxCounter).values(
+            user_id=user_id, category=category, updated_at=now, **counts
+        )
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["user_id", "category"],
+            set_={
+                **{field: getattr(MailboxCounter, field) + stmt.excluded[field] for field in COUNTER_FIELDS},
+                "updated_at": now,
+            },
+        ))
+    for user_id, categories in pushed.items():
+        queue_event(db, user_id, {"type": "counters", "data": categories})
+
+
+async def set_flag(db: AsyncSession, user_id: int, email_id: int, flag: str, value: bool) -> Optional[bool]:
+    """
+    Set one flag and move the counters with it. Returns None if the email
+    does not exist, else whether anything changed. Caller commits.
+    """
+    # User lock before row locks, the order ingest takes them in
+    await lock_user(db, user_id)
+    column = getattr(Email, flag)
+    result = await db.execute(
+        update(Email)
+        .where((Email.id == email_id) & (Email.user_id == user_id) & column.is_distinct_from(value))
+        .values({flag: value, "updated_at": datetime.utcnow()})
+        .returning(Email.ai_category)
+    )
+    changed = result.first()
+    if changed is None:
+        exists = await db.execute(
+            select(Email.id).where((Email.id == email_id) & (Email.user_id == user_id))
+        )
+        return False if exists.first() else None
+
+    deltas = new_deltas()
+    add_flag_change(deltas, user_id, changed.ai_category, flag, value)
+    await apply_deltas(db, deltas)
+    await record_changes(db, user_id, [email_id], "update")
+    queue_event(db, user_id, {"type": "flags", "data": {"ids": [email_id], flag: value}})
+    return True
+
+
+async def get_counters(db: AsyncSession, user_id: int) -> dict:
+    result = await db.execute(
+        select(MailboxCounter).where(MailboxCounter.user_id == user_id)
+    )
+    categories = {
+        row.category: {field: getattr(row, field) for field in COUNTER_FIELDS}
+        for row in result.scalars().all()
+    }
+    return {
+        "categories": categories,
+        "totals": {
+            field: sum(counts[field] for counts in categories.values())
+            for field in COUNTER_FIELDS
+        },
+    }
+
+
+async def reconcile_user(db: AsyncSession, user_id: int) -> int:
+    """Recount one user's counters from emails; returns rows corrected. Caller commits."""
+    await lock_user(db, user_id)
+    category = func.coalesce(Email.ai_category, UNCATEGORIZED)
+    result = await db.execute(
+        select(
+            category.label("category"),
+            func.count().label("total"),
+            func.count().filter(Email.is_read.isnot(True)).label("unread"),
+            func.count().filter(Email.is_starred.is_(True)).label("starred"),
+            func.count().filter(Email.is_archived.is_(True)).label("archived"),
+        )
+        .where(Email.user_id == user_id)
+        .group_by(category)
+    )
+    actual = {row.category: {field: getattr(row, field) for field in COUNTER_FIELDS} for row in result.all()}
+
+    stored = await db.execute(select(MailboxCounter).where(MailboxCounter.user_id == user_id))
+    stored = {row.category: row for row in stored.scalars().all()}
+
+    corrected = 0
+    now = datetime.utcnow()
+    for category_name, counts in actual.items():
+        row = stored.get(category_name)
+        if row is None:
+            db.add(MailboxCounter(user_id=user_id, category=category_name, updated_at=now, **counts))
+            corrected += 1
+        elif any(getattr(row, field) != counts[field] for field in COUNTER_FIELDS):
+            for field in COUNTER_FIELDS:
+                setattr(row, field, counts[field])
+            row.updated_at = now
+            corrected += 1
+
+    gone = [name for name in stored if name not in actual]
+    if gone:
+        await db.execute(
+            delete(MailboxCounter).where(
+                (MailboxCounter.user_id == user_id) & (MailboxCounter.category.in_(gone))
+            )
+        )
+        corrected += len(gone)
+    return corrected
+
+
+async def reconcile_all():
+    """Recount every user, one transaction each so locks stay short"""
+    async with AsyncSessionLocal() as db:
+        user_ids = (await db.execute(select(User.id))).scalars().all()
+
+    corrected = 0
+    for user_id in user_ids:
+        async with AsyncSessionLocal() as db:
+            try:
+                corrected += await reconcile_user(db, user_id)
+                await db.commit()
+            except Exception:
+                logger.exception(f"Counter reconciliation failed for user {user_id}")
+                await db.rollback()
+    if corrected:
+        logger.warning(f"Counter reconciliation corrected {corrected} rows")
+    return corrected
+
+
+async def run_reconciler(interval: int):
+    """Reconcile every ``interval`` seconds in one API worker only"""
+    await run_as_leader(_RECONCILER_LOCK, 0, interval, reconcile_all, "Counter reconciliation")
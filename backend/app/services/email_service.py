@@ -1,15 +1,35 @@
+import asyncio
 import imaplib
 import smtplib
 import email
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from email.parser import BytesHeaderParser
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from cryptography.fernet import Fernet
 from ..config import get_settings
+from .mime_parts import decode_part, find_text_part, iter_chunks, parse_fetch_response, section_value
+
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 # Use key from config
 cipher_suite = Fernet(settings.ENCRYPTION_KEY)
 
+# imaplib is blocking; all IMAP I/O from async code goes through this pool
+# so a slow server never stalls the event loop.
+imap_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAP_MAX_WORKERS, thread_name_prefix="imap"
+)
+
+async def run_imap(fn, *args, **kwargs):
+    """Run a blocking IMAP call on the IMAP thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(imap_executor, partial(fn, *args, **kwargs))
+
 def encrypt_password(password: str) -> str:
     return cipher_suite.encrypt(password.encode()).decode()
 
@@ -23,8 +43,20 @@ class IMAPWorker:
         self.username = username
         self.password = password
         self.connection = None
+        # Bookkeeping for imap_pool
+        self.pool_key = None
+        self.pool_host = server
+        self.last_used = 0.0
+        self.last_noop = 0.0
+        # FETCH payload bytes received, for throughput reporting
+        self.bytes_fetched = 0
 
     def connect(self):
+        if self.connection:
+            try:
+                self.connection.shutdown()
+            except Exception:
+                pass
         try:
             self.connection = imaplib.IMAP4_SSL(self.server, self.port)
             self.connection.login(self.username, self.password)
@@ -33,47 +65,320 @@ class IMAPWorker:
             print(f"IMAP Connection Error: {e}")
             raise e
 
+    def noop(self) -> bool:
+        """Keepalive; False if the server has gone away (BYE, reset, timeout)"""
+        try:
+            typ, _ = self.connection.noop()
+            return typ == 'OK'
+        except Exception:
+            return False
+
+    def logout(self):
+        """Close the selected folder and log out, ignoring a dead connection"""
+        if not self.connection:
+            return
+        try:
+            if self.connection.state == 'SELECTED':
+                self.connection.close()
+            self.connection.logout()
+        except Exception as e:
+            logger.debug(f"IMAP logout failed: {e}")
+        finally:
+            self.connection = None
+
+    def select_folder(self, folder='INBOX'):
+        """Select a folder and return its UIDVALIDITY, UIDNEXT and message count"""
+        if not self.connection:
+            self.connect()
+
+        typ, data = self.connection.select(folder)
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"Cannot select {folder}: {data}")
+
+        return {
+            'uidvalidity': self._untagged_int('UIDVALIDITY'),
+            'uidnext': self._untagged_int('UIDNEXT'),
+            'exists': int(data[0] or 0),
+        }
+
+    def _untagged_int(self, name):
+        _, data = self.connection.response(name)
+        try:
+            return int(data[-1])
+        except (TypeError, ValueError, IndexError):
+            return None
+
+    def search_uids(self, *criteria):
+        """UID SEARCH in the selected folder, returning ascending UIDs"""
+        _, data = self.connection.uid('SEARCH', None, *(criteria or ('ALL',)))
+        if not data or not data[0]:
+            return []
+        return sorted(int(uid) for uid in data[0].split())
+
+    def uids_after(self, last_uid, *criteria):
+        """UIDs strictly greater than last_uid, optionally narrowed by more criteria.
+
+        ``n:*`` always matches the highest UID even when it is <= n, so the
+        result is filtered client-side.
+        """
+        return [
+            uid for uid in self.search_uids('UID', f'{last_uid + 1}:*', *criteria)
+            if uid > last_uid
+        ]
+
+    def fetch_uid(self, uid, body_limit=5000):
+        """Fetch and parse a single message by UID"""
+        for _, email_data in self.fetch_uids([uid], body_limit=body_limit):
+            return email_data
+        return None
+
+    def fetch_uids(self, uids, batch_size=None, body_limit=5000):
+        """
+        Yield (uid, parsed message) for ``uids``, issuing one UID FETCH per
+        batch of ``batch_size`` (default EMAIL_BATCH_SIZE) instead of one
+        round trip per message.
+        """
+        for message_set in uid_batches(uids, batch_size):
+            yield from self.fetch_body_batch(message_set, body_limit)
+
+    def fetch_body_batch(self, message_set, body_limit=5000):
+        """Fetch a batch the way IMAP_FETCH_MODE says: 'structure' or 'full'"""
+        if settings.IMAP_FETCH_MODE == 'structure':
+            return self.fetch_text_batch(message_set, body_limit)
+        return self.fetch_batch(message_set, body_limit)
+
+    def fetch_batch(self, message_set, body_limit=5000):
+        """One UID FETCH of full messages for a compressed message set"""
+        _, msg_data = self.connection.uid('FETCH', message_set, '(UID RFC822)')
+        self.bytes_fetched += response_size(msg_data)
+        return [
+            (uid, parse_message(raw_message, generated_message_id(uid), body_limit))
+            for uid, raw_message in iter_fetch_response(msg_data)
+            if uid is not None
+        ]
+
+    def fetch_text_batch(self, message_set, body_limit=5000):
+        """
+        Same result as fetch_batch without downloading whole messages: one
+        FETCH of BODYSTRUCTURE + headers, then one partial BODY.PEEK[n]<0.N>
+        per distinct text part section, so attachments are never pulled.
+        """
+        _, msg_data = self.connection.uid(
+            'FETCH', message_set, f'(UID BODYSTRUCTURE {HEADER_FIELDS})'
+        )
+        self.bytes_fetched += response_size(msg_data)
+        messages = {}
+        wanted = {}
+        for item in parse_fetch_response(msg_data):
+            uid = item.get('UID')
+            if uid is None:
+                continue
+            email_data = parse_headers(section_value(item, 'BODY[HEADER'), generated_message_id(uid))
+            email_data['body'] = ""
+            messages[uid] = email_data
+
+            part = find_text_part(item.get('BODYSTRUCTURE'))
+            if part:
+                # body_limit chars of mostly-ASCII text in any transfer encoding
+                max_bytes = body_limit * 4
+                if part['size']:
+                    max_bytes = min(max_bytes, part['size'])
+                wanted.setdefault((part['section'], max_bytes), []).append((uid, part))
+
+        for (section, max_bytes), parts in wanted.items():
+            part_by_uid = dict(parts)
+            _, msg_data = self.connection.uid(
+                'FETCH', compress_uid_set(part_by_uid), f'(UID BODY.PEEK[{section}]<0.{max_bytes}>)'
+            )
+            self.bytes_fetched += response_size(msg_data)
+            for item in parse_fetch_response(msg_data):
+                uid = item.get('UID')
+                payload = section_value(item, f'BODY[{section}]')
+                if uid not in part_by_uid or payload is None:
+                    continue
+                part = part_by_uid[uid]
+                messages[uid]['body'] = decode_part(
+                    iter_chunks(bytes(payload)), part['encoding'], part['charset'], body_limit
+                )
+
+        for email_data in messages.values():
+            email_data['body'] = email_data['body'] or "[No content]"
+        return sorted(messages.items())
+
+    def fetch_headers(self, uids, batch_size=None):
+        """
+        Yield (uid, headers) using BODY.PEEK of just the headers the sync
+        needs to filter and dedup, so rejected messages never cost a body
+        download (and PEEK leaves \\Seen alone).
+        """
+        for message_set in uid_batches(uids, batch_size):
+            yield from self.fetch_header_batch(message_set)
+
+    def fetch_header_batch(self, message_set):
+        _, msg_data = self.connection.uid('FETCH', message_set, f'(UID {HEADER_FIELDS})')
+        self.bytes_fetched += response_size(msg_data)
+        return [
+            (uid, parse_headers(raw_headers, generated_message_id(uid)))
+            for uid, raw_headers in iter_fetch_response(msg_data)
+            if uid is not None
+        ]
+
+    def store_flags(self, message_set, flags, add=True):
+        """One UID STORE adding (or removing) ``flags`` on a message set in the selected folder"""
+        command = '+FLAGS.SILENT' if add else '-FLAGS.SILENT'
+        typ, data = self.connection.uid('STORE', message_set, command, f"({' '.join(flags)})")
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"UID STORE failed: {data}")
+
     def fetch_emails(self, limit=10):
         if not self.connection:
             self.connect()
         
-        self.connection.select('INBOX')
-        _, message_numbers = self.connection.search(None, 'ALL')
-        
-        messages = []
-        for num in message_numbers[0].split()[-limit:]:
-            _, msg_data = self.connection.fetch(num, '(RFC822)')
-            email_body = msg_data[0][1]
-            email_message = email.message_from_bytes(email_body)
-            
-            # Extract body text
-            body = ""
-            if email_message.is_multipart():
-                for part in email_message.walk():
-                    if part.get_content_type() == "text/plain":
-                        try:
-                            body = part.get_payload(decode=True).decode()
-                            break
-                        except:
-                            pass
-            else:
+        self.select_folder('INBOX')
+        uids = self.search_uids('ALL')[-limit:]
+        return [email_data for _, email_data in self.fetch_uids(uids)]
+
+HEADER_FIELDS = 'BODY.PEEK[HEADER.FIELDS (FROM MESSAGE-ID DATE SUBJECT REFERENCES IN-REPLY-TO)]'
+
+def generated_message_id(uid) -> str:
+    return f'<generated-uid-{uid}@imported>'
+
+def uid_batches(uids, batch_size=None):
+    """Sorted UIDs -> one compressed message set per batch_size UIDs"""
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    uids = sorted(uids)
+    for start in range(0, len(uids), batch_size):
+        yield compress_uid_set(uids[start:start + batch_size])
+
+def compress_uid_set(uids) -> str:
+    """[1, 2, 3, 7, 9, 10] -> '1:3,7,9:10'"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(lo) if lo == hi else f'{lo}:{hi}' for lo, hi in ranges)
+
+_UID_RE = re.compile(rb'UID (\d+)')
+
+_MESSAGE_ID_RE = re.compile(r'<[^<>\s]+>')
+
+def message_ids(value) -> list:
+    """Every <msg-id> in a header value, in order"""
+    return _MESSAGE_ID_RE.findall(str(value or ''))
+
+def thread_references(headers) -> list:
+    """
+    Parent chain of a message, oldest first: References, plus the
+    In-Reply-To parent when References is missing or does not end with it
+    """
+    references = message_ids(headers.get('References'))
+    in_reply_to = message_ids(headers.get('In-Reply-To'))
+    if in_reply_to and in_reply_to[0] not in references:
+        references.append(in_reply_to[0])
+    return references
+
+def response_size(msg_data) -> int:
+    """Bytes in an imaplib FETCH response, literals included"""
+    size = 0
+    for item in msg_data or ():
+        if isinstance(item, tuple):
+            size += sum(len(part) for part in item if isinstance(part, bytes))
+        elif isinstance(item, bytes):
+            size += len(item)
+    return size
+
+
+def iter_fetch_response(msg_data):
+    """
+    Walk an imaplib multi-message FETCH response, yielding (uid, literal)
+    per message as it goes. Servers may send the UID after the literal, in
+    which case it shows up in the trailing bytes item instead.
+    """
+    pending = None
+    for item in msg_data:
+        if isinstance(item, tuple):
+            if pending is not None:
+                yield pending[0], pending[1]
+            match = _UID_RE.search(item[0])
+            pending = [int(match.group(1)) if match else None, item[1]]
+        elif isinstance(item, bytes) and pending is not None and pending[0] is None:
+            match = _UID_RE.search(item)
+            if match:
+                pending[0] = int(match.group(1))
+    if pending is not None:
+        yield pending[0], pending[1]
+
+def parse_message(raw_message, fallback_message_id, body_limit=5000):
+    """Parse a raw RFC822 message into the dict shape used by the sync code"""
+    email_message = email.message_from_bytes(raw_message)
+
+    # Extract body text
+    body = ""
+    if email_message.is_multipart():
+        for part in email_message.walk():
+            if part.get_content_type() == "text/plain":
                 try:
-                    body = email_message.get_payload(decode=True).decode()
+                    body = part.get_payload(decode=True).decode('utf-8', errors='ignore')
+                    break
                 except:
-                    body = str(email_message.get_payload())
-            
-            # Extract message-id or create one
-            message_id = email_message.get('Message-ID', f'<generated-{num.decode()}@imported>')
-            
-            messages.append({
-                'message_id': message_id,
-                'subject': email_message.get('subject', '(no subject)'),
-                'from': email_message.get('from', ''),
-                'date': email_message.get('date', ''),
-                'body': body[:5000] if body else "[No content]"  # Limit to 5000 chars
-            })
-            
-        return messages
+                    pass
+    else:
+        try:
+            body = email_message.get_payload(decode=True).decode('utf-8', errors='ignore')
+        except:
+            body = str(email_message.get_payload())
+
+    return {
+        'message_id': email_message.get('Message-ID', fallback_message_id),
+        'subject': email_message.get('subject', '(no subject)'),
+        'from': email_message.get('from', ''),
+        'date': email_message.get('date', ''),
+        'references': thread_references(email_message),
+        'body': body[:body_limit] if body else "[No content]"
+    }
+
+def parse_headers(raw_headers, fallback_message_id):
+    """Parse a HEADER.FIELDS literal into the header keys of parse_message"""
+    headers = BytesHeaderParser().parsebytes(raw_headers or b'')
+    return {
+        'message_id': headers.get('Message-ID', fallback_message_id),
+        'subject': headers.get('subject', '(no subject)'),
+        'from': headers.get('from', ''),
+        'date': headers.get('date', ''),
+        'references': thread_references(headers),
+    }
+
+def sender_domain(from_address: str) -> str:
+    """Lower-cased domain of a From header value"""
+    address = from_address or ''
+    if '<' in address:
+        address = address.split('<')[1].split('>')[0]
+    return address.split('@')[-1].lower() if '@' in address else ''
+
+def parse_domain_filter(domain_filter):
+    """Comma-separated domain filter -> list of allowed domains (empty = allow all)"""
+    if not domain_filter:
+        return []
+    return [d.strip().lower() for d in domain_filter.split(',') if d.strip()]
+
+def matches_domain_filter(from_address: str, domain_filter) -> bool:
+    allowed_domains = parse_domain_filter(domain_filter)
+    return not allowed_domains or sender_domain(from_address) in allowed_domains
+
+def domain_search_criteria(domain_filter):
+    """
+    Push a domain filter down into IMAP SEARCH: ['OR', 'FROM', '"a.com"',
+    'FROM', '"b.com"']. FROM is a substring match, so results are a superset
+    and still go through matches_domain_filter.
+    """
+    criteria = []
+    for i, domain in enumerate(parse_domain_filter(domain_filter)):
+        if i:
+            criteria.insert(0, 'OR')
+        criteria += ['FROM', f'"{domain}"']
+    return criteria
 
 class SMTPWorker:
     def __init__(self, server, port, username, password):
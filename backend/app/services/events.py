@@ -0,0 +1,230 @@
+"""
+Mailbox change events, pushed to browsers over /ws.
+
+Writers queue compact events on their session (``queue_event``); they are
+published only after that transaction commits, so a client never hears
+about a row it cannot read yet. Publishing goes through Redis pub/sub,
+one channel per user, so mail ingested by any process (API worker, IDLE
+worker) reaches sockets held by any API worker.
+
+Each API worker runs one ``EventHub``: a single pub/sub connection
+subscribed to the channels of the users it currently holds sockets for.
+Every socket has a bounded queue. A client that falls behind loses its
+queued events and gets one ``{"type": "resync"}`` instead, telling it to
+refetch, so a slow reader costs at most ``queue_size`` messages.
+
+Event types: new_email, flags, counters, mailbox_changed, resync.
+"""
+import asyncio
+import json
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHANNEL_PREFIX = "mail:events:"
+# Keeps the pub/sub connection open while no user channel is subscribed
+CONTROL_CHANNEL = CHANNEL_PREFIX + "_control"
+
+RESYNC = json.dumps({"type": "resync"})
+
+_PENDING_KEY = "pending_events"
+_publishes = set()
+
+
+def queue_event(db: AsyncSession, user_id: int, event_: dict):
+    """Publish ``event_`` to the user's sockets once ``db`` commits"""
+    db.sync_session.info.setdefault(_PENDING_KEY, []).append((user_id, event_))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session: Session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    task = loop.create_task(event_hub.publish(pending))
+    _publishes.add(task)
+    task.add_done_callback(_publishes.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+class _Connection:
+    def __init__(self, websocket: WebSocket, queue_size: int, stats: Counter):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.stats = stats
+
+    def offer(self, message: str):
+        """Queue without waiting; on overflow swap the backlog for one resync"""
+        try:
+            self.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+        dropped = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            dropped += 1
+        self.queue.put_nowait(RESYNC)
+        self.stats["dropped"] += dropped
+        self.stats["resyncs"] += 1
+
+    async def send_loop(self):
+        while True:
+            message = await self.queue.get()
+            await self.websocket.send_text(message)
+            self.stats["sent"] += 1
+
+    async def receive_loop(self):
+        # Clients only send keepalives; reading is how a disconnect shows up
+        while True:
+            if await self.websocket.receive_text() == "ping":
+                self.offer('{"type":"pong"}')
+
+
+class EventHub:
+    def __init__(self, redis_url: Optional[str], queue_size: int = 100):
+        self.queue_size = queue_size
+        self._sockets: Dict[int, Set[_Connection]] = defaultdict(set)
+        self._redis = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        if redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+        self.stats = Counter()
+
+    async def start(self):
+        """Open the worker's pub/sub connection (API workers only)"""
+        if self._redis is None or self._listener is not None:
+            return
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(CONTROL_CHANNEL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def shutdown(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def publish(self, pending):
+        """Send (user_id, event) pairs to every worker, or deliver locally without Redis"""
+        messages = [(user_id, json.dumps(event_, default=str)) for user_id, event_ in pending]
+        if self._redis is not None:
+            try:
+                async with self._redis.pipeline(transaction=False) as pipe:
+                    for user_id, message in messages:
+                        pipe.publish(f"{CHANNEL_PREFIX}{user_id}", message)
+                    await pipe.execute()
+                self.stats["published"] += len(messages)
+                return
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Event publish failed, delivering locally only: {e}")
+        for user_id, message in messages:
+            self._deliver(user_id, message)
+
+    async def serve(self, websocket: WebSocket, user_id: int):
+        """Pump events to an accepted socket until either side goes away"""
+        connection = _Connection(websocket, self.queue_size, self.stats)
+        first = not self._sockets[user_id]
+        self._sockets[user_id].add(connection)
+        self.stats["connects"] += 1
+        if first:
+            await self._subscribe(user_id)
+
+        tasks = [
+            asyncio.create_task(connection.send_loop()),
+            asyncio.create_task(connection.receive_loop()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception) and not isinstance(result, WebSocketDisconnect):
+                    logger.debug(f"WebSocket for user {user_id} closed: {result!r}")
+            self._sockets[user_id].discard(connection)
+            if not self._sockets[user_id]:
+                del self._sockets[user_id]
+                await self._unsubscribe(user_id)
+
+    def snapshot(self) -> dict:
+        return {
+            "users": len(self._sockets),
+            "sockets": sum(len(sockets) for sockets in self._sockets.values()),
+            "queued": sum(c.queue.qsize() for sockets in self._sockets.values() for c in sockets),
+            **self.stats,
+        }
+
+    def _deliver(self, user_id: int, message: str):
+        for connection in list(self._sockets.get(user_id, ())):
+            connection.offer(message)
+        self.stats["delivered"] += 1
+
+    async def _subscribe(self, user_id: int):
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.subscribe(f"{CHANNEL_PREFIX}{user_id}")
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Event subscribe failed for user {user_id}: {e}")
+
+    async def _unsubscribe(self, user_id: int):
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.unsubscribe(f"{CHANNEL_PREFIX}{user_id}")
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Event unsubscribe failed for user {user_id}: {e}")
+
+    async def _listen(self):
+        backoff = 1
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+                backoff = 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # redis-py resubscribes every channel when it reconnects
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Event listener lost Redis ({e}); retrying in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            if not message or message.get("type") != "message":
+                continue
+            channel = message["channel"].decode()
+            try:
+                user_id = int(channel[len(CHANNEL_PREFIX):])
+            except ValueError:
+                continue
+            data = message["data"]
+            self._deliver(user_id, data.decode() if isinstance(data, bytes) else data)
+
+
+event_hub = EventHub(redis_url=settings.REDIS_URL, queue_size=settings.WS_QUEUE_SIZE)
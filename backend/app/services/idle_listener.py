@@ -0,0 +1,235 @@
+"""
+IMAP IDLE push listener.
+
+Holds one IDLE session per IMAP account on a single asyncio loop (no
+thread per connection) and turns EXISTS/EXPUNGE notifications into an
+incremental sync of just that account. That sync fetches UIDs above the
+account's high-water mark, so it picks up new mail only: an EXPUNGE
+wakes it, but messages deleted on the server stay in the database until
+a full resync. IDLE is re-issued every
+IMAP_IDLE_REISSUE seconds, under the 29 minute limit of RFC 2177, and the
+account list is reloaded every IMAP_IDLE_ACCOUNT_REFRESH seconds.
+
+Run it as its own process: ``python idle_worker.py``.
+"""
+import asyncio
+import logging
+import re
+import ssl
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import EmailAccount
+from .email_service import decrypt_password
+from .sync_engine import sync_engine
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+_EVENT_RE = re.compile(r'^\* (\d+) (EXISTS|EXPUNGE)', re.I)
+
+
+class IMAPCommandError(Exception):
+    pass
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+class AsyncIdleClient:
+    """Just enough of an asyncio IMAP client to LOGIN, SELECT and IDLE"""
+
+    def __init__(self, host: str, port: int, username: str, password: str, use_ssl: bool = True):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._tag = 0
+
+    async def connect(self, folder: str = 'INBOX'):
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                self.host, self.port, ssl=ssl.create_default_context() if self.use_ssl else None
+            ),
+            timeout=30,
+        )
+        await self._readline()  # greeting
+        await self.command(f'LOGIN {_quote(self.username)} {_quote(self.password)}')
+        await self.command(f'SELECT {_quote(folder)}')
+
+    async def command(self, command: str) -> List[str]:
+        """Send a command and return its untagged lines; raises unless OK"""
+        tag = self._next_tag()
+        await self._send(f'{tag} {command}')
+        return await self._read_until_tagged(tag)
+
+    async def idle(self, timeout: float) -> List[str]:
+        """
+        IDLE until the server reports EXISTS/EXPUNGE or ``timeout`` passes.
+        Returns the event lines seen (empty on timeout), including any the
+        server sent while IDLE was being started or ended.
+        """
+        tag = self._next_tag()
+        await self._send(f'{tag} IDLE')
+        events = []
+        line = await self._readline()
+        while not line.startswith('+'):
+            if line.startswith(tag):
+                raise IMAPCommandError(f'IDLE rejected: {line}')
+            if _EVENT_RE.match(line):
+                events.append(line)
+            line = await self._readline()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not events:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                line = await asyncio.wait_for(self._readline(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if line.startswith('* BYE'):
+                raise ConnectionError(line)
+            if _EVENT_RE.match(line):
+                events.append(line)
+
+        await self._send('DONE')
+        events += [line for line in await self._read_until_tagged(tag) if _EVENT_RE.match(line)]
+        return events
+
+    async def logout(self):
+        if not self.writer:
+            return
+        try:
+            await asyncio.wait_for(self.command('LOGOUT'), timeout=5)
+        except Exception:
+            pass
+        finally:
+            self.writer.close()
+            self.writer = None
+
+    def _next_tag(self) -> str:
+        self._tag += 1
+        return f'I{self._tag:04d}'
+
+    async def _send(self, line: str):
+        self.writer.write(line.encode() + b'\r\n')
+        await self.writer.drain()
+
+    async def _readline(self) -> str:
+        raw = await self.reader.readline()
+        if not raw:
+            raise ConnectionError('IMAP connection closed')
+        return raw.decode(errors='ignore').rstrip('\r\n')
+
+    async def _read_until_tagged(self, tag: str) -> List[str]:
+        untagged = []
+        while True:
+            line = await self._readline()
+            if line.startswith(f'{tag} '):
+                if line.split(' ', 2)[1].upper() != 'OK':
+                    raise IMAPCommandError(line)
+                return untagged
+            untagged.append(line)
+
+
+class IdleListener:
+    def __init__(
+        self,
+        reissue: int = 1500,
+        account_refresh: int = 300,
+        max_backoff: int = 300,
+    ):
+        self.reissue = reissue
+        self.account_refresh = account_refresh
+        self.max_backoff = max_backoff
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._fingerprints: Dict[int, tuple] = {}
+
+    async def run_forever(self):
+        try:
+            while True:
+                try:
+                    await self.refresh_accounts()
+                except Exception:
+                    logger.exception("Failed to load IMAP accounts for IDLE")
+                await asyncio.sleep(self.account_refresh)
+        finally:
+            await self.stop()
+
+    async def refresh_accounts(self):
+        """Start listeners for new accounts, restart changed ones, stop removed ones"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(
+                    EmailAccount.id, EmailAccount.user_id, EmailAccount.imap_server,
+                    EmailAccount.imap_port, EmailAccount.imap_username,
+                    EmailAccount.imap_password_encrypted,
+                ).where(EmailAccount.account_type == 'imap')
+            )
+            accounts = {row.id: tuple(row) for row in result.all()}
+
+        for account_id in list(self._tasks):
+            if self._fingerprints.get(account_id) != accounts.get(account_id):
+                self._tasks.pop(account_id).cancel()
+                self._fingerprints.pop(account_id, None)
+
+        for account_id, row in accounts.items():
+            if account_id not in self._tasks:
+                self._fingerprints[account_id] = row
+                self._tasks[account_id] = asyncio.create_task(self._listen(*row))
+
+        logger.info(f"IDLE listening on {len(self._tasks)} accounts")
+
+    async def _listen(self, account_id, user_id, server, port, username, password_encrypted):
+        """IDLE on one account forever, reconnecting with backoff"""
+        backoff = 5
+        while True:
+            client = None
+            try:
+                client = AsyncIdleClient(server, port or 993, username, decrypt_password(password_encrypted))
+                await client.connect()
+                backoff = 5
+                # Catch up on anything that arrived while we were not listening
+                self._trigger_sync(user_id, account_id)
+                while True:
+                    events = await client.idle(self.reissue)
+                    if events:
+                        logger.info(f"IDLE account {account_id}: {', '.join(events)}")
+                        self._trigger_sync(user_id, account_id)
+            except asyncio.CancelledError:
+                if client:
+                    await client.logout()
+                raise
+            except Exception as e:
+                logger.warning(f"IDLE account {account_id} dropped ({e}); retrying in {backoff}s")
+                if client:
+                    await client.logout()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _trigger_sync(self, user_id: int, account_id: int):
+        # Incremental: only UIDs above the account's high-water mark
+        sync_engine.submit(user_id, account_ids=[account_id], follow_up=True)
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        await sync_engine.shutdown()
+
+
+idle_listener = IdleListener(
+    reissue=settings.IMAP_IDLE_REISSUE,
+    account_refresh=settings.IMAP_IDLE_ACCOUNT_REFRESH,
+)
@@ -0,0 +1,264 @@
+"""
+Process-wide pool of authenticated IMAP sessions, keyed by account.
+
+Syncs check a session out instead of paying a TLS handshake and LOGIN
+every time. Idle sessions are kept alive with NOOP and logged out after
+IMAP_POOL_IDLE_TIMEOUT; open sessions per IMAP host are capped so we stay
+under provider connection limits.
+
+``acquire`` is a coroutine: waiting for a host slot happens on the event
+loop, and only NOOP, connect and logout go to the IMAP threads, so syncs
+queued for a busy host never pin the threads that checked-out sessions
+need to FETCH and release. The other methods are blocking and meant to be
+called through email_service.run_imap.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from ..config import get_settings
+from .email_service import run_imap
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class IMAPPoolTimeout(Exception):
+    pass
+
+
+class IMAPSessionPool:
+    def __init__(self, max_per_host=10, idle_timeout=600, keepalive=120, acquire_timeout=30):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.acquire_timeout = acquire_timeout
+
+        # Guards the bookkeeping below; never held across I/O or a wait
+        self._lock = threading.Lock()
+        # (loop, future) per acquire waiting for a slot
+        self._waiters = []
+        # key -> [worker, ...], least recently used keys first
+        self._idle = OrderedDict()
+        self._open = Counter()
+        self._closed = False
+        self._reaper = None
+        self.stats = Counter()
+
+    async def acquire(self, key, host, factory):
+        """
+        Check out a connected session for ``key``, reusing an idle one when
+        possible. ``factory`` builds a new (unconnected) IMAPWorker.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.acquire_timeout
+        while True:
+            with self._lock:
+                worker, granted, evicted = self._checkout(key, host)
+                if not granted:
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+            if granted:
+                break
+            try:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.stats["timeouts"] += 1
+                raise IMAPPoolTimeout(f"No IMAP session slot free for {host}")
+            finally:
+                with self._lock:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+
+        if evicted is not None:
+            await run_imap(evicted.logout)
+
+        if worker is not None:
+            if self._quiet_for(worker) > self.keepalive and not await run_imap(worker.noop):
+                # Server said BYE or the socket died while idle
+                self.stats["reconnects"] += 1
+                try:
+                    await run_imap(worker.connect)
+                except BaseException:
+                    self._forget(host)
+                    raise
+            self.stats["reused"] += 1
+            return worker
+
+        try:
+            worker = factory()
+            worker.pool_key, worker.pool_host = key, host
+            await run_imap(worker.connect)
+        except BaseException:
+            self._forget(host)
+            raise
+        self.stats["opened"] += 1
+        return worker
+
+    def _checkout(self, key, host):
+        """
+        Under the lock: (idle worker or None, granted, session to log out).
+        A grant without a worker reserves a slot for a new session.
+        """
+        sessions = self._idle.get(key)
+        if sessions:
+            worker = sessions.pop()
+            if not sessions:
+                del self._idle[key]
+            return worker, True, None
+        if self._open[host] < self.max_per_host:
+            self._open[host] += 1
+            return None, True, None
+        # Make room by closing another account's idle session on this host
+        evicted = self._pop_idle_for_host(host)
+        if evicted is not None:
+            self._open[host] += 1
+            return None, True, evicted
+        return None, False, None
+
+    def _notify(self):
+        """Under the lock: wake every waiting acquire to re-check; safe from any thread"""
+        waiters, self._waiters = self._waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_wake, waiter)
+
+    def release(self, worker, discard=False):
+        """Return a session; ``discard`` logs it out (e.g. after an error)"""
+        with self._lock:
+            if discard or self._closed or worker.connection is None:
+                self._open[worker.pool_host] -= 1
+                self._notify()
+            else:
+                worker.last_used = time.monotonic()
+                self._idle.setdefault(worker.pool_key, []).append(worker)
+                self._idle.move_to_end(worker.pool_key)
+                self._notify()
+                return
+        self.stats["discarded"] += 1
+        worker.logout()
+
+    def discard_key(self, key):
+        """Drop idle sessions for ``key``, e.g. after its credentials change"""
+        with self._lock:
+            sessions = self._idle.pop(key, [])
+            for worker in sessions:
+                self._open[worker.pool_host] -= 1
+            self._notify()
+        for worker in sessions:
+            worker.logout()
+
+    def reap(self):
+        """Log out sessions idle too long and NOOP the rest past ``keepalive``"""
+        now = time.monotonic()
+        expired, stale = [], []
+        with self._lock:
+            for key in list(self._idle):
+                keep = []
+                for worker in self._idle[key]:
+                    if now - worker.last_used > self.idle_timeout:
+                        expired.append(worker)
+                    elif self._quiet_for(worker, now) > self.keepalive:
+                        stale.append(worker)
+                    else:
+                        keep.append(worker)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+            for worker in expired:
+                self._open[worker.pool_host] -= 1
+            if expired:
+                self._notify()
+
+        for worker in expired:
+            self.stats["evicted"] += 1
+            worker.logout()
+        # Keepalive runs outside the lock. A NOOP does not count as use, so
+        # it never postpones idle eviction.
+        for worker in stale:
+            if not worker.noop():
+                self.release(worker, discard=True)
+                continue
+            worker.last_noop = time.monotonic()
+            with self._lock:
+                if self._closed:
+                    to_close = True
+                else:
+                    to_close = False
+                    self._idle.setdefault(worker.pool_key, []).append(worker)
+                    self._notify()
+            if to_close:
+                worker.logout()
+
+    def start(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_forever, name="imap-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_forever(self):
+        while not self._closed:
+            time.sleep(max(1, self.keepalive / 2))
+            try:
+                self.reap()
+            except Exception:
+                logger.exception("IMAP pool reaper failed")
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            sessions = [w for workers in self._idle.values() for w in workers]
+            self._idle.clear()
+            self._open.clear()
+            self._notify()
+        for worker in sessions:
+            worker.logout()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "idle": sum(len(workers) for workers in self._idle.values()),
+                "open_per_host": {host: n for host, n in self._open.items() if n},
+                **self.stats,
+            }
+
+    def _pop_idle_for_host(self, host):
+        """Remove the least recently used idle session on ``host``, if any"""
+        for key, workers in self._idle.items():
+            for worker in workers:
+                if worker.pool_host == host:
+                    workers.remove(worker)
+                    if not workers:
+                        del self._idle[key]
+                    self._open[host] -= 1
+                    self.stats["evicted"] += 1
+                    return worker
+        return None
+
+    @staticmethod
+    def _quiet_for(worker, now=None):
+        """Seconds since the session last talked to the server"""
+        return (now or time.monotonic()) - max(worker.last_used, worker.last_noop)
+
+    def _forget(self, host):
+        with self._lock:
+            self._open[host] -= 1
+            self._notify()
+
+
+def _wake(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+imap_pool = IMAPSessionPool(
+    max_per_host=settings.IMAP_POOL_MAX_PER_HOST,
+    idle_timeout=settings.IMAP_POOL_IDLE_TIMEOUT,
+    keepalive=settings.IMAP_POOL_KEEPALIVE,
+    acquire_timeout=settings.IMAP_POOL_ACQUIRE_TIMEOUT,
+)
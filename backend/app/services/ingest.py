@@ -0,0 +1,239 @@
+"""
+Bulk ingestion of parsed messages into ``emails``.
+
+Rows are written set-based with INSERT ... ON CONFLICT (user_id, message_id)
+DO NOTHING RETURNING id, so duplicates cost nothing extra and no
+per-message SELECT is needed. Large backfills stage rows with COPY into a
+temp table and merge them with the same conflict rule. Both paths fill
+search_vector in the same statement (see services/search.py); bodies go
+to the content-addressed email_bodies store first (services/bodies.py).
+Mailbox counters move in the same transaction (services/counters.py), and
+so do conversation threads (services/threads.py) and the change log
+(services/changes.py). New mail is announced
+to connected clients once the transaction commits (services/events.py).
+"""
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import List
+
+from sqlalchemy import String, column, literal, select, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import Email
+from .bodies import body_hash, body_record, drop_unused_bodies, store_bodies
+from .changes import record_inserted
+from .counters import add_email, apply_deltas, new_deltas
+from .events import queue_event
+from .search import search_vector
+from .threads import count_threaded, resolve_threads
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+INGEST_COLUMNS = [
+    "user_id", "message_id", "from_address", "from_name", "to_address",
+    "subject", "body_hash", "received_at", "is_read",
+    "is_starred", "is_archived", "ai_category", "created_at", "updated_at",
+    "preview", "account_id", "imap_uid", "imap_folder", "imap_uidvalidity", "thread_id",
+]
+
+# The COPY staging table also carries the plain body for search_vector
+STAGED_COLUMNS = INGEST_COLUMNS + ["body_text"]
+
+PREVIEW_LENGTH = 200
+
+# Where the quoted part of a reply or forward starts
+_QUOTE_START_RE = re.compile(
+    r'^\s*(On .{0,200}wrote:|-{2,}\s*(Original|Forwarded) Message\s*-{2,}|From: .+)\s*$',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Postgres caps a statement at 32767 bind parameters; search_vector
+# binds subject, sender and body once more per row
+INSERT_CHUNK = 32767 // (len(INGEST_COLUMNS) + 3)
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """``emails`` timestamps are naive UTC; asyncpg rejects aware values for them"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def make_preview(body: str, length: int = PREVIEW_LENGTH) -> str:
+    """Inbox preview: the new text of a message, quotes dropped, whitespace collapsed"""
+    if not body:
+        return ""
+    match = _QUOTE_START_RE.search(body)
+    if match and match.start() > 0:
+        body = body[:match.start()]
+    lines = [line for line in body.splitlines() if not line.lstrip().startswith('>')]
+    return " ".join(" ".join(lines).split())[:length]
+
+
+def email_row(
+    user_id: int,
+    email_data: dict,
+    received_at: datetime,
+    account_id: int = None,
+    imap_uid: int = None,
+    imap_folder: str = None,
+    imap_uidvalidity: int = None,
+) -> dict:
+    """
+    Parsed message dict (see email_service.parse_message) -> emails row.
+    ``body_text`` is not an emails column; it rides along for the body
+    store and the search vector, and ``thread_refs`` (the References
+    chain) for thread resolution.
+    """
+    from_addr = email_data['from']
+    now = datetime.utcnow()
+    return {
+        "user_id": user_id,
+        "message_id": email_data['message_id'],
+        "from_address": from_addr,
+        "from_name": from_addr.split('<')[0].strip() if '<' in from_addr else from_addr,
+        "to_address": "",
+        "subject": email_data['subject'],
+        "body_hash": body_hash(email_data['body']),
+        "body_text": email_data['body'],
+        "received_at": to_utc_naive(received_at),
+        "is_read": False,
+        "is_starred": False,
+        "is_archived": False,
+        "ai_category": "primary",
+        "created_at": now,
+        "updated_at": now,
+        "preview": make_preview(email_data['body']),
+        # Where the message lives on the server, for flag write-back
+        "account_id": account_id,
+        "imap_uid": imap_uid,
+        "imap_folder": imap_folder,
+        "imap_uidvalidity": imap_uidvalidity,
+        "thread_refs": email_data.get('references') or [],
+        "thread_id": None,
+    }
+
+
+# What the counters, threads and events need to know about each row actually inserted
+RETURNED_COLUMNS = (
+    Email.id, Email.user_id, Email.ai_category, Email.is_read, Email.is_starred, Email.is_archived,
+    Email.thread_id, Email.received_at, Email.message_id, Email.body_hash,
+)
+
+
+async def count_inserted(db: AsyncSession, inserted, created_threads, rows: List[dict]):
+    deltas = new_deltas()
+    for row in inserted:
+        add_email(deltas, row.user_id, row.ai_category, row.is_read, row.is_starred, row.is_archived)
+    await apply_deltas(db, deltas)
+    await count_threaded(db, inserted, created_threads)
+    await record_inserted(db, inserted)
+    announce_inserted(db, inserted, rows)
+
+
+def announce_inserted(db: AsyncSession, inserted, rows: List[dict]):
+    """new_email per message, or one mailbox_changed for a large batch (a backfill window)"""
+    by_user = defaultdict(list)
+    for row in inserted:
+        by_user[row.user_id].append(row)
+    headers = {(row["user_id"], row["message_id"]): row for row in rows}
+
+    for user_id, new in by_user.items():
+        if len(new) > settings.EVENTS_MAX_ITEMS:
+            queue_event(db, user_id, {"type": "mailbox_changed", "data": {"new": len(new)}})
+            continue
+        for row in new:
+            source = headers.get((user_id, row.message_id), {})
+            queue_event(db, user_id, {
+                "type": "new_email",
+                "data": {
+                    "id": row.id,
+                    "thread_id": row.thread_id,
+                    "from_address": source.get("from_address"),
+                    "from_name": source.get("from_name"),
+                    "subject": source.get("subject"),
+                    "preview": source.get("preview"),
+                    "ai_category": row.ai_category,
+                    "received_at": row.received_at.isoformat() if row.received_at else None,
+                },
+            })
+
+
+def with_search_vector(row: dict) -> dict:
+    return {
+        **{c: row[c] for c in INGEST_COLUMNS},
+        "search_vector": search_vector(
+            literal(row["subject"], String),
+            literal(row["from_address"], String),
+            literal(row["body_text"], String),
+        ),
+    }
+
+
+async def bulk_insert_emails(db: AsyncSession, rows: List[dict]) -> dict:
+    """
+    Insert ``rows``, skipping (user_id, message_id) pairs that already
+    exist. Returns {"inserted": [ids], "skipped": n}. The caller commits.
+    """
+    if not rows:
+        return {"inserted": [], "skipped": 0}
+    created_bodies = await store_bodies(db, (body_record(row["body_text"]) for row in rows))
+    created_threads = await resolve_threads(db, rows)
+    if len(rows) >= settings.INGEST_COPY_THRESHOLD:
+        inserted = await copy_insert_emails(db, rows)
+    else:
+        inserted = []
+        for start in range(0, len(rows), INSERT_CHUNK):
+            stmt = (
+                pg_insert(Email)
+                .values([with_search_vector(row) for row in rows[start:start + INSERT_CHUNK]])
+                .on_conflict_do_nothing(index_elements=["user_id", "message_id"])
+                .returning(*RETURNED_COLUMNS)
+            )
+            result = await db.execute(stmt)
+            inserted.extend(result.all())
+
+    await count_inserted(db, inserted, created_threads, rows)
+    await drop_unused_bodies(db, created_bodies, (row.body_hash for row in inserted))
+    return {"inserted": [row.id for row in inserted], "skipped": len(rows) - len(inserted)}
+
+
+async def copy_insert_emails(db: AsyncSession, rows: List[dict]) -> list:
+    """COPY ``rows`` into a temp table, then merge with ON CONFLICT DO NOTHING; returns RETURNED_COLUMNS rows"""
+    # Only the staged columns, without defaults: a copied id default would
+    # draw nextval('emails_id_seq') for every staged row, duplicates included
+    await db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS emails_ingest ON COMMIT DROP AS "
+        f"SELECT {', '.join(INGEST_COLUMNS)}, NULL::text AS body_text FROM emails WITH NO DATA"
+    ))
+    await db.execute(text("TRUNCATE emails_ingest"))
+
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        "emails_ingest",
+        records=[tuple(row[c] for c in STAGED_COLUMNS) for row in rows],
+        columns=STAGED_COLUMNS,
+    )
+
+    staged = table("emails_ingest", *(column(c) for c in STAGED_COLUMNS))
+    result = await db.execute(
+        pg_insert(Email)
+        .from_select(
+            INGEST_COLUMNS + ["search_vector"],
+            select(
+                *(staged.c[c] for c in INGEST_COLUMNS),
+                search_vector(staged.c.subject, staged.c.from_address, staged.c.body_text),
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "message_id"])
+        .returning(*RETURNED_COLUMNS)
+    )
+    inserted = result.all()
+    logger.info(f"COPY ingest: {len(inserted)} inserted, {len(rows) - len(inserted)} skipped")
+    return inserted
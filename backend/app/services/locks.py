@@ -0,0 +1,67 @@
+"""
+Postgres advisory locks for work exactly one process should do.
+
+Every uvicorn worker runs the same lifespan, so periodic jobs and resumed
+backfills start once per worker. A session-level advisory lock decides
+which one does the work. It is held on its own connection rather than a
+session's: a session hands its connection back to the pool at every
+commit, and a dead process loses the lock together with its connection.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable
+
+from sqlalchemy import func, select, text
+
+from ..database import engine
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def advisory_lock(namespace: int, key: int):
+    """
+    Try pg_try_advisory_lock(namespace, key) without waiting. Yields the
+    connection holding it, or None when another process has it.
+    """
+    async with engine.connect() as conn:
+        owned = await conn.scalar(select(func.pg_try_advisory_lock(namespace, key)))
+        # Nothing else runs on this connection; don't sit idle in a transaction
+        await conn.commit()
+        try:
+            yield conn if owned else None
+        finally:
+            if owned:
+                try:
+                    await conn.execute(select(func.pg_advisory_unlock(namespace, key)))
+                    await conn.commit()
+                except BaseException:
+                    # Never hand a connection still holding the lock back to the pool
+                    await conn.invalidate()
+                    raise
+
+
+async def run_as_leader(namespace: int, key: int, interval: int, job: Callable[[], Awaitable], name: str):
+    """
+    Run ``job`` every ``interval`` seconds in whichever process holds the
+    lock; the others retry each interval and take over when it goes away.
+    """
+    while True:
+        try:
+            async with advisory_lock(namespace, key) as conn:
+                while conn is not None:
+                    await asyncio.sleep(interval)
+                    # A dropped connection took the lock with it; stop before
+                    # running alongside whoever took it over
+                    await conn.execute(text("SELECT 1"))
+                    await conn.commit()
+                    try:
+                        await job()
+                    except Exception:
+                        logger.exception(f"{name} failed")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"{name} lost its lock connection")
+        await asyncio.sleep(interval)
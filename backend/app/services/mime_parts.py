@@ -0,0 +1,247 @@
+"""
+BODYSTRUCTURE-driven body fetching helpers.
+
+Instead of downloading a whole RFC822 message to keep the first few KB of
+its text/plain part, the sync reads BODYSTRUCTURE, picks the text part and
+fetches only a prefix of it (BODY.PEEK[n]<0.N>). This module parses the
+FETCH responses imaplib hands back and decodes the partial part body.
+"""
+import binascii
+import codecs
+import re
+
+# ---------- FETCH response parsing ----------
+
+class _Literal(bytes):
+    """Marks a value that arrived as an IMAP literal"""
+
+
+def _rebuild_stream(msg_data):
+    """
+    Yield one raw response per message from imaplib's FETCH data, with
+    literals put back inline ({n}\\r\\n + n bytes). imaplib splits a message
+    into (prefix, literal) tuples followed by the rest of the line.
+    """
+    buffer = b''
+    for item in msg_data:
+        if isinstance(item, tuple):
+            buffer += item[0] + b'\r\n' + item[1]
+        elif isinstance(item, bytes):
+            buffer += item
+            yield buffer
+            buffer = b''
+    if buffer:
+        yield buffer
+
+
+class _Tokenizer:
+    _ATOM_END = b' ()[]\r\n'
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def parse_value(self):
+        self._skip_spaces()
+        char = self.data[self.pos:self.pos + 1]
+        if char == b'(':
+            self.pos += 1
+            values = []
+            while True:
+                self._skip_spaces()
+                if self.data[self.pos:self.pos + 1] in (b')', b''):
+                    self.pos += 1
+                    return values
+                values.append(self.parse_value())
+        if char == b'"':
+            return self._quoted()
+        if char == b'{':
+            return self._literal()
+        return self._atom()
+
+    def _skip_spaces(self):
+        while self.data[self.pos:self.pos + 1] in (b' ', b'\r', b'\n'):
+            self.pos += 1
+
+    def _quoted(self):
+        self.pos += 1
+        out = bytearray()
+        while self.pos < len(self.data):
+            char = self.data[self.pos]
+            if char == 0x5C:  # backslash
+                out.append(self.data[self.pos + 1])
+                self.pos += 2
+                continue
+            self.pos += 1
+            if char == 0x22:  # closing quote
+                break
+            out.append(char)
+        return bytes(out).decode(errors='replace')
+
+    def _literal(self):
+        end = self.data.index(b'}', self.pos)
+        size = int(self.data[self.pos + 1:end])
+        start = end + 3  # skip "}\r\n"
+        self.pos = start + size
+        return _Literal(self.data[start:start + size])
+
+    def _atom(self):
+        start = self.pos
+        while self.pos < len(self.data) and self.data[self.pos:self.pos + 1] not in self._ATOM_END:
+            self.pos += 1
+        # Section specs like BODY[HEADER.FIELDS (FROM)]<0> are one key
+        if self.data[self.pos:self.pos + 1] == b'[':
+            self.pos = self.data.index(b']', self.pos) + 1
+            match = re.match(rb'<\d+>', self.data[self.pos:])
+            if match:
+                self.pos += match.end()
+        atom = self.data[start:self.pos].decode(errors='replace')
+        if atom.upper() == 'NIL':
+            return None
+        return int(atom) if atom.isdigit() else atom
+
+
+def parse_fetch_response(msg_data):
+    """imaplib FETCH data -> [{'UID': 5, 'BODYSTRUCTURE': [...], 'BODY[1]<0>': b'...'}]"""
+    messages = []
+    for raw in _rebuild_stream(msg_data):
+        match = re.match(rb'\s*(?:\* )?\d+ ', raw)
+        if not match:
+            continue
+        items = _Tokenizer(raw[match.end():]).parse_value()
+        if not isinstance(items, list):
+            continue
+        messages.append({
+            str(items[i]).upper(): items[i + 1] for i in range(0, len(items) - 1, 2)
+        })
+    return messages
+
+
+def section_value(message: dict, prefix: str):
+    """Value of the first key starting with ``prefix`` (servers echo sections differently)"""
+    for key, value in message.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+# ---------- BODYSTRUCTURE ----------
+
+def _params(value) -> dict:
+    if not isinstance(value, list):
+        return {}
+    return {
+        str(value[i]).lower(): value[i + 1] for i in range(0, len(value) - 1, 2)
+    }
+
+
+def _is_attachment(part: list, is_text: bool) -> bool:
+    # body-ext-1part follows the basic fields: md5 then disposition.
+    # text/* has an extra "lines" field before them.
+    disposition_index = 9 if is_text else 8
+    if len(part) > disposition_index and isinstance(part[disposition_index], list):
+        return str(part[disposition_index][0]).lower() == 'attachment'
+    return False
+
+
+def find_text_part(structure, section: str = ''):
+    """
+    First inline text/plain leaf (or the body of a single-part text
+    message) in a BODYSTRUCTURE, as
+    {'section', 'encoding', 'charset', 'size'}; None if there is none.
+    Attached messages (message/rfc822) are not descended into.
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+
+    if isinstance(structure[0], list):
+        # multipart: (part1)(part2)... "subtype" ...
+        # Parts are the leading lists; the subtype string ends them (the
+        # extension data after it can contain lists too)
+        for index, part in enumerate(structure):
+            if not isinstance(part, list):
+                break
+            child = f'{section}.{index + 1}' if section else str(index + 1)
+            found = find_text_part(part, child)
+            if found:
+                return found
+        return None
+
+    media_type = str(structure[0]).lower()
+    subtype = str(structure[1]).lower() if len(structure) > 1 else ''
+    if media_type != 'text' or _is_attachment(structure, True):
+        return None
+    # Like the full-message parser, a single-part message keeps whatever
+    # text it has; inside a multipart only text/plain counts
+    if section and subtype != 'plain':
+        return None
+
+    return {
+        # A non-multipart message's body is part 1
+        'section': section or '1',
+        'encoding': str(structure[5] or '7bit').lower() if len(structure) > 5 else '7bit',
+        'charset': _params(structure[2]).get('charset') or 'utf-8',
+        'size': structure[6] if len(structure) > 6 and isinstance(structure[6], int) else None,
+    }
+
+# ---------- Streaming decode ----------
+
+def _base64_chunks(chunks):
+    pending = b''
+    for chunk in chunks:
+        pending += re.sub(rb'[^A-Za-z0-9+/=]', b'', chunk)
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            try:
+                yield binascii.a2b_base64(pending[:usable])
+            except binascii.Error:
+                return
+            pending = pending[usable:]
+    # A truncated (partial-fetched) tail is dropped rather than mis-decoded
+
+
+def _qp_chunks(chunks):
+    pending = b''
+    for chunk in chunks:
+        pending += chunk
+        # Only decode complete lines; a soft break or =XX may straddle chunks
+        cut = pending.rfind(b'\n') + 1
+        if cut:
+            yield binascii.a2b_qp(pending[:cut])
+            pending = pending[cut:]
+    if pending:
+        yield binascii.a2b_qp(re.sub(rb'=[0-9A-Fa-f]?$', b'', pending))
+
+
+def decode_part(chunks, encoding: str, charset: str, limit: int) -> str:
+    """
+    Decode transfer encoding and charset incrementally over ``chunks``,
+    stopping once ``limit`` characters are produced.
+    """
+    if encoding == 'base64':
+        raw_chunks = _base64_chunks(chunks)
+    elif encoding == 'quoted-printable':
+        raw_chunks = _qp_chunks(chunks)
+    else:
+        raw_chunks = chunks
+
+    try:
+        decoder = codecs.getincrementaldecoder(charset)(errors='ignore')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+
+    out = []
+    produced = 0
+    for raw in raw_chunks:
+        text = decoder.decode(raw)
+        out.append(text)
+        produced += len(text)
+        if produced >= limit:
+            break
+    else:
+        out.append(decoder.decode(b'', final=True))
+    return ''.join(out)[:limit]
+
+
+def iter_chunks(data: bytes, size: int = 8192):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
@@ -0,0 +1,183 @@
+"""
+Set-based changes to many emails at once (POST /emails/bulk).
+
+One UPDATE ... FROM a locked snapshot of the target rows changes only the
+rows that actually differ and returns old and new values, which feed the
+mailbox counters in the same transaction. Read/star changes can then be
+written back to the IMAP server with one UID STORE per account and folder,
+for the rows whose stored UIDVALIDITY still matches the folder's.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import Integer, any_, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import Email, EmailAccount
+from .changes import record_changes
+from .counters import add_email, apply_deltas, lock_user, new_deltas
+from .email_service import run_imap, uid_batches
+from .events import queue_event
+from .search import search_query
+from .sync_service import pooled_worker, select_with_reconnect
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# Email columns a bulk request may set ("category" moves between categories)
+MUTABLE_FIELDS = {
+    "is_read": "is_read",
+    "is_starred": "is_starred",
+    "is_archived": "is_archived",
+    "category": "ai_category",
+}
+
+# Flags with a standard IMAP equivalent. Archive and category have none
+# that works across providers, so they stay local.
+IMAP_FLAGS = {"is_read": "\\Seen", "is_starred": "\\Flagged"}
+
+# UIDs per UID STORE; a compressed set this size stays well under line limits
+STORE_BATCH = 1000
+
+_write_backs = set()
+
+
+def target_conditions(user_id: int, ids: Optional[List[int]] = None, filters: Optional[dict] = None) -> list:
+    """WHERE clauses for the emails a bulk request addresses"""
+    conditions = [Email.user_id == user_id]
+    if ids is not None:
+        # One array parameter, however many ids
+        conditions.append(Email.id == any_(literal(list(ids), ARRAY(Integer))))
+    filters = filters or {}
+    if filters.get("category") is not None:
+        conditions.append(Email.ai_category == filters["category"])
+    for flag in ("is_read", "is_starred", "is_archived"):
+        if filters.get(flag) is not None:
+            conditions.append(getattr(Email, flag) == filters[flag])
+    if filters.get("received_before") is not None:
+        conditions.append(Email.received_at < filters["received_before"])
+    if filters.get("received_after") is not None:
+        conditions.append(Email.received_at > filters["received_after"])
+    if filters.get("search"):
+        conditions.append(Email.search_vector.op('@@')(search_query(filters["search"])))
+    return conditions
+
+
+async def bulk_update(
+    db: AsyncSession,
+    user_id: int,
+    changes: dict,
+    ids: Optional[List[int]] = None,
+    filters: Optional[dict] = None,
+):
+    """
+    Apply ``changes`` ({"is_read": True, "category": "work", ...}) to the
+    addressed emails in one statement and move the counters. Returns the
+    changed rows. Caller commits.
+    """
+    values = {MUTABLE_FIELDS[key]: value for key, value in changes.items() if value is not None}
+    if not values:
+        return []
+
+    # User lock before row locks, the order ingest takes them in
+    await lock_user(db, user_id)
+    # Lock the targets and remember their old values; rows that already
+    # match the requested values are left alone
+    old = (
+        select(Email.id, Email.ai_category, Email.is_read, Email.is_starred, Email.is_archived)
+        .where(*target_conditions(user_id, ids, filters))
+        .where(or_(*(getattr(Email, column).is_distinct_from(value) for column, value in values.items())))
+        .with_for_update()
+        .cte("old")
+    )
+    result = await db.execute(
+        update(Email)
+        .where(Email.id == old.c.id)
+        .values(**values, updated_at=datetime.utcnow())
+        .returning(
+            Email.id, Email.account_id, Email.imap_uid, Email.imap_folder, Email.imap_uidvalidity,
+            Email.ai_category, Email.is_read, Email.is_starred, Email.is_archived,
+            old.c.ai_category.label("old_category"), old.c.is_read.label("old_is_read"),
+            old.c.is_starred.label("old_is_starred"), old.c.is_archived.label("old_is_archived"),
+        )
+    )
+    rows = result.all()
+
+    deltas = new_deltas()
+    for row in rows:
+        add_email(deltas, user_id, row.old_category, row.old_is_read, row.old_is_starred, row.old_is_archived, sign=-1)
+        add_email(deltas, user_id, row.ai_category, row.is_read, row.is_starred, row.is_archived)
+    await apply_deltas(db, deltas)
+    await record_changes(db, user_id, [row.id for row in rows], "update")
+
+    if len(rows) > settings.EVENTS_MAX_ITEMS:
+        queue_event(db, user_id, {"type": "mailbox_changed", "data": {"updated": len(rows)}})
+    elif rows:
+        changed = {key: value for key, value in changes.items() if value is not None}
+        queue_event(db, user_id, {"type": "flags", "data": {"ids": [row.id for row in rows], **changed}})
+    return rows
+
+
+def schedule_write_back(user_id: int, rows, changes: dict) -> bool:
+    """Push read/star changes to IMAP in the background; False if there is nothing to push"""
+    flags = {IMAP_FLAGS[key]: value for key, value in changes.items() if key in IMAP_FLAGS and value is not None}
+    targets = [row for row in rows if row.account_id and row.imap_uid]
+    if not flags or not targets:
+        return False
+    task = asyncio.create_task(write_back(user_id, targets, flags))
+    _write_backs.add(task)
+    task.add_done_callback(_write_backs.discard)
+    return True
+
+
+async def shutdown_write_backs():
+    """Cancel pending write-backs before the IMAP pool closes"""
+    for task in list(_write_backs):
+        task.cancel()
+    await asyncio.gather(*_write_backs, return_exceptions=True)
+
+
+async def write_back(user_id: int, rows, flags: dict):
+    """
+    One UID STORE per account/folder for the flags set, one for those
+    cleared. UIDs recorded under another UIDVALIDITY than the folder's now
+    name other messages (or none), so those rows are skipped.
+    """
+    by_account = defaultdict(lambda: defaultdict(list))
+    for row in rows:
+        by_account[row.account_id][row.imap_folder or 'INBOX'].append((row.imap_uid, row.imap_uidvalidity))
+    to_add = [flag for flag, value in flags.items() if value]
+    to_remove = [flag for flag, value in flags.items() if not value]
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(EmailAccount).where(
+                (EmailAccount.id.in_(list(by_account))) & (EmailAccount.user_id == user_id)
+            )
+        )
+        accounts = result.scalars().all()
+
+    for account in accounts:
+        try:
+            async with pooled_worker(account) as worker:
+                for folder, targets in by_account[account.id].items():
+                    mailbox = await run_imap(select_with_reconnect, worker, folder)
+                    uids = [uid for uid, uidvalidity in targets if uidvalidity == mailbox['uidvalidity']]
+                    if len(uids) < len(targets):
+                        logger.warning(
+                            f"Skipping write-back of {len(targets) - len(uids)} emails in account "
+                            f"{account.id}/{folder}: UIDVALIDITY changed since they were synced"
+                        )
+                    for message_set in uid_batches(sorted(uids), STORE_BATCH):
+                        if to_add:
+                            await run_imap(worker.store_flags, message_set, to_add, True)
+                        if to_remove:
+                            await run_imap(worker.store_flags, message_set, to_remove, False)
+        except Exception:
+            logger.exception(f"IMAP flag write-back failed for account {account.id}")
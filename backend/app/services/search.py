@@ -0,0 +1,96 @@
+"""
+Full-text search over emails.
+
+Every row carries a weighted tsvector (subject A, sender B, body C),
+computed in SQL at ingest and indexed with GIN together with user_id
+(btree_gin), so a search only touches the user's matching rows.
+Queries use websearch_to_tsquery ("quoted phrases", -exclude, OR) and
+are ranked by ts_rank_cd with a boost for recent mail.
+"""
+import re
+from typing import Dict
+
+from sqlalchemy import Integer, Text, func, literal, literal_column, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import get_settings
+from ..models import Email
+from .bodies import load_bodies
+
+settings = get_settings()
+
+if not re.fullmatch(r'\w+', settings.SEARCH_TS_CONFIG):
+    raise ValueError(f"Invalid SEARCH_TS_CONFIG: {settings.SEARCH_TS_CONFIG!r}")
+
+# Inlined rather than bound so per-row ingest expressions stay small
+TS_CONFIG = literal_column(f"'{settings.SEARCH_TS_CONFIG}'::regconfig")
+
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=8"
+
+
+def _weighted(text, weight: str):
+    return func.setweight(
+        func.to_tsvector(TS_CONFIG, func.coalesce(text, literal_column("''"))),
+        literal_column(f"'{weight}'"),
+    )
+
+
+def search_vector(subject, from_address, body):
+    """
+    SQL expression for emails.search_vector. The arguments are column
+    elements or bound values, so the same expression serves row inserts
+    and the COPY merge.
+    """
+    # Split addresses so "alice", "example" and "com" are all searchable
+    sender = func.regexp_replace(from_address, literal_column(r"'[@.<>\"]+'"), literal_column("' '"), literal_column("'g'"))
+    return _weighted(subject, 'A').op('||')(_weighted(sender, 'B')).op('||')(_weighted(body, 'C'))
+
+
+def search_query(q: str):
+    return func.websearch_to_tsquery(TS_CONFIG, q)
+
+
+def search_rank(ts_query):
+    """
+    Relevance with a recency boost: ts_rank_cd normalised to 0..1, scaled
+    by up to 2x for mail from the last few weeks and ~1x for old mail.
+    """
+    age_days = func.extract(
+        'epoch', func.now() - func.coalesce(Email.received_at, Email.created_at)
+    ) / 86400.0
+    recency = 1.0 + 1.0 / (1.0 + func.greatest(age_days, 0.0) / float(settings.SEARCH_RECENCY_DAYS))
+    return func.ts_rank_cd(Email.search_vector, ts_query, 32) * recency
+
+
+def apply_search(query, q: str):
+    """Restrict a select(Email...) to matches of ``q``, best first"""
+    ts_query = search_query(q)
+    return (
+        query.where(Email.search_vector.op('@@')(ts_query))
+        .order_by(search_rank(ts_query).desc(), Email.received_at.desc(), Email.id.desc())
+    )
+
+
+async def search_snippets(db: AsyncSession, body_hashes: Dict[int, str], q: str) -> Dict[int, str]:
+    """
+    ts_headline body snippets for one page of results ({email id: body
+    hash}). Bodies are stored compressed, so they are loaded and
+    decompressed here and handed to ts_headline as parameters; only the
+    returned rows pay for it.
+    """
+    if not body_hashes:
+        return {}
+    bodies = await load_bodies(db, list(body_hashes.values()))
+    ids = list(body_hashes)
+    texts = [
+        bodies.get(body_hashes[email_id], {}).get("text", "")[:settings.SEARCH_HEADLINE_CHARS]
+        for email_id in ids
+    ]
+    page = func.unnest(
+        literal(ids, ARRAY(Integer)), literal(texts, ARRAY(Text))
+    ).table_valued("id", "body").render_derived(name="page")
+    result = await db.execute(
+        select(page.c.id, func.ts_headline(TS_CONFIG, page.c.body, search_query(q), HEADLINE_OPTIONS))
+    )
+    return dict(result.all())
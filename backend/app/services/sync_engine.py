@@ -0,0 +1,262 @@
+"""
+Background sync jobs: POST /emails/sync enqueues, GET /emails/sync/{job_id}
+reports progress. IMAP I/O runs on the bounded IMAP thread pool
+(email_service.run_imap), so the API event loop stays responsive.
+
+A job syncs a user's accounts concurrently, bounded per user, per IMAP
+host and globally. Every account gets its own DB session, so one failing
+account rolls back only its own writes.
+
+The worker that runs a job also writes its status to Redis on every
+change, so a poll that lands on another uvicorn worker still finds it.
+"""
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+
+from ..config import get_settings
+from ..database import AsyncSessionLocal
+from ..models import EmailAccount
+from ..utils.inbox_cache import inbox_cache
+from .sync_service import sync_account
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass
+class SyncJob:
+    id: str
+    user_id: int
+    status: str = "queued"  # queued, running, completed, failed
+    accounts_total: int = 0
+    accounts_done: int = 0
+    synced: int = 0
+    skipped: int = 0
+    errors: List[str] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "accounts_total": self.accounts_total,
+            "accounts_done": self.accounts_done,
+            "synced": self.synced,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SyncJob":
+        """Inverse of to_dict plus ``user_id``, for jobs read back from Redis"""
+        def when(value):
+            return datetime.fromisoformat(value) if value else None
+
+        return cls(
+            id=data["job_id"],
+            user_id=data["user_id"],
+            status=data["status"],
+            accounts_total=data["accounts_total"],
+            accounts_done=data["accounts_done"],
+            synced=data["synced"],
+            skipped=data["skipped"],
+            errors=data["errors"],
+            created_at=when(data["created_at"]),
+            started_at=when(data["started_at"]),
+            finished_at=when(data["finished_at"]),
+        )
+
+
+class SyncEngine:
+    """
+    Job registry. Jobs run in this worker and live in its memory, bounded
+    to SYNC_JOB_HISTORY entries (the oldest finished jobs are dropped
+    first), and in Redis for ``job_ttl`` seconds for the other workers.
+    """
+
+    def __init__(
+        self,
+        history: int = 1000,
+        max_concurrent: int = 8,
+        max_per_user: int = 3,
+        max_per_host: int = 4,
+        redis_url: Optional[str] = None,
+        job_ttl: int = 86400,
+    ):
+        self.history = history
+        self.job_ttl = job_ttl
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+        self._closing = False
+        self.jobs: "OrderedDict[str, SyncJob]" = OrderedDict()
+        self._active: Dict[int, str] = {}
+        # user_id -> account ids (None = all) to sync again once the
+        # running job finishes, for mail that arrived mid-sync
+        self._follow_up: Dict[int, Optional[Set[int]]] = {}
+        self._tasks = set()
+
+        self._global_slots = asyncio.Semaphore(max_concurrent)
+        self._user_slots = defaultdict(lambda: asyncio.Semaphore(max_per_user))
+        self._host_slots = defaultdict(lambda: asyncio.Semaphore(max_per_host))
+
+    def submit(
+        self,
+        user_id: int,
+        limit: int = 20,
+        account_ids: Optional[Iterable[int]] = None,
+        follow_up: bool = False,
+    ) -> SyncJob:
+        """
+        Start a sync for ``user_id`` (optionally only ``account_ids``), or
+        return the one already running. With ``follow_up`` a running job is
+        re-run for those accounts once it finishes instead.
+        """
+        account_ids = set(account_ids) if account_ids is not None else None
+        active_id = self._active.get(user_id)
+        if active_id and not self.jobs[active_id].finished:
+            if follow_up:
+                pending = self._follow_up.get(user_id, set())
+                self._follow_up[user_id] = (
+                    None if pending is None or account_ids is None else pending | account_ids
+                )
+            return self.jobs[active_id]
+
+        job = SyncJob(id=uuid.uuid4().hex, user_id=user_id)
+        self.jobs[job.id] = job
+        self._active[user_id] = job.id
+        self._prune()
+
+        task = asyncio.create_task(self._run(job, limit, account_ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def get(self, job_id: str) -> Optional[SyncJob]:
+        """A job from this worker, or as last saved by whichever worker runs it"""
+        job = self.jobs.get(job_id)
+        if job is not None or self._redis is None:
+            return job
+        try:
+            raw = await self._redis.get(self._key(job_id))
+        except Exception as e:
+            logger.warning(f"Sync job status read failed: {e}")
+            return None
+        return SyncJob.from_dict(json.loads(raw)) if raw else None
+
+    async def save(self, job: SyncJob):
+        """Publish ``job``'s status for the other workers"""
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(
+                self._key(job.id), json.dumps({"user_id": job.user_id, **job.to_dict()}), ex=self.job_ttl
+            )
+        except Exception as e:
+            logger.warning(f"Sync job status write failed: {e}")
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"sync:job:{job_id}"
+
+    def _prune(self):
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.history:
+                break
+            if self.jobs[job_id].finished:
+                del self.jobs[job_id]
+
+    async def _run(self, job: SyncJob, limit: int, account_ids: Optional[Set[int]] = None):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        await self.save(job)
+        try:
+            async with AsyncSessionLocal() as db:
+                query = select(EmailAccount.id, EmailAccount.email_address, EmailAccount.imap_server).where(
+                    (EmailAccount.user_id == job.user_id) &
+                    (EmailAccount.account_type == 'imap')
+                )
+                if account_ids is not None:
+                    query = query.where(EmailAccount.id.in_(account_ids))
+                result = await db.execute(query)
+                accounts = result.all()
+            job.accounts_total = len(accounts)
+            await self.save(job)
+
+            await asyncio.gather(*(
+                self._sync_one(job, account_id, email_address, (imap_server or '').lower(), limit)
+                for account_id, email_address, imap_server in accounts
+            ))
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.errors.append("Cancelled at shutdown")
+            job.status = "failed"
+            raise
+        except Exception as e:
+            logger.exception(f"Sync job {job.id} failed")
+            job.errors.append(str(e))
+            job.status = "failed"
+        finally:
+            job.finished_at = datetime.utcnow()
+            self._user_slots.pop(job.user_id, None)
+            follow_up = self._follow_up.pop(job.user_id, False)
+            # No new tasks once shutdown() is cancelling them
+            if follow_up is not False and not self._closing:
+                self.submit(job.user_id, limit, follow_up)
+            await self.save(job)
+
+    async def _sync_one(self, job: SyncJob, account_id: int, email_address: str, host: str, limit: int):
+        """Sync one account in its own session, within the concurrency limits"""
+        async with self._user_slots[job.user_id], self._host_slots[host], self._global_slots:
+            async with AsyncSessionLocal() as db:
+                try:
+                    account = await db.get(EmailAccount, account_id)
+                    if account is None:
+                        return
+                    counts = await sync_account(db, account, job.user_id, limit=limit, body_limit=5000)
+                    await db.commit()
+                    if counts["synced"]:
+                        await inbox_cache.bump(job.user_id)
+                    job.synced += counts["synced"]
+                    job.skipped += counts["skipped"]
+                except Exception as e:
+                    logger.exception(f"Sync failed for account {email_address}")
+                    job.errors.append(f"{email_address}: {e}")
+                    await db.rollback()
+                finally:
+                    job.accounts_done += 1
+                    await self.save(job)
+
+    async def shutdown(self):
+        self._closing = True
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+sync_engine = SyncEngine(
+    history=settings.SYNC_JOB_HISTORY,
+    max_concurrent=settings.SYNC_MAX_CONCURRENT,
+    max_per_user=settings.SYNC_MAX_PER_USER,
+    max_per_host=settings.SYNC_MAX_PER_HOST,
+    redis_url=settings.REDIS_URL,
+    job_ttl=settings.SYNC_JOB_TTL,
+)
@@ -0,0 +1,254 @@
+"""
+Conversation threading, JWZ style, done incrementally at ingest.
+
+``thread_refs`` maps every Message-ID a user has seen or been referenced
+to a thread, like the id_table of the JWZ algorithm. A new batch is
+resolved before it is inserted: each message is unioned with its
+References/In-Reply-To chain, the chain is looked up in ``thread_refs``
+with one query, and the connected messages share one thread. When a
+message links two existing threads (a reply that arrived before its
+parent, say) they are merged into the older one.
+
+Thread rows carry the message count and latest message, moved in the same
+transaction as the insert, so the thread list is one index scan.
+Resolution runs under the per-user lock the counters use
+(services/counters.py), so concurrent syncs cannot split a conversation.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import DateTime, Integer, String, any_, bindparam, case, delete, func, literal, literal_column, or_, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..models import Email, Thread, ThreadRef
+from .changes import record_changes
+from .counters import lock_user
+from .email_service import message_ids
+
+# 3 bound columns per thread_refs row, under Postgres' 32767 parameter cap
+REF_INSERT_CHUNK = 32767 // 3
+
+_SUBJECT_PREFIX_RE = re.compile(r'^\s*((re|fwd?|aw|sv)\s*(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+
+
+def normalize_message_id(value: str) -> str:
+    """'<id@host>' from a raw Message-ID header, or the stripped value if it has no brackets"""
+    found = message_ids(value)
+    return found[0] if found else (value or "").strip()
+
+
+def base_subject(subject: str) -> str:
+    """Subject without Re:/Fwd: prefixes, for the thread row"""
+    return _SUBJECT_PREFIX_RE.sub("", subject or "").strip()
+
+
+def _ids_param(values) -> ARRAY:
+    return literal(list(values), ARRAY(Integer))
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, key):
+        self.parent.setdefault(key, key)
+        root = key
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[key] != root:
+            self.parent[key], key = root, self.parent[key]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[root_b] = root_a
+
+
+async def resolve_threads(db: AsyncSession, rows: List[dict]) -> List[int]:
+    """
+    Set ``thread_id`` on each emails row dict (``thread_refs`` carries its
+    parent chain), creating and merging threads as needed. Returns the ids
+    of threads created, for count_threaded. Caller commits.
+    """
+    by_user = defaultdict(list)
+    for row in rows:
+        by_user[row["user_id"]].append(row)
+
+    created = []
+    for user_id in sorted(by_user):
+        await lock_user(db, user_id)
+        created += await _resolve_user(db, user_id, by_user[user_id])
+    return created
+
+
+async def _resolve_user(db: AsyncSession, user_id: int, rows: List[dict]) -> List[int]:
+    # Message-IDs are str keys, existing threads int keys
+    links = _UnionFind()
+    own_ids = []
+    for row in rows:
+        own = normalize_message_id(row["message_id"])
+        own_ids.append(own)
+        links.find(own)
+        for parent in row.get("thread_refs") or ():
+            links.union(own, parent)
+
+    message_keys = [key for key in links.parent if isinstance(key, str)]
+    result = await db.execute(
+        select(ThreadRef.message_id, ThreadRef.thread_id).where(
+            (ThreadRef.user_id == user_id)
+            & (ThreadRef.message_id == any_(literal(message_keys, ARRAY(String))))
+        )
+    )
+    for message_id, thread_id in result.all():
+        links.union(message_id, thread_id)
+
+    existing = defaultdict(set)
+    for key in list(links.parent):
+        if isinstance(key, int):
+            existing[links.find(key)].add(key)
+
+    # Each connected group keeps its oldest thread and absorbs the rest
+    thread_of = {}
+    merges = {}
+    new_groups, new_groups_seen = [], set()
+    for own in own_ids:
+        group = links.find(own)
+        if group in thread_of or group in new_groups_seen:
+            continue
+        threads = existing.get(group)
+        if threads:
+            survivor = min(threads)
+            thread_of[group] = survivor
+            if len(threads) > 1:
+                merges[survivor] = sorted(threads - {survivor})
+        else:
+            new_groups.append(group)
+            new_groups_seen.add(group)
+
+    if merges:
+        await _merge_threads(db, user_id, merges)
+
+    created = []
+    if new_groups:
+        created = list((await db.execute(
+            select(func.nextval(literal_column("'threads_id_seq'"))).select_from(func.generate_series(1, len(new_groups)))
+        )).scalars())
+        thread_of.update(zip(new_groups, created))
+        first_row = {}
+        for row, own in zip(rows, own_ids):
+            first_row.setdefault(links.find(own), row)
+        await db.execute(
+            pg_insert(Thread).values([
+                {
+                    "id": thread_id,
+                    "user_id": user_id,
+                    "subject": base_subject(first_row[group]["subject"]),
+                    "message_count": 0,
+                    "created_at": datetime.utcnow(),
+                }
+                for group, thread_id in zip(new_groups, created)
+            ])
+        )
+
+    for row, own in zip(rows, own_ids):
+        row["thread_id"] = thread_of[links.find(own)]
+
+    # Remember every id of the batch, referenced parents included; ids
+    # already mapped point into the surviving thread after the merge
+    refs = [
+        {"user_id": user_id, "message_id": key, "thread_id": thread_of[links.find(key)]}
+        for key in message_keys
+        if links.find(key) in thread_of
+    ]
+    for start in range(0, len(refs), REF_INSERT_CHUNK):
+        await db.execute(
+            pg_insert(ThreadRef)
+            .values(refs[start:start + REF_INSERT_CHUNK])
+            .on_conflict_do_nothing(index_elements=["user_id", "message_id"])
+        )
+    return created
+
+
+async def _merge_threads(db: AsyncSession, user_id: int, merges: Dict[int, List[int]]):
+    """Fold each list of threads into its survivor: emails, refs and stats"""
+    merged = [thread_id for others in merges.values() for thread_id in others]
+    result = await db.execute(
+        select(Thread.id, Thread.message_count, Thread.latest_at, Thread.latest_email_id)
+        .where(Thread.id == any_(_ids_param(merged)))
+    )
+    stats = {row.id: row for row in result.all()}
+
+    deltas = {}
+    for survivor, others in merges.items():
+        moved = await db.execute(
+            update(Email)
+            .where((Email.thread_id == any_(_ids_param(others))) & (Email.user_id == user_id))
+            .values(thread_id=survivor)
+            .returning(Email.id)
+        )
+        await record_changes(db, user_id, moved.scalars().all(), "update")
+        await db.execute(
+            update(ThreadRef)
+            .where((ThreadRef.thread_id == any_(_ids_param(others))) & (ThreadRef.user_id == user_id))
+            .values(thread_id=survivor)
+        )
+        for other in (stats[thread_id] for thread_id in others if thread_id in stats):
+            _add_delta(deltas, survivor, other.message_count, other.latest_at, other.latest_email_id)
+
+    await db.execute(delete(Thread).where(Thread.id == any_(_ids_param(merged))))
+    await _apply_deltas(db, deltas)
+
+
+def _add_delta(deltas: dict, thread_id: int, count: int, latest_at, latest_email_id):
+    delta = deltas.setdefault(thread_id, {"added": 0, "p_latest_at": None, "p_latest_email_id": None})
+    delta["added"] += count
+    if latest_at is not None and (delta["p_latest_at"] is None or latest_at >= delta["p_latest_at"]):
+        delta["p_latest_at"] = latest_at
+        delta["p_latest_email_id"] = latest_email_id
+
+
+async def _apply_deltas(db: AsyncSession, deltas: dict):
+    """One executemany UPDATE: add to message_count, move latest forward"""
+    if not deltas:
+        return
+    threads = Thread.__table__
+    latest_at = bindparam("p_latest_at", type_=DateTime)
+    await db.execute(
+        update(threads)
+        .where(threads.c.id == bindparam("p_id", type_=Integer))
+        .values(
+            message_count=threads.c.message_count + bindparam("added", type_=Integer),
+            # GREATEST ignores NULLs
+            latest_at=func.greatest(threads.c.latest_at, latest_at),
+            latest_email_id=case(
+                (latest_at.is_(None), threads.c.latest_email_id),
+                (
+                    or_(threads.c.latest_at.is_(None), latest_at >= threads.c.latest_at),
+                    bindparam("p_latest_email_id", type_=Integer),
+                ),
+                else_=threads.c.latest_email_id,
+            ),
+        ),
+        [{"p_id": thread_id, **delta} for thread_id, delta in sorted(deltas.items())],
+    )
+
+
+async def count_threaded(db: AsyncSession, inserted, created: List[int]):
+    """
+    Move thread stats for the rows actually inserted (RETURNING thread_id,
+    received_at, id) and drop new threads whose rows were all duplicates.
+    """
+    deltas = {}
+    for row in inserted:
+        if row.thread_id is not None:
+            _add_delta(deltas, row.thread_id, 1, row.received_at, row.id)
+    await _apply_deltas(db, deltas)
+    if created:
+        await db.execute(
+            delete(Thread).where((Thread.id == any_(_ids_param(created))) & (Thread.message_count == 0))
+        )
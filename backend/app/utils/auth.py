@@ -1,15 +1,19 @@
+import asyncio
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from ..config import get_settings
-from ..database import get_db
+from ..database import AsyncSessionLocal
 from ..models import User
+from .principal_cache import Principal, principal_cache
 
 settings = get_settings()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -21,6 +25,72 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+class PasswordHasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+    """
+    Runs bcrypt (~250 ms a call) on a dedicated thread pool so a login
+    burst never blocks the event loop. At most ``workers`` hashes run at
+    once; callers beyond that queue on the loop, where the depth is
+    visible, and are turned away past ``max_queue``.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 100):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = asyncio.Semaphore(workers)
+        self.queued = 0
+        self.running = 0
+        self.stats = Counter()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def _run(self, fn, *args):
+        if self.max_queue and self.queued >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise PasswordHasherBusy("Too many password checks queued")
+
+        queued_at = time.perf_counter()
+        self.queued += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.queued)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+        try:
+            self.running += 1
+            started = time.perf_counter()
+            self.stats["wait_ms"] += int((started - queued_at) * 1000)
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            self.stats["run_ms"] += int((time.perf_counter() - started) * 1000)
+            self.stats["calls"] += 1
+            return result
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def snapshot(self) -> dict:
+        calls = self.stats["calls"]
+        return {
+            "workers": self.workers,
+            "queued": self.queued,
+            "running": self.running,
+            "avg_wait_ms": round(self.stats["wait_ms"] / calls, 1) if calls else None,
+            "avg_run_ms": round(self.stats["run_ms"] / calls, 1) if calls else None,
+            **self.stats,
+        }
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -31,40 +101,50 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def resolve_token(token: str) -> Optional[Principal]:
+    """
+    Bearer token -> Principal, or None if it is invalid or the user is
+    gone. Cached by token subject, so most calls never touch the users
+    table.
+    """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
+        return None
+    email: str = payload.get("sub")
+    if email is None:
+        return None
+    
+    principal = await principal_cache.get(email)
+    if principal is not None:
+        return principal
     
-    result = await db.execute(select(User).where(User.email == email))
-    user = result.scalar_one_or_none()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalar_one_or_none()
     
     if user is None:
-        raise credentials_exception
+        return None
     
-    return user
+    principal = Principal.from_user(user)
+    await principal_cache.set(email, principal)
+    return principal
 
-async def get_current_user_ws(token: str):
-    """Get user from WebSocket token"""
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-        # For WebSocket, we'll just return a simple user object
-        # In production, query the database
-        return type('User', (), {'id': 1, 'email': email})()
-    except JWTError:
+async def get_current_user(
+    token: str = Depends(oauth2_scheme)
+) -> Principal:
+    """Resolve the bearer token to a Principal (see resolve_token)"""
+    principal = await resolve_token(token)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return principal
+
+async def get_current_user_ws(token: str) -> Optional[Principal]:
+    """Get user from WebSocket token (?token=); None if it is not valid"""
+    if not token:
         return None
+    return await resolve_token(token)
@@ -0,0 +1,40 @@
+"""
+ETag / If-None-Match helpers for conditional GETs.
+
+Tags are weak: they name a state of the mailbox (change seq, updated_at)
+plus the request parameters, not the exact bytes. Handlers compute the tag
+from one cheap lookup and answer 304 before running the real query.
+"""
+import hashlib
+
+from fastapi import Request, Response
+
+# Revalidate every time; never in a shared cache
+CACHE_CONTROL = "private, no-cache"
+
+# Bump when a response shape changes, so old tags stop matching
+REPRESENTATION = 1
+
+
+def make_etag(*parts) -> str:
+    raw = "|".join(str(part) for part in (REPRESENTATION, *parts))
+    return f'W/"{hashlib.sha1(raw.encode()).hexdigest()[:24]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match with weak comparison (RFC 9110 13.1.2)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in header.split(","))
+
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
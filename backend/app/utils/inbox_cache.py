@@ -0,0 +1,157 @@
+"""
+Read-through cache of GET /emails pages.
+
+Keys carry the user's mailbox version, a Redis counter that sync and the
+mutation endpoints bump after they commit (``bump``). A bump never
+deletes anything: old keys simply stop being asked for and age out, so
+invalidation is one INCR and a page can never be served across a change.
+
+Pages are kept in two layers: an in-process LRU bounded by total bytes,
+and Redis with a TTL (run Redis with ``maxmemory`` and
+``volatile-lru`` so its share stays bounded too). The version counters
+carry no TTL, so that policy never evicts them: a version that vanished
+and restarted could serve a page cached before the change. The version
+itself is always read from Redis, so every worker sees a bump at once; if
+Redis is unreachable the cache steps aside and requests go to Postgres.
+"""
+import hashlib
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class InboxCache:
+    def __init__(
+        self,
+        redis_url: Optional[str],
+        ttl: int = 60,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 512 * 1024,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+        self.stats = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self._redis is not None
+
+    async def version(self, user_id: int) -> Optional[int]:
+        """Current mailbox version, or None when the cache cannot be trusted"""
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(self._version_key(user_id))
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Inbox cache version read failed: {e}")
+            return None
+        return int(raw or 0)
+
+    async def bump(self, user_id: int):
+        """Call after committing any change to the user's emails"""
+        if self._redis is None:
+            return
+        self.stats["bumps"] += 1
+        try:
+            await self._redis.incr(self._version_key(user_id))
+        except Exception as e:
+            # Pages cached under the old version live out their TTL
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Inbox cache version bump failed: {e}")
+
+    async def get(self, user_id: int, version: int, params: dict) -> Optional[dict]:
+        """{"body": json text, "headers": {...}} or None"""
+        key = self._page_key(user_id, version, params)
+        entry = self._entries.get(key)
+        if entry is not None:
+            page, expires_at, _ = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return page
+            self._drop_local(key)
+
+        try:
+            raw = await self._redis.get(key)
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Inbox cache read failed: {e}")
+            raw = None
+        if raw:
+            page = json.loads(raw)
+            self._store_local(key, page, len(raw))
+            self.stats["redis_hits"] += 1
+            return page
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, user_id: int, version: int, params: dict, body: str, headers: dict):
+        raw = json.dumps({"body": body, "headers": headers})
+        if len(raw) > self.max_entry_bytes:
+            self.stats["too_large"] += 1
+            return
+        key = self._page_key(user_id, version, params)
+        self._store_local(key, {"body": body, "headers": headers}, len(raw))
+        self.stats["stores"] += 1
+        try:
+            await self._redis.set(key, raw, ex=self.ttl)
+        except Exception as e:
+            self.stats["redis_errors"] += 1
+            logger.warning(f"Inbox cache write failed: {e}")
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["redis_hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "hit_ratio": round((lookups - self.stats["misses"]) / lookups, 4) if lookups else None,
+            **self.stats,
+        }
+
+    def _store_local(self, key: str, page: dict, size: int):
+        if key in self._entries:
+            self._drop_local(key)
+        self._entries[key] = (page, time.monotonic() + self.ttl, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.stats["evictions"] += 1
+
+    def _drop_local(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    @staticmethod
+    def _version_key(user_id: int) -> str:
+        return f"inbox:version:{user_id}"
+
+    @staticmethod
+    def _page_key(user_id: int, version: int, params: dict) -> str:
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return f"inbox:page:{user_id}:{version}:{digest}"
+
+
+inbox_cache = InboxCache(
+    redis_url=settings.REDIS_URL if settings.INBOX_CACHE_ENABLED else None,
+    ttl=settings.INBOX_CACHE_TTL,
+    max_bytes=settings.INBOX_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.INBOX_CACHE_MAX_ENTRY_BYTES,
+)
@@ -0,0 +1,45 @@
+"""Opaque keyset cursors for the inbox and thread lists: (timestamp, id), newest first"""
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+from sqlalchemy import tuple_
+
+from ..models import Email
+
+
+def encode_cursor(received_at: datetime, email_id: int) -> str:
+    raw = json.dumps([received_at.isoformat() if received_at else None, email_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for anything that is not a cursor we issued"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        received_at, email_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(received_at), int(email_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def keyset_page(query, before: str = None, after: str = None, columns=None):
+    """
+    Order ``query`` newest first and position it after ``before`` (older
+    rows) or ``after`` (newer rows). The row comparison walks the
+    (user_id, received_at DESC, id DESC) index, so every page costs the
+    same as the first one. ``columns`` swaps in another (timestamp, id)
+    pair with the same kind of index, e.g. (Thread.latest_at, Thread.id).
+
+    With ``after`` the rows come back oldest first; the caller reverses them.
+    """
+    timestamp, id_ = columns or (Email.received_at, Email.id)
+    key = tuple_(timestamp, id_)
+    if after:
+        return query.where(key > tuple_(*decode_cursor(after))).order_by(
+            timestamp.asc(), id_.asc()
+        )
+    if before:
+        query = query.where(key < tuple_(*decode_cursor(before)))
+    return query.order_by(timestamp.desc(), id_.desc())
@@ -0,0 +1,118 @@
+"""
+JWT subject -> Principal cache, so authenticated requests skip the users
+lookup.
+
+Entries live in an in-process LRU with a short TTL. With
+PRINCIPAL_CACHE_REDIS on, a Redis layer (longer TTL) is shared by all
+workers; invalidate() clears both layers, and other workers' local copies
+expire within PRINCIPAL_CACHE_TTL.
+"""
+import json
+import logging
+import time
+from collections import Counter, OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from ..config import get_settings
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class Principal:
+    """What handlers need to know about the caller, without an ORM User"""
+    id: int
+    email: str
+    full_name: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(id=user.id, email=user.email, full_name=user.full_name)
+
+
+class PrincipalCache:
+    def __init__(self, ttl: int = 60, max_size: int = 10000, redis_url: Optional[str] = None, redis_ttl: int = 600):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.redis_ttl = redis_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+        self.stats = Counter()
+
+    async def get(self, subject: str) -> Optional[Principal]:
+        entry = self._entries.get(subject)
+        if entry is not None:
+            principal, expires_at = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(subject)
+                self.stats["hits"] += 1
+                return principal
+            del self._entries[subject]
+
+        if self._redis is not None:
+            try:
+                raw = await self._redis.get(self._key(subject))
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Principal cache Redis read failed: {e}")
+                raw = None
+            if raw:
+                principal = Principal(**json.loads(raw))
+                self._store_local(subject, principal)
+                self.stats["redis_hits"] += 1
+                return principal
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, subject: str, principal: Principal):
+        self._store_local(subject, principal)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self._key(subject), json.dumps(asdict(principal)), ex=self.redis_ttl)
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Principal cache Redis write failed: {e}")
+
+    async def invalidate(self, subject: str):
+        """Call whenever the user behind ``subject`` changes or is removed"""
+        self._entries.pop(subject, None)
+        self.stats["invalidations"] += 1
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self._key(subject))
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"Principal cache Redis delete failed: {e}")
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["redis_hits"] + self.stats["misses"]
+        return {
+            "size": len(self._entries),
+            "hit_ratio": round((lookups - self.stats["misses"]) / lookups, 4) if lookups else None,
+            **self.stats,
+        }
+
+    def _store_local(self, subject: str, principal: Principal):
+        self._entries[subject] = (principal, time.monotonic() + self.ttl)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    @staticmethod
+    def _key(subject: str) -> str:
+        return f"principal:{subject}"
+
+
+principal_cache = PrincipalCache(
+    ttl=settings.PRINCIPAL_CACHE_TTL,
+    max_size=settings.PRINCIPAL_CACHE_SIZE,
+    redis_url=settings.REDIS_URL if settings.PRINCIPAL_CACHE_REDIS else None,
+    redis_ttl=settings.PRINCIPAL_CACHE_REDIS_TTL,
+)
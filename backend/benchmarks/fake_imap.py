@@ -0,0 +1,251 @@
+"""
+Minimal in-process IMAP4rev1 server for benchmarks.
+
+Serves a synthetic INBOX over plain TCP and sleeps ``latency`` seconds
+before answering every command, which is enough to model a slow link to a
+real provider. Only the commands the sync code issues are implemented.
+"""
+import email
+import re
+import socketserver
+import threading
+import time
+from email.message import EmailMessage
+
+
+def make_message(
+    uid: int, sender_domain: str = "example.com", body_size: int = 2000, attachment_size: int = 0
+) -> bytes:
+    msg = EmailMessage()
+    msg["From"] = f"Sender {uid} <user{uid}@{sender_domain}>"
+    msg["To"] = "me@example.com"
+    msg["Subject"] = f"Message {uid}"
+    msg["Date"] = "Mon, 02 Jan 2006 15:04:05 +0000"
+    msg["Message-ID"] = f"<msg-{uid}@{sender_domain}>"
+    msg.set_content(("Lorem ipsum dolor sit amet. " * (body_size // 28 + 1))[:body_size])
+    if attachment_size:
+        msg.add_attachment(
+            bytes(i % 251 for i in range(attachment_size)),
+            maintype="application", subtype="octet-stream", filename="blob.bin",
+        )
+    return msg.as_bytes()
+
+
+def _q(value):
+    return "NIL" if value is None else '"' + str(value).replace('"', '\\"') + '"'
+
+
+def _bodystructure(part) -> str:
+    if part.is_multipart():
+        children = "".join(_bodystructure(child) for child in part.get_payload())
+        return f"({children} {_q(part.get_content_subtype())} NIL NIL NIL)"
+    params = " ".join(f"{_q(k)} {_q(v)}" for k, v in (part.get_params() or [])[1:]) or None
+    params = f"({params})" if params else "NIL"
+    payload = part.get_payload()
+    encoding = part.get("Content-Transfer-Encoding", "7bit")
+    disposition = part.get_content_disposition()
+    disposition = f"({_q(disposition)} NIL)" if disposition else "NIL"
+    fields = (
+        f"{_q(part.get_content_maintype())} {_q(part.get_content_subtype())} {params} "
+        f"NIL NIL {_q(encoding)} {len(payload.encode())}"
+    )
+    if part.get_content_maintype() == "text":
+        return f"({fields} {payload.count(chr(10))} NIL {disposition} NIL)"
+    return f"({fields} NIL {disposition} NIL)"
+
+
+def _section_payload(msg, section: str) -> bytes:
+    part = msg
+    for index in section.split("."):
+        if part.is_multipart():
+            part = part.get_payload()[int(index) - 1]
+    return part.get_payload().encode()
+
+
+class Mailbox:
+    def __init__(self, messages=None, uidvalidity: int = 1):
+        # uid -> raw RFC822 bytes, ascending
+        self.messages = dict(messages or {})
+        self.uidvalidity = uidvalidity
+
+    @classmethod
+    def generate(cls, count: int, domains=("example.com",), body_size: int = 2000):
+        return cls({
+            uid: make_message(uid, domains[uid % len(domains)], body_size)
+            for uid in range(1, count + 1)
+        })
+
+    @property
+    def uids(self):
+        return sorted(self.messages)
+
+    @property
+    def uidnext(self):
+        return (max(self.messages) + 1) if self.messages else 1
+
+
+def _expand_set(message_set: str, values):
+    """Resolve an IMAP sequence set against ascending ``values``"""
+    highest = values[-1] if values else 0
+    selected = set()
+    for part in message_set.split(","):
+        if ":" in part:
+            lo, hi = part.split(":")
+            lo = highest if lo == "*" else int(lo)
+            hi = highest if hi == "*" else int(hi)
+            lo, hi = min(lo, hi), max(lo, hi)
+            selected.update(v for v in values if lo <= v <= hi)
+        else:
+            v = highest if part == "*" else int(part)
+            if v in values:
+                selected.add(v)
+    return sorted(selected)
+
+
+def _from_header(raw: bytes) -> str:
+    for line in raw.split(b"\n\n", 1)[0].split(b"\n"):
+        if line.lower().startswith(b"from:"):
+            return line.decode(errors="ignore").lower()
+    return ""
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    # Buffer a whole response and flush once, like a real server would
+    wbufsize = 1 << 16
+
+    def send(self, line):
+        if isinstance(line, str):
+            line = line.encode()
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self.send("* OK fake IMAP4rev1 ready")
+        self.wfile.flush()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            time.sleep(self.server.latency)
+            self.server.commands += 1
+            tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+
+            if command == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1 IDLE UIDPLUS")
+            elif command == "LOGIN":
+                pass
+            elif command in ("SELECT", "EXAMINE"):
+                self.send(f"* {len(mailbox.messages)} EXISTS")
+                self.send(f"* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid")
+                self.send(f"* OK [UIDNEXT {mailbox.uidnext}] Predicted next UID")
+            elif command == "UID":
+                sub, _, args = args.partition(" ")
+                sub = sub.upper()
+                if sub == "SEARCH":
+                    self._search(args, mailbox)
+                elif sub == "FETCH":
+                    self._fetch(args, mailbox)
+                elif sub == "STORE":
+                    self.server.stores.append(args)
+            elif command == "SEARCH":
+                seqs = " ".join(str(i) for i in range(1, len(mailbox.messages) + 1))
+                self.send(f"* SEARCH {seqs}".rstrip())
+            elif command == "FETCH":
+                message_set, _, items = args.partition(" ")
+                uids = mailbox.uids
+                for seq in _expand_set(message_set, list(range(1, len(uids) + 1))):
+                    self._send_fetch(seq, uids[seq - 1], items, mailbox)
+            elif command == "IDLE":
+                self.send("+ idling")
+                self.wfile.flush()
+                self.server.idlers.add(self)
+                try:
+                    self.rfile.readline()  # DONE
+                finally:
+                    self.server.idlers.discard(self)
+            elif command == "LOGOUT":
+                self.send("* BYE logging out")
+                self.send(f"{tag} OK LOGOUT completed")
+                self.wfile.flush()
+                return
+            self.send(f"{tag} OK {command} completed")
+            self.wfile.flush()
+
+    def _search(self, args, mailbox):
+        match = re.search(r"UID (\S+)", args, re.I)
+        uids = _expand_set(match.group(1), mailbox.uids) if match else mailbox.uids
+        domains = [d.lower().lstrip("@") for d in re.findall(r'FROM "?([^"\s)]+)"?', args, re.I)]
+        if domains:
+            uids = [uid for uid in uids if any(d in _from_header(mailbox.messages[uid]) for d in domains)]
+        self.send(("* SEARCH " + " ".join(str(u) for u in uids)).rstrip())
+
+    def _fetch(self, args, mailbox):
+        message_set, _, items = args.partition(" ")
+        uids = mailbox.uids
+        for uid in _expand_set(message_set, uids):
+            self._send_fetch(uids.index(uid) + 1, uid, items, mailbox)
+
+    def _send_fetch(self, seq, uid, items, mailbox):
+        raw = mailbox.messages[uid]
+        items = items.upper()
+        partial = re.search(r"BODY\.PEEK\[([\d.]+)\]<(\d+)\.(\d+)>", items)
+        prefix = ""
+        if "BODYSTRUCTURE" in items:
+            prefix = f"BODYSTRUCTURE {_bodystructure(email.message_from_bytes(raw))} "
+        if partial:
+            section, origin, length = partial.group(1), int(partial.group(2)), int(partial.group(3))
+            payload = _section_payload(email.message_from_bytes(raw), section)[origin:origin + length]
+            section = f"BODY[{section}]<{origin}>"
+        elif "HEADER.FIELDS" in items:
+            header_block = raw.split(b"\n\n", 1)[0]
+            wanted = re.search(r"HEADER\.FIELDS \(([^)]*)\)", items).group(1).split()
+            lines = [
+                l for l in header_block.split(b"\n")
+                if l.split(b":", 1)[0].strip().upper().decode() in wanted
+            ]
+            payload = b"\r\n".join(l.rstrip(b"\r") for l in lines) + b"\r\n\r\n"
+            section = "BODY[HEADER.FIELDS (" + " ".join(wanted) + ")]"
+        else:
+            payload = raw
+            section = "RFC822"
+        self.server.bytes_sent += len(payload)
+        self.send(f"* {seq} FETCH (UID {uid} {prefix}{section} {{{len(payload)}}}".encode())
+        self.wfile.write(payload)
+        self.send(")")
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mailbox: Mailbox, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.mailbox = mailbox
+        self.latency = latency
+        self.commands = 0
+        self.bytes_sent = 0
+        self.idlers = set()
+        self.stores = []
+
+    def deliver(self, raw: bytes) -> int:
+        """Append a message and push EXISTS to IDLE-ing clients"""
+        uid = self.mailbox.uidnext
+        self.mailbox.messages[uid] = raw
+        for handler in list(self.idlers):
+            handler.send(f"* {len(self.mailbox.messages)} EXISTS")
+            handler.wfile.flush()
+        return uid
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
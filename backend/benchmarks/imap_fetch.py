@@ -0,0 +1,71 @@
+"""
+Per-message FETCH vs batched UID FETCH against a fake IMAP server with
+injected latency.
+
+    cd backend && python -m benchmarks.imap_fetch --messages 200 --latency 0.02
+"""
+import argparse
+import imaplib
+import time
+
+from app.services.email_service import IMAPWorker, parse_message
+from .fake_imap import FakeIMAPServer, Mailbox
+
+
+def connect(port):
+    worker = IMAPWorker("127.0.0.1", port, "bench", "bench")
+    worker.connection = imaplib.IMAP4("127.0.0.1", port)
+    worker.connection.login("bench", "bench")
+    worker.select_folder("INBOX")
+    return worker
+
+
+def fetch_one_by_one(worker, uids):
+    """The old loop: one FETCH round trip per message"""
+    messages = []
+    for uid in uids:
+        _, msg_data = worker.connection.uid("FETCH", str(uid), "(RFC822)")
+        messages.append(parse_message(msg_data[0][1], f"<generated-uid-{uid}@imported>"))
+    return messages
+
+
+def fetch_batched(worker, uids, batch_size):
+    return [email_data for _, email_data in worker.fetch_uids(uids, batch_size=batch_size)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds per command")
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    with FakeIMAPServer(Mailbox.generate(args.messages), latency=args.latency) as server:
+        worker = connect(server.port)
+        uids = worker.search_uids("ALL")
+
+        server.commands = 0
+        serial_time, serial = timed(fetch_one_by_one, worker, uids)
+        serial_commands = server.commands
+
+        server.commands = 0
+        batched_time, batched = timed(fetch_batched, worker, uids, args.batch_size)
+        batched_commands = server.commands
+        worker.logout()
+
+    assert [m["message_id"] for m in serial] == [m["message_id"] for m in batched]
+
+    print(f"{args.messages} messages, {args.latency * 1000:.0f} ms latency per command")
+    print(f"  one-by-one : {serial_time:7.3f}s  {serial_commands:4d} round trips")
+    print(f"  batched({args.batch_size:>3}): {batched_time:7.3f}s  {batched_commands:4d} round trips")
+    print(f"  speed-up   : {serial_time / batched_time:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
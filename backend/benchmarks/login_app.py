@@ -0,0 +1,75 @@
+"""
+Stand-in API for benchmarks.login_storm when no database is at hand.
+
+Serves the three endpoints the benchmark touches with the same auth code
+as app/main.py, but users and the inbox page live in memory. ``pool``
+verifies passwords through password_hasher, as /auth/login does now;
+``inline`` calls bcrypt on the event loop, as it did before.
+
+    cd backend && uvicorn benchmarks.login_app:pool --port 8101
+    cd backend && uvicorn benchmarks.login_app:inline --port 8102
+    python -m benchmarks.login_storm --url http://localhost:8101 \\
+        --email bench@example.com --password bench-password
+"""
+from typing import List
+
+from fastapi import Depends, FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.security import OAuth2PasswordRequestForm
+from jose import JWTError, jwt
+from pydantic import TypeAdapter
+
+from app.config import get_settings
+from app.schemas import EmailListItem
+from app.utils.auth import (
+    PasswordHasherBusy, create_access_token, get_password_hash, oauth2_scheme, password_hasher,
+    verify_password,
+)
+from benchmarks.serialization import make_rows
+
+settings = get_settings()
+
+EMAIL = "bench@example.com"
+PASSWORD = "bench-password"
+
+EMAIL_PAGE = TypeAdapter(List[EmailListItem])
+
+
+def build(mode: str) -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+    users = {EMAIL: get_password_hash(PASSWORD)}
+    page = EMAIL_PAGE.dump_json(EMAIL_PAGE.validate_python(make_rows(50), from_attributes=True))
+
+    async def current_email(token: str = Depends(oauth2_scheme)) -> str:
+        try:
+            return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])["sub"]
+        except (JWTError, KeyError):
+            raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    @app.post("/auth/login")
+    async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+        hashed = users.get(form_data.username)
+        try:
+            if mode == "pool":
+                valid = bool(hashed) and await password_hasher.verify(form_data.password, hashed)
+            else:
+                valid = bool(hashed) and verify_password(form_data.password, hashed)
+        except PasswordHasherBusy:
+            raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+        if not valid:
+            raise HTTPException(status_code=401, detail="Incorrect email or password")
+        return {"access_token": create_access_token(data={"sub": form_data.username}), "token_type": "bearer"}
+
+    @app.get("/emails")
+    async def emails(email: str = Depends(current_email)):
+        return Response(content=page, media_type="application/json")
+
+    @app.get("/metrics")
+    async def metrics(email: str = Depends(current_email)):
+        return {"password_hasher": password_hasher.snapshot() if mode == "pool" else None}
+
+    return app
+
+
+pool = build("pool")
+inline = build("inline")
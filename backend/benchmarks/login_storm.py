@@ -0,0 +1,94 @@
+"""
+Inbox latency during a login storm, against a running API.
+
+Measures GET /emails latency on its own, then again while ``--logins``
+concurrent clients hammer POST /auth/login. With bcrypt on the
+password pool the inbox p99 should barely move; with bcrypt inline on the
+event loop it climbs by hundreds of milliseconds per queued login.
+
+    cd backend && python -m benchmarks.login_storm --url http://localhost:8001 \\
+        --email you@example.com --password secret --seconds 20
+
+Without a database, run it against benchmarks.login_app instead.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def login(client, email, password) -> httpx.Response:
+    return await client.post("/auth/login", data={"username": email, "password": password})
+
+
+async def inbox_reader(client, token, stop, samples):
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/emails", headers=headers)
+        response.raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.05)
+
+
+async def login_storm(client, email, password, stop, counts):
+    while not stop.is_set():
+        response = await login(client, email, password)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def phase(client, token, seconds, storm=0, email=None, password=None):
+    stop = asyncio.Event()
+    samples, counts = [], {}
+    tasks = [asyncio.create_task(inbox_reader(client, token, stop, samples)) for _ in range(4)]
+    tasks += [
+        asyncio.create_task(login_storm(client, email, password, stop, counts))
+        for _ in range(storm)
+    ]
+    await asyncio.sleep(seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return samples, counts
+
+
+def report(label, samples, counts=None):
+    print(
+        f"{label:<14} n={len(samples):<5} p50={statistics.median(samples):7.1f} ms  "
+        f"p99={percentile(samples, 99):7.1f} ms  max={max(samples):7.1f} ms"
+        + (f"  logins={counts}" if counts else "")
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--logins", type=int, default=50, help="concurrent login clients")
+    parser.add_argument("--seconds", type=float, default=15)
+    args = parser.parse_args()
+
+    limits = httpx.Limits(max_connections=args.logins + 10)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        response = await login(client, args.email, args.password)
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+        samples, _ = await phase(client, token, args.seconds)
+        report("baseline", samples)
+        samples, counts = await phase(client, token, args.seconds, args.logins, args.email, args.password)
+        report("login storm", samples, counts)
+
+        metrics = await client.get("/metrics", headers={"Authorization": f"Bearer {token}"})
+        print("password_hasher:", metrics.json().get("password_hasher"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
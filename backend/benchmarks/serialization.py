@@ -0,0 +1,119 @@
+"""
+Requests/sec of a GET /emails-shaped endpoint, old vs new serialization.
+
+"before" is the old handler: a dict per row with .isoformat(), returned
+through FastAPI's jsonable_encoder and JSONResponse. "after" is what
+app/main.py does now: rows validated into EmailListItem and dumped once
+by pydantic-core. "response_model" returns the rows and lets FastAPI
+serialize them with ORJSONResponse, as the thread endpoints do. No
+database: rows are synthetic, so only serialization and framework cost
+are measured. Requests go through the ASGI app in process.
+
+    cd backend && python -m benchmarks.serialization --seconds 3
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+import httpx
+from fastapi import FastAPI, Response
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+from app.schemas import EmailListItem
+
+EMAIL_PAGE = TypeAdapter(List[EmailListItem])
+
+
+def make_rows(count: int):
+    now = datetime(2026, 10, 18, 12, 0, 0)
+    return [
+        SimpleNamespace(
+            id=100000 + i,
+            message_id=f"<{i}.{i * 7}@mail.example.com>",
+            from_address=f"Sender {i} <sender{i}@example.com>",
+            from_name=f"Sender {i}",
+            subject=f"Quarterly planning notes, part {i} of the series",
+            ai_summary=None,
+            ai_category="primary",
+            is_read=i % 3 == 0,
+            is_starred=i % 11 == 0,
+            received_at=now - timedelta(minutes=i),
+            preview="Hi team, attached are the notes from this morning's planning session. " * 2,
+            body_hash="ab" * 32,
+        )
+        for i in range(count)
+    ]
+
+
+def build_apps(rows):
+    before = FastAPI()
+
+    @before.get("/emails")
+    async def before_emails():
+        return [
+            {
+                "id": e.id,
+                "message_id": e.message_id,
+                "from_address": e.from_address,
+                "from_name": e.from_name,
+                "subject": e.subject,
+                "ai_summary": e.ai_summary,
+                "ai_category": e.ai_category,
+                "is_read": e.is_read,
+                "is_starred": e.is_starred,
+                "received_at": e.received_at.isoformat() if e.received_at else None,
+                "preview": e.preview or "",
+            }
+            for e in rows
+        ]
+
+    after = FastAPI(default_response_class=ORJSONResponse)
+
+    @after.get("/emails", response_model=List[EmailListItem])
+    async def after_emails():
+        body = EMAIL_PAGE.dump_json(EMAIL_PAGE.validate_python(rows, from_attributes=True))
+        return Response(content=body, media_type="application/json")
+
+    response_model = FastAPI(default_response_class=ORJSONResponse)
+
+    @response_model.get("/emails", response_model=List[EmailListItem])
+    async def model_emails():
+        return rows
+
+    return {"before": before, "after": after, "response_model": response_model}
+
+
+async def requests_per_second(app, seconds: float) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        (await client.get("/emails")).raise_for_status()
+        done = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            (await client.get("/emails")).raise_for_status()
+            done += 1
+    return done / seconds
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--rows", type=int, nargs="+", default=[50, 500])
+    args = parser.parse_args()
+
+    for count in args.rows:
+        apps = build_apps(make_rows(count))
+        results = {name: await requests_per_second(app, args.seconds) for name, app in apps.items()}
+        print(
+            f"{count:>4} rows  "
+            + "  ".join(f"{name}={rate:8.1f} req/s" for name, rate in results.items())
+            + f"  after/before={results['after'] / results['before']:.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,8 +8,10 @@ from email.utils import parsedate_to_datetime
 from datetime import datetime, timezone
 from sqlalchemy import select
 from app.database import get_db
-from app.models import EmailAccount, Email, User
-from app.services.email_service import decrypt_password
+from app.models import EmailAccount
+from app.services.email_service import decrypt_password, thread_references
+from app.services.ingest import bulk_insert_emails, email_row
+from app.utils.inbox_cache import inbox_cache
 
 
 async def sync_with_logging():
@@ -54,14 +56,6 @@ async def sync_with_logging():
                 print(f"Subject: {subject[:60]}")
                 print(f"Message-ID: {message_id}")
 
-                # Check if exists
-                existing = await db.execute(
-                    select(Email).where(Email.message_id == message_id)
-                )
-                if existing.scalar_one_or_none():
-                    print(f"❌ Already exists, skipping")
-                    continue
-
                 # Parse body
                 body = ""
                 if msg.is_multipart():
@@ -91,33 +85,27 @@ async def sync_with_logging():
                 
                 print(f"Date: {received_date}")
 
-                # Create email
-                from_name = from_addr.split('<')[0].strip() if '<' in from_addr else from_addr
-                
-                new_email = Email(
-                    user_id=2,
-                    message_id=message_id,
-                    from_address=from_addr,
-                    from_name=from_name,
-                    to_address="",
-                    subject=subject,
-                    body_text=body[:5000] or "[No content]",
-                    body_html="",
-                    received_at=received_date,
-                    is_read=False,
-                    ai_category="primary"
-                )
-                
-                db.add(new_email)
-                print(f"📝 Added to database")
-                
+                # Same row shape and insert path as the real sync
+                row = email_row(2, {
+                    'message_id': message_id,
+                    'from': from_addr,
+                    'subject': subject,
+                    'body': body[:5000] or "[No content]",
+                    'references': thread_references(msg),
+                }, received_date, account_id=account.id)
+
                 try:
+                    result = await bulk_insert_emails(db, [row])
                     await db.commit()
-                    print(f"✅ COMMITTED!")
                 except Exception as e:
                     print(f"❌ COMMIT FAILED: {e}")
                     await db.rollback()
                     raise
+                if result["inserted"]:
+                    await inbox_cache.bump(2)
+                    print(f"✅ COMMITTED!")
+                else:
+                    print(f"❌ Already exists, skipped")
 
             imap.close()
             imap.logout()
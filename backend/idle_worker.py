@@ -0,0 +1,27 @@
+"""Run the IMAP IDLE push listener (one long-running process)"""
+import asyncio
+import logging
+import signal
+
+from app.services.email_service import run_imap
+from app.services.idle_listener import idle_listener
+from app.services.imap_pool import imap_pool
+
+logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    # Syncs triggered here check out pooled sessions: keep them alive and
+    # close them on the way out, as the API process does
+    imap_pool.start()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        await idle_listener.run_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await run_imap(imap_pool.close)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+import httpx
+
+from app.database import AsyncSessionLocal
+from app.main import app
+from app.services.ingest import bulk_insert_emails, email_row
+from app.utils.auth import create_access_token
+from conftest import run
+
+AUTH = {"Authorization": f"Bearer {create_access_token(data={'sub': 'test@example.com'})}"}
+
+
+async def seed(user_id: int, count: int):
+    start = datetime(2026, 1, 1)
+    async with AsyncSessionLocal() as db:
+        await bulk_insert_emails(db, [
+            email_row(user_id, {
+                "message_id": f"<{n}@example.com>",
+                "from": f"s{n}@example.com",
+                "subject": f"Message {n}",
+                "body": f"Body {n}",
+            }, start + timedelta(minutes=n))
+            for n in range(count)
+        ])
+        await db.commit()
+
+
+async def call(*requests):
+    """Send (method, url, kwargs) requests in order through the app; returns the responses"""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return [await client.request(method, url, **kwargs) for method, url, kwargs in requests]
+
+
+def test_list_pages_with_cursors_and_etag(user):
+    run(seed(user, 5))
+    first, = run(call(("GET", "/emails?limit=3", {"headers": AUTH})))
+    assert first.status_code == 200
+    assert [e["subject"] for e in first.json()] == ["Message 4", "Message 3", "Message 2"]
+
+    cursor = first.headers["X-Next-Cursor"]
+    second, again = run(call(
+        ("GET", f"/emails?limit=3&before={cursor}", {"headers": AUTH}),
+        ("GET", "/emails?limit=3", {"headers": {**AUTH, "If-None-Match": first.headers["ETag"]}}),
+    ))
+    assert [e["subject"] for e in second.json()] == ["Message 1", "Message 0"]
+    assert "X-Next-Cursor" not in second.headers
+    assert again.status_code == 304
+
+
+def test_bulk_update_moves_counters(user):
+    run(seed(user, 4))
+    listed, = run(call(("GET", "/emails", {"headers": AUTH})))
+    ids = [e["id"] for e in listed.json()][:3]
+
+    bulk, repeat, counters, relisted = run(call(
+        ("POST", "/emails/bulk", {"headers": AUTH, "json": {"ids": ids, "changes": {"is_read": True}}}),
+        # Already read: nothing changes, counters stay put
+        ("POST", "/emails/bulk", {"headers": AUTH, "json": {"ids": ids, "changes": {"is_read": True}}}),
+        ("GET", "/emails/counters", {"headers": AUTH}),
+        ("GET", "/emails", {"headers": {**AUTH, "If-None-Match": listed.headers["ETag"]}}),
+    ))
+    assert bulk.json()["updated"] == 3
+    assert repeat.json()["updated"] == 0
+    primary = counters.json()["categories"]["primary"]
+    assert (primary["total"], primary["unread"]) == (4, 1)
+    # The change moved the mailbox's seq, so the old ETag no longer matches
+    assert relisted.status_code == 200
+
+
+def test_metrics_requires_auth(database):
+    anonymous, = run(call(("GET", "/metrics", {})))
+    assert anonymous.status_code == 401
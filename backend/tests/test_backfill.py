@@ -0,0 +1,60 @@
+from sqlalchemy import func, select, update
+
+from app.database import AsyncSessionLocal
+from app.models import Email, EmailAccount, SyncState
+from app.services import backfill
+from app.services.backfill import BackfillRunner, claim
+from conftest import run
+
+
+async def backfill_folder(account_id: int, runner: BackfillRunner, hold_claim: bool = False) -> dict:
+    """Start a backfill of INBOX and wait for this process's run to end"""
+    async with AsyncSessionLocal() as db:
+        account = await db.get(EmailAccount, account_id)
+        await runner.start(db, account)
+        task = runner._tasks[(account_id, 'INBOX')]
+        state = (await db.execute(select(SyncState).where(SyncState.account_id == account_id))).scalar_one()
+
+    if hold_claim:
+        # Another API worker already owns this folder
+        async with claim(state.id) as owned:
+            assert owned
+            await task
+    else:
+        await task
+
+    async with AsyncSessionLocal() as db:
+        state = await db.get(SyncState, state.id)
+        stored = await db.scalar(select(func.count()).select_from(Email))
+        return {"status": state.backfill_status, "done": state.backfill_done, "stored": stored}
+
+
+def test_backfill_walks_the_whole_folder(user, account):
+    runner = BackfillRunner(chunk=20, max_rate=0)
+    result = run(backfill_folder(account, runner))
+    assert result == {"status": "completed", "done": 50, "stored": 50}
+
+
+def test_backfill_claimed_elsewhere_is_left_alone(user, account, server):
+    runner = BackfillRunner(chunk=20, max_rate=0)
+    server.commands = 0
+    result = run(backfill_folder(account, runner, hold_claim=True))
+    assert result == {"status": "running", "done": 0, "stored": 0}
+    assert server.commands == 0
+
+
+def test_pause_from_another_process_stops_after_the_window(user, account, monkeypatch):
+    fetch_and_store = backfill.fetch_and_store
+
+    async def fetch_then_pause(db, *args, **kwargs):
+        stored = await fetch_and_store(db, *args, **kwargs)
+        # Another worker handles DELETE /backfill while this window is in flight
+        async with AsyncSessionLocal() as other:
+            await other.execute(update(SyncState).values(backfill_status="paused"))
+            await other.commit()
+        return stored
+
+    monkeypatch.setattr(backfill, "fetch_and_store", fetch_then_pause)
+    runner = BackfillRunner(chunk=20, max_rate=0)
+    result = run(backfill_folder(account, runner))
+    assert result == {"status": "paused", "done": 20, "stored": 20}
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app.database import AsyncSessionLocal
+from app.models import Email, EmailBody, MailboxCounter
+from app.services import ingest
+from app.services.bodies import body_record, store_bodies
+from app.services.ingest import bulk_insert_emails, copy_insert_emails, email_row
+from conftest import run
+
+
+def rows(user_id: int, numbers) -> list:
+    return [
+        email_row(user_id, {
+            "message_id": f"<{n}@example.com>",
+            "from": f"Sender {n} <s{n}@example.com>",
+            "subject": f"Invoice {n}",
+            "body": f"Body of message {n}",
+        }, datetime(2026, 1, 1, 12, n % 60))
+        for n in numbers
+    ]
+
+
+async def copy_merge(user_id: int):
+    async with AsyncSessionLocal() as db:
+        await bulk_insert_emails(db, rows(user_id, range(0, 5)))
+        await db.commit()
+
+        # 0..4 already stored, 7 twice in the batch
+        staged = rows(user_id, [3, 4, 5, 6, 7, 7])
+        await store_bodies(db, (body_record(row["body_text"]) for row in staged))
+        inserted = await copy_insert_emails(db, staged)
+        await db.commit()
+
+        searchable = await db.scalar(
+            select(func.count()).select_from(Email).where(Email.search_vector.op('@@')(func.to_tsquery('invoice')))
+        )
+        return inserted, searchable
+
+
+def test_copy_merge_skips_duplicates_and_returns_new_rows(user):
+    inserted, searchable = run(copy_merge(user))
+    assert sorted(row.message_id for row in inserted) == ["<5@example.com>", "<6@example.com>", "<7@example.com>"]
+    assert all(row.id and row.user_id == user and row.body_hash for row in inserted)
+    assert searchable == 8
+
+
+async def bulk_via_copy(user_id: int):
+    async with AsyncSessionLocal() as db:
+        await bulk_insert_emails(db, rows(user_id, range(0, 3)))
+        await db.commit()
+        result = await bulk_insert_emails(db, rows(user_id, range(0, 10)))
+        await db.commit()
+        counter = (await db.execute(select(MailboxCounter).where(MailboxCounter.user_id == user_id))).scalar_one()
+        bodies = await db.scalar(select(func.count()).select_from(EmailBody))
+        return result, counter, bodies
+
+
+def test_bulk_insert_over_threshold_takes_copy_path(user, monkeypatch):
+    copies = []
+
+    async def counting_copy(db, staged):
+        copies.append(len(staged))
+        return await copy_insert_emails(db, staged)
+
+    monkeypatch.setattr(ingest.settings, "INGEST_COPY_THRESHOLD", 5)
+    monkeypatch.setattr(ingest, "copy_insert_emails", counting_copy)
+    result, counter, bodies = run(bulk_via_copy(user))
+    assert copies == [10]
+    assert (len(result["inserted"]), result["skipped"]) == (7, 3)
+    assert (counter.total, counter.unread) == (10, 10)
+    assert bodies == 10
+
+
+def test_full_backfill_window_takes_copy_path():
+    assert ingest.settings.INGEST_COPY_THRESHOLD <= ingest.settings.BACKFILL_CHUNK
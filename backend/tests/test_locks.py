@@ -0,0 +1,46 @@
+import asyncio
+
+from app.services.locks import advisory_lock, run_as_leader
+from conftest import run
+
+
+async def contend():
+    async with advisory_lock(1, 2) as first:
+        async with advisory_lock(1, 2) as second:
+            taken_twice = second is not None
+    async with advisory_lock(1, 2) as again:
+        released = again is not None
+    return first is not None, taken_twice, released
+
+
+def test_advisory_lock_has_one_owner(database):
+    assert run(contend()) == (True, False, True)
+
+
+async def two_workers():
+    runs = {"a": 0, "b": 0}
+
+    def job(name):
+        async def count():
+            runs[name] += 1
+        return count
+
+    a = asyncio.create_task(run_as_leader(1, 3, 0.05, job("a"), "a"))
+    await asyncio.sleep(0.01)
+    b = asyncio.create_task(run_as_leader(1, 3, 0.05, job("b"), "b"))
+    await asyncio.sleep(0.5)
+    before = dict(runs)
+
+    # The leader stops (deploy, crash); the other takes over
+    a.cancel()
+    await asyncio.gather(a, return_exceptions=True)
+    await asyncio.sleep(0.5)
+    b.cancel()
+    await asyncio.gather(b, return_exceptions=True)
+    return before, runs
+
+
+def test_periodic_job_runs_in_one_process(database):
+    before, after = run(two_workers())
+    assert before["a"] > 0 and before["b"] == 0
+    assert after["b"] > 0
@@ -0,0 +1,76 @@
+from app.services.mime_parts import decode_part, find_text_part, iter_chunks, parse_fetch_response, section_value
+
+
+def test_literal_body_and_trailing_items():
+    # imaplib splits a literal into (prefix, payload) and the rest of the line
+    data = [
+        (b'1 (UID 5 BODY[1]<0> {11}', b'hello world'),
+        b' BODYSTRUCTURE ("text" "plain" ("charset" "utf-8") NIL NIL "7bit" 11 1))',
+    ]
+    [message] = parse_fetch_response(data)
+    assert message['UID'] == 5
+    assert section_value(message, 'BODY[1]') == b'hello world'
+    assert message['BODYSTRUCTURE'][:2] == ['text', 'plain']
+    assert message['BODYSTRUCTURE'][3] is None
+
+
+def test_literal_containing_parens_and_crlf():
+    payload = b'a (b) "c"\r\n) d'
+    data = [(b'2 (UID 9 BODY[1]<0> {%d}' % len(payload), payload), b')']
+    [message] = parse_fetch_response(data)
+    assert message['UID'] == 9
+    assert message['BODY[1]<0>'] == payload
+
+
+def test_quoted_strings_with_escapes():
+    data = [b'3 (UID 12 BODYSTRUCTURE ("text" "plain" ("name" "a \\"q\\" b\\\\") NIL NIL "base64" 40 2))']
+    [message] = parse_fetch_response(data)
+    params = message['BODYSTRUCTURE'][2]
+    assert params == ['name', 'a "q" b\\']
+
+
+def test_several_messages_in_one_response():
+    data = [
+        (b'1 (UID 5 BODY[1]<0> {3}', b'one'), b')',
+        (b'2 (UID 6 BODY[1]<0> {3}', b'two'), b')',
+    ]
+    messages = parse_fetch_response(data)
+    assert [(m['UID'], m['BODY[1]<0>']) for m in messages] == [(5, b'one'), (6, b'two')]
+
+
+def test_header_fields_section_is_one_key():
+    data = [(b'1 (UID 7 BODY[HEADER.FIELDS (FROM SUBJECT)] {11}', b'From: a\r\n\r\n'), b')']
+    [message] = parse_fetch_response(data)
+    assert section_value(message, 'BODY[HEADER.FIELDS') == b'From: a\r\n\r\n'
+
+
+def test_find_text_part_skips_html_and_attachments():
+    structure = [
+        ['text', 'html', ['charset', 'utf-8'], None, None, 'quoted-printable', 500, 10],
+        ['text', 'plain', ['charset', 'iso-8859-1'], None, None, 'base64', 200, 3, None,
+         ['attachment', ['filename', 'a.txt']]],
+        ['text', 'plain', ['charset', 'iso-8859-1'], None, None, 'base64', 120, 2],
+        'mixed',
+    ]
+    assert find_text_part(structure) == {
+        'section': '3', 'encoding': 'base64', 'charset': 'iso-8859-1', 'size': 120,
+    }
+
+
+def test_find_text_part_single_part_message():
+    structure = ['text', 'html', ['charset', 'utf-8'], None, None, '7bit', 42, 1]
+    assert find_text_part(structure)['section'] == '1'
+
+
+def test_base64_decodes_across_chunk_boundaries():
+    encoded = b'aGVs\r\nbG8g\r\nd29y\r\nbGQ='
+    assert decode_part(iter_chunks(encoded, 3), 'base64', 'utf-8', 100) == 'hello world'
+
+
+def test_quoted_printable_soft_break_across_chunks():
+    encoded = b'caf=C3=A9 au=\r\n lait\r\n'
+    assert decode_part(iter_chunks(encoded, 5), 'quoted-printable', 'utf-8', 100) == 'café au lait\r\n'
+
+
+def test_decode_part_stops_at_limit():
+    assert decode_part(iter_chunks(b'x' * 100, 10), '7bit', 'utf-8', 25) == 'x' * 25
@@ -0,0 +1,39 @@
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import Email, EmailAccount
+from app.services.mutations import bulk_update, write_back
+from app.services.sync_service import sync_account
+from conftest import run
+
+
+async def sync_and_mark_read(user_id: int, account_id: int):
+    """Sync the newest 20 (UIDs 31..50) and mark them read; returns the changed rows"""
+    async with AsyncSessionLocal() as db:
+        account = await db.get(EmailAccount, account_id)
+        await sync_account(db, account, user_id, limit=20)
+        await db.commit()
+        ids = (await db.execute(select(Email.id).where(Email.user_id == user_id))).scalars().all()
+        rows = await bulk_update(db, user_id, {"is_read": True}, ids=ids)
+        await db.commit()
+        return rows
+
+
+def test_sync_records_uidvalidity(user, account, server):
+    rows = run(sync_and_mark_read(user, account))
+    assert len(rows) == 20
+    assert {row.imap_uidvalidity for row in rows} == {server.mailbox.uidvalidity}
+
+
+def test_write_back_stores_flags(user, account, server):
+    rows = run(sync_and_mark_read(user, account))
+    run(write_back(user, rows, {"\\Seen": True}))
+    assert server.stores == ["31:50 +FLAGS.SILENT (\\Seen)"]
+
+
+def test_write_back_skips_rows_from_another_uidvalidity(user, account, server):
+    rows = run(sync_and_mark_read(user, account))
+    # The folder was recreated: UIDs 31..50 now name other messages
+    server.mailbox.uidvalidity += 1
+    run(write_back(user, rows, {"\\Seen": True}))
+    assert server.stores == []
@@ -0,0 +1,32 @@
+import base64
+from datetime import datetime
+
+import pytest
+
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    when = datetime(2026, 10, 18, 9, 30, 15, 123456)
+    cursor = encode_cursor(when, 98765)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (when, 98765)
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(datetime(2026, 1, 1), 2 ** 40)
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not-a-cursor",
+    "%%%%",
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    base64.urlsafe_b64encode(b'["2026-01-01T00:00:00"]').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", 5]').decode(),
+    base64.urlsafe_b64encode(b'["2026-01-01T00:00:00", "five"]').decode(),
+])
+def test_bad_cursors_raise_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,28 @@
+from app.services.ingest import make_preview
+
+
+def test_drops_quoted_reply():
+    body = "Sounds good, see you then.\n\nOn Tue, Oct 13, 2026 at 9:00 AM Ann <ann@example.com> wrote:\n> Lunch Friday?\n"
+    assert make_preview(body) == "Sounds good, see you then."
+
+
+def test_drops_forwarded_original():
+    body = "FYI below.\n\n-----Original Message-----\nFrom: Bob\nSubject: numbers\n"
+    assert make_preview(body) == "FYI below."
+
+
+def test_drops_inline_quote_lines_and_collapses_whitespace():
+    body = "> earlier point\nMy answer\t is   yes.\n  > another quote\n\nThanks!"
+    assert make_preview(body) == "My answer is yes. Thanks!"
+
+
+def test_quote_marker_at_start_is_kept():
+    # Nothing would be left if the whole body were cut
+    body = "From: someone@example.com\nforwarded text"
+    assert make_preview(body) == "From: someone@example.com forwarded text"
+
+
+def test_length_and_empty():
+    assert make_preview("word " * 100, length=20) == "word word word word "
+    assert make_preview("") == ""
+    assert make_preview(None) == ""
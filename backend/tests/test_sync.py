@@ -0,0 +1,88 @@
+from sqlalchemy import func, select
+
+from app.database import AsyncSessionLocal
+from app.models import Email, EmailAccount, SyncState
+from app.services import sync_service
+from app.services.email_service import uid_batches
+from app.services.sync_service import open_and_plan, sync_account
+from benchmarks.fake_imap import make_message
+from conftest import connect, run
+
+
+def test_incremental_plan_returns_every_new_uid(server):
+    worker = connect(server)
+    mailbox, uids, full_resync = open_and_plan(worker, 'INBOX', 10, 1, 20)
+    assert uids == list(range(11, 51))
+    assert not full_resync
+    assert mailbox['uidnext'] == 51
+    worker.logout()
+
+
+def test_first_sync_takes_newest_limit(server):
+    worker = connect(server)
+    _, uids, full_resync = open_and_plan(worker, 'INBOX', 0, None, 20)
+    assert uids == list(range(31, 51))
+    assert full_resync
+    worker.logout()
+
+
+def test_uidvalidity_change_restarts_from_newest(server):
+    worker = connect(server)
+    _, uids, full_resync = open_and_plan(worker, 'INBOX', 45, 99, 20)
+    assert uids == list(range(31, 51))
+    assert full_resync
+    worker.logout()
+
+
+def test_quiet_mailbox_skips_search(server):
+    worker = connect(server)
+    server.commands = 0
+    _, uids, _ = open_and_plan(worker, 'INBOX', 50, 1, 20)
+    assert uids == []
+    assert server.commands == 1  # SELECT only
+    worker.logout()
+
+
+async def sync(user_id: int, account_id: int, limit: int = 20) -> dict:
+    async with AsyncSessionLocal() as db:
+        account = await db.get(EmailAccount, account_id)
+        counts = await sync_account(db, account, user_id, limit=limit)
+        await db.commit()
+        state = (await db.execute(select(SyncState).where(SyncState.account_id == account_id))).scalar_one()
+        stored = await db.scalar(select(func.count()).select_from(Email).where(Email.user_id == user_id))
+        return {**counts, "last_uid": state.last_uid, "stored": stored}
+
+
+def test_sync_catches_up_on_more_than_limit(user, account, server):
+    first = run(sync(user, account))
+    assert (first["synced"], first["last_uid"], first["stored"]) == (20, 50, 20)
+
+    # 45 arrive between syncs, more than the limit of 20: none may be skipped
+    for _ in range(45):
+        server.deliver(make_message(server.mailbox.uidnext))
+    second = run(sync(user, account))
+    assert (second["synced"], second["last_uid"], second["stored"]) == (45, 95, 65)
+    assert not second["full_resync"]
+
+    third = run(sync(user, account))
+    assert (third["synced"], third["total_processed"], third["last_uid"]) == (0, 0, 95)
+
+
+def test_sync_fetches_in_batches(user, account, server, monkeypatch):
+    run(sync(user, account))
+    for _ in range(120):
+        server.deliver(make_message(server.mailbox.uidnext))
+    batches = []
+    monkeypatch.setattr(sync_service, "uid_batches", lambda uids: batches.append(len(uids)) or uid_batches(uids, 50))
+    result = run(sync(user, account))
+    assert result["synced"] == 120
+    assert batches == [120]
+
+
+def test_uidvalidity_reset_resyncs(user, account, server):
+    run(sync(user, account))
+    server.mailbox.uidvalidity = 2
+    result = run(sync(user, account))
+    assert result["full_resync"]
+    assert result["synced"] == 0  # same Message-IDs, already stored
+    assert result["last_uid"] == 50
@@ -0,0 +1,124 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy.sql import Insert, Select
+
+from app.services import threads
+from app.services.email_service import thread_references
+from app.services.threads import _UnionFind, _add_delta, _resolve_user, base_subject, normalize_message_id
+
+
+class FakeResult:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def all(self):
+        return self.rows
+
+    def scalars(self):
+        return iter(self.rows)
+
+
+class FakeSession:
+    """Answers the thread_refs lookup and the nextval() id allocation; records inserts"""
+
+    def __init__(self, refs=(), next_id=100):
+        self.refs = list(refs)
+        self.next_id = next_id
+        self.inserts = []
+
+    async def execute(self, stmt):
+        if isinstance(stmt, Insert):
+            self.inserts.append((stmt.table.name, stmt.compile().params))
+            return FakeResult()
+        assert isinstance(stmt, Select)
+        if "nextval" in str(stmt):
+            count = stmt.get_final_froms()[0].clauses.clauses[1].value
+            ids = list(range(self.next_id, self.next_id + count))
+            self.next_id += count
+            return FakeResult(ids)
+        return FakeResult(self.refs)
+
+
+def row(message_id, refs=(), subject="Hello"):
+    return {"user_id": 1, "message_id": message_id, "thread_refs": list(refs), "subject": subject}
+
+
+def resolve(session, rows, monkeypatch):
+    merges = []
+
+    async def fake_merge(db, user_id, plan):
+        merges.append(plan)
+
+    monkeypatch.setattr(threads, "_merge_threads", fake_merge)
+    created = asyncio.run(_resolve_user(session, 1, rows))
+    return created, merges
+
+
+def test_union_find_groups_transitively():
+    links = _UnionFind()
+    links.union("a", "b")
+    links.union("c", "d")
+    links.union("b", "d")
+    assert len({links.find(key) for key in "abcd"}) == 1
+    assert links.find("e") == "e"
+
+
+def test_subject_and_message_id_normalization():
+    assert base_subject("Re: Fwd: RE[2]: Budget") == "Budget"
+    assert base_subject("Sv: AW: Plan") == "Plan"
+    assert normalize_message_id(" <abc@host> ") == "<abc@host>"
+    assert normalize_message_id("no-brackets@host") == "no-brackets@host"
+
+
+def test_thread_references_appends_missing_in_reply_to():
+    headers = {'References': '<a@x> <b@x>', 'In-Reply-To': '<c@x>'}
+    assert thread_references(headers) == ['<a@x>', '<b@x>', '<c@x>']
+
+
+def test_thread_references_keeps_order_without_duplicates():
+    headers = {'References': '<a@x>\r\n <b@x>', 'In-Reply-To': 'Re: msg <b@x>'}
+    assert thread_references(headers) == ['<a@x>', '<b@x>']
+    assert thread_references({}) == []
+
+
+def test_new_batch_shares_one_new_thread(monkeypatch):
+    session = FakeSession()
+    rows = [row("<1@x>"), row("<2@x>", ["<1@x>"]), row("<3@x>", ["<1@x>", "<2@x>"]), row("<9@x>")]
+    created, merges = resolve(session, rows, monkeypatch)
+
+    assert created == [100, 101]
+    assert [r["thread_id"] for r in rows] == [100, 100, 100, 101]
+    assert merges == []
+
+
+def test_reply_joins_existing_thread(monkeypatch):
+    session = FakeSession(refs=[("<1@x>", 7)])
+    rows = [row("<2@x>", ["<1@x>"])]
+    created, merges = resolve(session, rows, monkeypatch)
+
+    assert created == []
+    assert rows[0]["thread_id"] == 7
+    assert merges == []
+
+
+def test_message_linking_two_threads_merges_into_oldest(monkeypatch):
+    # A reply quoting both parents arrives after they landed in separate threads
+    session = FakeSession(refs=[("<a@x>", 12), ("<b@x>", 5)])
+    rows = [row("<c@x>", ["<a@x>", "<b@x>"]), row("<d@x>", ["<a@x>"])]
+    created, merges = resolve(session, rows, monkeypatch)
+
+    assert created == []
+    assert [r["thread_id"] for r in rows] == [5, 5]
+    assert merges == [{5: [12]}]
+    refs = [params for table, params in session.inserts if table == "thread_refs"]
+    assert refs and all(value == 5 for key, value in refs[0].items() if key.startswith("thread_id"))
+
+
+def test_merge_deltas_add_counts_and_keep_latest():
+    deltas = {}
+    _add_delta(deltas, 5, 3, datetime(2026, 1, 1), 30)
+    _add_delta(deltas, 5, 2, datetime(2026, 3, 1), 41)
+    _add_delta(deltas, 5, 4, None, None)
+    _add_delta(deltas, 5, 1, datetime(2026, 2, 1), 35)
+    assert deltas == {5: {"added": 10, "p_latest_at": datetime(2026, 3, 1), "p_latest_email_id": 41}}
@@ -0,0 +1,34 @@
+from app.services.email_service import compress_uid_set, uid_batches
+
+
+def expand(message_set: str) -> list:
+    uids = []
+    for part in message_set.split(','):
+        lo, _, hi = part.partition(':')
+        uids.extend(range(int(lo), int(hi or lo) + 1))
+    return uids
+
+
+def test_ranges_with_gaps():
+    assert compress_uid_set([1, 2, 3, 7, 9, 10]) == '1:3,7,9:10'
+
+
+def test_unsorted_and_duplicate_uids():
+    assert compress_uid_set([10, 9, 3, 1, 2, 3, 7]) == '1:3,7,9:10'
+
+
+def test_single_and_empty():
+    assert compress_uid_set([42]) == '42'
+    assert compress_uid_set([]) == ''
+
+
+def test_no_gap_is_lost_or_invented():
+    uids = [1, 2, 4, 5, 6, 100, 101, 103, 1000]
+    assert expand(compress_uid_set(uids)) == uids
+
+
+def test_batches_cover_every_uid_once():
+    uids = [u for u in range(1, 400) if u % 7]
+    batches = list(uid_batches(reversed(uids), batch_size=50))
+    assert len(batches) == -(-len(uids) // 50)
+    assert [uid for batch in batches for uid in expand(batch)] == uids
@@ -31,6 +31,16 @@ export default function Sidebar({ activeView, onViewChange, onCompose, onSync }:
         headers: { Authorization: `Bearer ${token}` }
       });
       if (res.ok) {
+        // Sync runs in the background; poll the job until it finishes
+        let job = await res.json();
+        while (job.status === 'queued' || job.status === 'running') {
+          await new Promise((resolve) => setTimeout(resolve, 1000));
+          const statusRes = await fetch(`http://localhost:8001/emails/sync/${job.job_id}`, {
+            headers: { Authorization: `Bearer ${token}` }
+          });
+          if (!statusRes.ok) break;
+          job = await statusRes.json();
+        }
         onSync?.();
       }
     } catch (error) {